@@ -0,0 +1,16 @@
+"""
+Benchmarks for the API and the Lambda function.
+
+Run them from the repository root, e.g. ``python -m benchmarks.lambda_client``.
+They talk to local stand-ins instead of AWS and Open Library, so they need no
+credentials or network access.
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+for path in (ROOT / "src", ROOT / "lambda"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
@@ -0,0 +1,62 @@
+"""
+Per-request cost of authenticating a JWT on the read-only views.
+
+Compares JWTAuthentication, which loads the user from the database on every
+request, with ClaimsJWTAuthentication, which trusts the token's claims and
+checks the user's state against a short-lived cache. Needs DATABASE_URL, the
+user goes to a throwaway test database.
+
+    python -m benchmarks.auth [--iterations 2000]
+"""
+
+import argparse
+
+from . import common
+
+WARMUP = 5
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    common.setup_django()
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from reviews.authentication import ClaimsJWTAuthentication
+    from reviews.serializers import ClaimsTokenObtainPairSerializer
+
+    with common.test_database():
+        user = User.objects.create(username="benchmark")
+        token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+        request = Request(
+            APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        )
+
+        rows = {}
+        queries = {}
+        for name, authentication in (
+            ("JWTAuthentication", JWTAuthentication()),
+            ("ClaimsJWTAuthentication", ClaimsJWTAuthentication()),
+        ):
+            with CaptureQueriesContext(connection) as captured:
+                samples = common.measure(
+                    lambda: authentication.authenticate(request),
+                    args.iterations,
+                    warmup=WARMUP,
+                )
+            rows[name] = common.summarize(samples)
+            queries[name] = len(captured) / (args.iterations + WARMUP)
+
+    common.print_table(f"Authenticating {args.iterations} requests", rows)
+    for name, count in queries.items():
+        print(f"  {name:<28}{count:>8.2f} queries/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Latency of book info lookups on each backend, against a local Open Library.
+
+Compares invoking lambda_function on Lambda, stood in for by a local server
+running it that adds --lambda-latency of invocation overhead, with running it
+in-process on the local backend. Both must answer the same payloads, which is
+checked first. Cold starts of the Lambda and the TLS handshakes of the real
+endpoints come on top of these numbers.
+
+    python -m benchmarks.book_info_backends [--iterations 200] [--lambda-latency 0.02]
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import sys
+
+from . import common
+from .stubs import LambdaFunctionStub
+
+
+def measure(backend, events, iterations):
+    events = itertools.cycle(events)
+    return common.measure(lambda: backend.invoke(next(events)), iterations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=10, help="ISBNs per batch")
+    parser.add_argument(
+        "--lambda-latency",
+        type=float,
+        default=0.02,
+        help="Seconds of overhead per Lambda invocation",
+    )
+    parser.add_argument(
+        "--openlibrary-latency",
+        type=float,
+        default=0.005,
+        help="Seconds per Open Library response",
+    )
+    args = parser.parse_args()
+
+    common.setup_django()
+    from django.conf import settings
+    from openlibrary_stub import OpenLibraryStub, make_catalogue
+    from reviews.management.commands.seed_reviews import seed_isbn
+    from reviews.services import LambdaBackend, LambdaWrapper, LocalBackend
+
+    catalogue = make_catalogue(args.iterations, isbn=seed_isbn)
+    isbns = list(catalogue["editions"])
+    singles = [{"isbn": isbn} for isbn in isbns]
+    batches = [
+        {"isbns": isbns[i : i + args.batch]} for i in range(0, len(isbns), args.batch)
+    ]
+
+    with (
+        OpenLibraryStub(catalogue, latency=args.openlibrary_latency) as openlibrary,
+        LambdaFunctionStub(openlibrary.url, latency=args.lambda_latency) as stub,
+    ):
+        settings.LAMBDA_ENDPOINT_URL = stub.url
+        LambdaWrapper.reset()
+        # The local function reads it when it's loaded, like on Lambda.
+        os.environ["OPEN_LIBRARY_URL"] = openlibrary.url
+        backends = {
+            "lambda": LambdaBackend(),
+            "local": LocalBackend(settings.BOOK_INFO_FUNCTION_DIR),
+        }
+        # Both functions log their cache stats on every invocation.
+        logging.getLogger("lambda_function").setLevel(logging.WARNING)
+
+        missing = {"isbn": seed_isbn(args.iterations)}
+        for event in [singles[0], missing, batches[0]]:
+            payloads = [backend.invoke(event) for backend in backends.values()]
+            if payloads[0] != payloads[1]:
+                sys.exit(f"The backends answered {event} differently: {payloads}")
+
+        rows = {}
+        for name, backend in backends.items():
+            for label, events in (("single", singles), ("batch", batches)):
+                rows[f"{name}, {label}"] = common.summarize(
+                    measure(backend, events, args.iterations)
+                )
+        backends["local"].close()
+
+    common.print_table(
+        f"Book info lookups ({args.iterations} per row, batches of {args.batch}, "
+        f"{args.lambda_latency * 1000:g}ms Lambda overhead, "
+        f"{args.openlibrary_latency * 1000:g}ms upstream latency)",
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Concurrent request capacity of a single gunicorn worker on the book info path.
+
+Runs one sync worker serving core.wsgi, as production used to, and then one
+uvicorn worker serving core.asgi, against a Lambda stand-in that takes
+--latency seconds per invocation. Each worker gets --requests book info
+requests for distinct ISBNs, --concurrency at a time, so every one of them
+waits on the Lambda. Meanwhile a probe measures how long a cheap request to
+the reviews endpoint takes, which is what the rest of the API sees.
+
+Needs DATABASE_URL, the workers use a throwaway test database.
+
+    python -m benchmarks.book_info_load [--requests 200] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+from . import common
+from .stubs import LambdaStub
+
+WORKERS = (
+    ("sync worker (WSGI)", "sync"),
+    ("uvicorn worker (ASGI)", "uvicorn_worker.UvicornWorker"),
+)
+
+
+async def load(url, headers, isbns, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    probes = []
+    done = asyncio.Event()
+
+    async with aiohttp.ClientSession() as session:
+
+        async def book_info(isbn):
+            async with semaphore:
+                start = time.perf_counter()
+                params = {"isbn": isbn}
+                async with session.get(
+                    f"{url}/api/book-info/", params=params, headers=headers
+                ) as r:
+                    assert r.status == 200, await r.text()
+                latencies.append(time.perf_counter() - start)
+
+        async def probe():
+            # Unauthenticated, so it is answered without touching the database.
+            while not done.is_set():
+                start = time.perf_counter()
+                async with session.get(f"{url}/api/reviews/{isbns[0]}/") as r:
+                    await r.read()
+                probes.append(time.perf_counter() - start)
+                await asyncio.sleep(0.05)
+
+        start = time.perf_counter()
+        probing = asyncio.create_task(probe())
+        await asyncio.gather(*(book_info(isbn) for isbn in isbns))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probing
+
+    return len(isbns) / elapsed, latencies, probes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument(
+        "--latency", type=float, default=0.1, help="Seconds per Lambda invocation"
+    )
+    args = parser.parse_args()
+
+    common.setup_django()
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from reviews.management.commands.seed_reviews import seed_isbn
+    from reviews.serializers import ClaimsTokenObtainPairSerializer
+
+    isbns = [seed_isbn(i) for i in range(args.requests)]
+
+    with LambdaStub(latency=args.latency) as stub, common.test_database():
+        user = User.objects.create_user(username="benchmark")
+        token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+        headers = {"Authorization": f"Bearer {token}"}
+        database_url = common.test_database_url()
+        # The workers open connections of their own.
+        connection.close()
+
+        print(
+            f"{args.requests} book info requests, {args.concurrency} at a time, "
+            f"{args.latency * 1000:.0f}ms per Lambda invocation, 1 worker"
+        )
+        print(f"  {'':<24}{'req/s':>8}{'p50':>10}{'p95':>10}{'probe p95':>12}")
+        for name, worker_class in WORKERS:
+            with common.serve(
+                DATABASE_URL=database_url,
+                LAMBDA_ENDPOINT_URL=stub.url,
+                GUNICORN_WORKER_CLASS=worker_class,
+                WEB_CONCURRENCY="1",
+            ) as url:
+                throughput, latencies, probes = asyncio.run(
+                    load(url, headers, isbns, args.concurrency)
+                )
+            latency = common.summarize(latencies)
+            probe = common.summarize(probes)
+            print(
+                f"  {name:<24}{throughput:>8.1f}{latency['p50']:>8.0f}ms"
+                f"{latency['p95']:>8.0f}ms{probe['p95']:>10.0f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import contextlib
+import logging
+import os
+import socket
+import statistics
+import subprocess
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from . import ROOT
+
+
+def setup_django():
+    """Configures Django with settings suitable for running benchmarks locally."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    # Long enough for signing JWTs without warnings.
+    os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark-secret-key-for-hs256-tokens")
+    # botocore refuses to sign requests without credentials, even for stubs.
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    # Budgets of book info lookups large enough to never throttle the load.
+    for scope in ("USER", "IP", "UPSTREAM"):
+        os.environ.setdefault(f"BOOK_INFO_{scope}_BURST", "1000000")
+    # Scraped like the other endpoints, with the benchmark user's token.
+    os.environ.setdefault("METRICS_PUBLIC", "True")
+
+    import django
+
+    django.setup()
+    # Per-request info logs would drown the results, the stand-ins' too.
+    for name in ("reviews", "botocore", "aiohttp.access"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+@contextlib.contextmanager
+def test_database():
+    """
+    Runs the block against a throwaway database, created next to the one of
+    DATABASE_URL like the test runner does, and destroyed afterwards.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def test_database_url():
+    """
+    Returns DATABASE_URL pointing to the database Django is connected to, the
+    throwaway one inside ``test_database``, for servers started from it.
+    """
+    from django.db import connection
+
+    url = urlsplit(os.environ["DATABASE_URL"])
+    return urlunsplit(url._replace(path=f"/{connection.settings_dict['NAME']}"))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"The server on port {port} didn't start")
+
+
+@contextlib.contextmanager
+def serve(log=subprocess.DEVNULL, **env):
+    """
+    Runs the API with gunicorn.conf.py on a free local port, with the
+    environment variables ``env`` on top of the current ones, and returns its
+    URL. The server's output goes to the ``log`` file.
+    """
+    port = free_port()
+    env = {
+        **os.environ,
+        "DJANGO_ALLOWED_HOSTS": "127.0.0.1",
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        **env,
+    }
+    server = subprocess.Popen(
+        ["gunicorn", "--config", "gunicorn.conf.py", "--log-level", "warning"],
+        cwd=ROOT / "src",
+        env=env,
+        stdout=log,
+        stderr=log,
+    )
+    try:
+        wait_until_up(port)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def measure(fn, iterations, warmup=5):
+    """Calls ``fn`` repeatedly and returns the duration of each call in seconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Returns the mean and percentiles of ``samples``, in milliseconds."""
+    return {
+        "mean": statistics.fmean(samples) * 1000,
+        "p50": percentile(samples, 50) * 1000,
+        "p95": percentile(samples, 95) * 1000,
+        "p99": percentile(samples, 99) * 1000,
+    }
+
+
+def print_table(title, rows):
+    """Prints ``{name: summary}`` rows as produced by ``summarize``."""
+    print(title)
+    print(f"  {'':<28}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, summary in rows.items():
+        values = "".join(
+            f"{summary[key]:>8.2f}ms" for key in ("mean", "p50", "p95", "p99")
+        )
+        print(f"  {name:<28}{values}")
@@ -0,0 +1,55 @@
+"""
+Per-call overhead of invoking the book info Lambda.
+
+Compares building a fresh boto3 client (and the unused IAM resource) on every
+call, as get_book_info used to, with the process-wide pooled LambdaWrapper.
+
+    python -m benchmarks.lambda_client [--iterations 200]
+"""
+
+import argparse
+import json
+
+from . import common
+from .stubs import LambdaStub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    common.setup_django()
+    import boto3
+    from django.conf import settings
+    from reviews.services import LambdaWrapper
+
+    payload = json.dumps({"isbn": "9780141439587"})
+
+    with LambdaStub() as stub:
+        settings.LAMBDA_ENDPOINT_URL = stub.url
+
+        def fresh_client():
+            client = boto3.client("lambda", endpoint_url=stub.url)
+            boto3.resource("iam")
+            client.invoke(FunctionName=settings.LAMBDA_FUNCTION_NAME, Payload=payload)
+
+        def pooled_client():
+            LambdaWrapper.instance().invoke_function(
+                settings.LAMBDA_FUNCTION_NAME, {"isbn": "9780141439587"}
+            )
+
+        rows = {
+            "fresh client per call": common.summarize(
+                common.measure(fresh_client, args.iterations)
+            ),
+            "pooled LambdaWrapper": common.summarize(
+                common.measure(pooled_client, args.iterations)
+            ),
+        }
+
+    common.print_table(f"Lambda invoke overhead ({args.iterations} calls)", rows)
+
+
+if __name__ == "__main__":
+    main()
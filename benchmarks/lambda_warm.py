@@ -0,0 +1,70 @@
+"""
+Latency of warm Lambda invocations against a local Open Library stand-in.
+
+Compares a new event loop and aiohttp session per invocation, as the handler
+used to do, with the loop and session it now keeps across warm invocations.
+The stand-in speaks plain HTTP, so the TLS handshakes saved against the real
+openlibrary.org come on top of these numbers.
+
+    python -m benchmarks.lambda_warm [--iterations 200] [--latency 0.005]
+"""
+
+import argparse
+import asyncio
+import itertools
+
+import aiohttp
+
+from . import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="Seconds per upstream response"
+    )
+    args = parser.parse_args()
+
+    import lambda_function
+    from openlibrary_stub import OpenLibraryStub, make_catalogue
+
+    catalogue = make_catalogue(args.iterations)
+    events = itertools.cycle([{"isbn": isbn} for isbn in catalogue["editions"]])
+
+    async def cold_handler(event):
+        async with aiohttp.ClientSession() as session:
+            fetcher = lambda_function.Fetcher(session)
+            return await lambda_function.get_book(fetcher, event["isbn"])
+
+    # Both paths start with an empty author and work cache, so only connection
+    # reuse is measured.
+    def cold():
+        lambda_function.documents.clear()
+        assert asyncio.run(cold_handler(next(events)))["statusCode"] == 200
+
+    def warm():
+        lambda_function.documents.clear()
+        assert lambda_function.handler(next(events), None)["statusCode"] == 200
+
+    with OpenLibraryStub(catalogue, latency=args.latency) as stub:
+        lambda_function.OPEN_LIBRARY_URL = stub.url
+        rows = {
+            "new loop and session": common.summarize(
+                common.measure(cold, args.iterations)
+            ),
+            "warm loop and session": common.summarize(
+                common.measure(warm, args.iterations)
+            ),
+        }
+        lambda_function.get_loop().run_until_complete(lambda_function.reset_session())
+
+    common.print_table(
+        f"Lambda invocation latency ({args.iterations} invocations, "
+        f"{args.latency * 1000:g}ms upstream latency)",
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
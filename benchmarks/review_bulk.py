@@ -0,0 +1,71 @@
+"""
+Review ingestion throughput, in reviews per second.
+
+Compares one POST per review to the add review endpoint with the bulk endpoint,
+fed a JSON array and an NDJSON stream. Needs DATABASE_URL, the reviews go to a
+throwaway test database.
+
+    python -m benchmarks.review_bulk [--reviews 2000] [--books 100]
+"""
+
+import argparse
+import json
+import time
+
+from . import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reviews", type=int, default=2000)
+    parser.add_argument("--books", type=int, default=100)
+    args = parser.parse_args()
+
+    common.setup_django()
+    from django.contrib.auth.models import User
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from reviews.management.commands.seed_reviews import seed_isbn
+    from reviews.models import Book, Review
+
+    with common.test_database():
+        user = User.objects.create_user(username="benchmark", password="benchmark")
+        books = Book.objects.bulk_create(
+            Book(isbn=seed_isbn(i)) for i in range(args.books)
+        )
+        rows = [
+            {"isbn": books[i % len(books)].isbn, "title": "Review", "comment": "Text"}
+            for i in range(args.reviews)
+        ]
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        def single_posts():
+            for row in rows:
+                client.post(reverse("add_review"), row, format="json")
+
+        def bulk_json():
+            client.post(reverse("add_reviews_bulk"), rows, format="json")
+
+        def bulk_ndjson():
+            body = "\n".join(json.dumps(row) for row in rows)
+            client.post(
+                reverse("add_reviews_bulk"), body, content_type="application/x-ndjson"
+            )
+
+        print(f"Ingesting {args.reviews} reviews of {args.books} books")
+        for name, ingest in (
+            ("one POST per review", single_posts),
+            ("bulk, JSON array", bulk_json),
+            ("bulk, NDJSON", bulk_ndjson),
+        ):
+            Review.objects.all().delete()
+            start = time.perf_counter()
+            ingest()
+            elapsed = time.perf_counter() - start
+            assert Review.objects.count() == args.reviews
+            print(f"  {name:<28}{args.reviews / elapsed:>10.0f} reviews/s")
+
+
+if __name__ == "__main__":
+    main()
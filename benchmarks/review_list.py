@@ -0,0 +1,73 @@
+"""
+Serialization cost of a page of reviews.
+
+Compares the ReviewSerializer over model instances, as the reviews list used to
+render them, with the ReviewListSerializer over the rows of a values() query.
+No database is needed, the reviews are built in memory.
+
+    python -m benchmarks.review_list [--iterations 200] [--page-size 100]
+"""
+
+import argparse
+
+from . import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    common.setup_django()
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from reviews.models import Book, Review
+    from reviews.serializers import ReviewListSerializer, ReviewSerializer
+
+    book = Book(id=1, isbn="9780141439587")
+    users = [User(id=i, username=f"reviewer{i}") for i in range(10)]
+    now = timezone.now()
+    reviews = [
+        Review(
+            id=i,
+            book=book,
+            user=users[i % len(users)],
+            title=f"Review {i}",
+            comment="Text",
+            created_at=now,
+        )
+        for i in range(args.page_size)
+    ]
+    rows = [
+        {
+            "id": review.id,
+            "book__isbn": book.isbn,
+            "user__username": review.user.username,
+            "title": review.title,
+            "comment": review.comment,
+            "created_at": review.created_at,
+        }
+        for review in reviews
+    ]
+
+    rows_summary = {
+        "ReviewSerializer": common.summarize(
+            common.measure(
+                lambda: ReviewSerializer(reviews, many=True).data, args.iterations
+            )
+        ),
+        "ReviewListSerializer": common.summarize(
+            common.measure(
+                lambda: ReviewListSerializer(rows, many=True).data, args.iterations
+            )
+        ),
+    }
+
+    common.print_table(
+        f"Serializing {args.page_size} reviews ({args.iterations} pages)", rows_summary
+    )
+
+
+if __name__ == "__main__":
+    main()
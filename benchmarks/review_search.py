@@ -0,0 +1,75 @@
+"""
+Latency of searching reviews, with the full-text index and with icontains.
+
+Seeds a throwaway database with --reviews random reviews, and then fetches the
+first page of results for a word in many reviews, a rare word and a phrase,
+once through the search endpoint's query, ranked and served from the GIN
+index, and once filtering titles and comments with icontains, newest first.
+
+Needs DATABASE_URL. Seeding a few million reviews takes minutes.
+
+    python -m benchmarks.review_search [--reviews 2000000] [--iterations 20]
+"""
+
+import argparse
+
+from . import common
+
+SEARCHES = (
+    ("common word", "mystery", "mystery"),
+    ("rare word", "zeppelin", "zeppelin"),
+    ("phrase", '"dark journey"', "dark journey"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reviews", type=int, default=2_000_000)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=10)
+    args = parser.parse_args()
+
+    common.setup_django()
+    from django.core.management import call_command
+    from django.db.models import Q
+    from reviews.models import Review
+    from reviews.search import search_reviews
+    from reviews.serializers import ReviewSearchResultSerializer
+
+    with common.test_database():
+        call_command("seed_reviews", reviews=args.reviews, verbosity=0)
+
+        def full_text(text):
+            reviews = search_reviews(text).values(
+                *ReviewSearchResultSerializer.values_fields
+            )
+            return list(reviews[: args.page_size])
+
+        def icontains(text):
+            reviews = (
+                Review.objects.filter(
+                    Q(title__icontains=text) | Q(comment__icontains=text)
+                )
+                .order_by("-id")
+                .values("id", "title", "comment")
+            )
+            return list(reviews[: args.page_size])
+
+        rows = {}
+        for name, query, text in SEARCHES:
+            rows[f"{name}, full-text"] = common.summarize(
+                common.measure(lambda: full_text(query), args.iterations, warmup=2)
+            )
+            rows[f"{name}, icontains"] = common.summarize(
+                common.measure(lambda: icontains(text), args.iterations, warmup=2)
+            )
+
+    common.print_table(
+        f"First page of {args.page_size} results over {args.reviews} reviews "
+        f"({args.iterations} searches)",
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Startup costs of the API and the Lambda function.
+
+For the API, the time to import it, URLs and views included, and the time from
+starting gunicorn until it answers its first request, with the app imported in
+each worker or preloaded in the master, and then its first schema request,
+generated live or served from a file. For the Lambda function, the time to
+import lambda_function and until handler answers its first invocation, against
+a local Open Library, as in a cold Lambda container.
+
+    python -m benchmarks.startup [--runs 10]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from . import ROOT, common
+
+IMPORT_API = """
+import time
+start = time.perf_counter()
+import django
+django.setup()
+from importlib import import_module
+from django.conf import settings
+import_module(settings.ROOT_URLCONF)
+print(time.perf_counter() - start)
+"""
+
+START_LAMBDA = """
+import json, time
+start = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+assert lambda_function.handler({"isbn": %r}, None)["statusCode"] == 200
+print(json.dumps([imported - start, time.perf_counter() - start]))
+"""
+
+
+def run_python(code, cwd):
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def get(url, timeout=30):
+    """GETs ``url`` as soon as the server accepts connections."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                return response.read()
+        except (ConnectionError, urllib.error.URLError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.005)
+
+
+def start_api(**env):
+    """
+    Starts gunicorn with one worker and ``env``, and returns the seconds until
+    it answered its first request and then its first schema request.
+    """
+    port = common.free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "DJANGO_ALLOWED_HOSTS": "127.0.0.1",
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "WEB_CONCURRENCY": "1",
+        **env,
+    }
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        ["gunicorn", "--config", "gunicorn.conf.py", "--log-level", "warning"],
+        cwd=ROOT / "src",
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        # The Swagger UI, which goes through the URLs and views without
+        # generating the schema.
+        get(f"{url}/")
+        ready = time.perf_counter() - start
+        start = time.perf_counter()
+        get(f"{url}/api/schema/?format=json")
+        return ready, time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="Seconds per upstream response"
+    )
+    args = parser.parse_args()
+
+    common.setup_django()
+    from django.core.management import call_command
+    from openlibrary_stub import OpenLibraryStub, make_catalogue
+
+    samples = {}
+
+    def add(name, seconds):
+        samples.setdefault(name, []).append(seconds)
+
+    with tempfile.TemporaryDirectory() as directory:
+        schema_file = os.path.join(directory, "schema.json")
+        call_command(
+            "spectacular", format="openapi-json", file=schema_file, verbosity=0
+        )
+        # Labels of the startup and the schema request, and the environment.
+        configs = [
+            ("api ready", "api schema, generated", {}),
+            ("api ready", "api schema, from file", {"API_SCHEMA_FILE": schema_file}),
+            (
+                "api ready, preloaded",
+                "api schema, preloaded",
+                {"API_SCHEMA_FILE": schema_file, "GUNICORN_PRELOAD": "True"},
+            ),
+        ]
+        for _ in range(args.runs):
+            add("api import", run_python(IMPORT_API, ROOT / "src"))
+            for ready_label, schema_label, env in configs:
+                ready, schema = start_api(**env)
+                add(ready_label, ready)
+                add(schema_label, schema)
+
+    catalogue = make_catalogue(1)
+    isbn = next(iter(catalogue["editions"]))
+    with OpenLibraryStub(catalogue, latency=args.latency) as openlibrary:
+        os.environ["OPEN_LIBRARY_URL"] = openlibrary.url
+        for _ in range(args.runs):
+            imported, answered = run_python(START_LAMBDA % isbn, ROOT / "lambda")
+            add("lambda import", imported)
+            add("lambda first invocation", answered)
+
+    common.print_table(
+        f"Startup ({args.runs} runs, one worker, "
+        f"{args.latency * 1000:g}ms upstream latency)",
+        {name: common.summarize(seconds) for name, seconds in samples.items()},
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Local stand-ins for the upstream services the API talks to."""
+
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is expected here.
+        pass
+
+
+class _StubServer:
+    """Runs an HTTP server on a free local port in a background thread."""
+
+    handler_class = None
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(self.handler_class):
+            # Keep-alive, so clients that pool connections can reuse them.
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, Nagle's algorithm would
+            # hold the body back until the client acknowledges the headers.
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+        Handler.stub = stub
+        self.server = _QuietServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+
+class _LambdaHandler(BaseHTTPRequestHandler):
+    path_re = re.compile(r"^/2015-03-31/functions/(?P<name>[^/]+)/invocations$")
+
+    def do_POST(self):
+        self.stub.count_request()
+        length = int(self.headers.get("Content-Length", 0))
+        event = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path_re.match(self.path):
+            self._send(404, {"message": "Function not found"})
+            return
+        if self.stub.latency:
+            time.sleep(self.stub.latency)
+        self._send(200, self.stub.respond(event))
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def book_payload(isbn):
+    return {
+        "statusCode": 200,
+        "body": {
+            "title": f"Book {isbn}",
+            "author": "Stub Author",
+            "publish_date": "2020",
+            "description": "Served by the local Lambda stand-in.",
+        },
+    }
+
+
+class LambdaStub(_StubServer):
+    """
+    A stand-in for the Lambda invoke API.
+
+    Point a client at it with ``endpoint_url=stub.url``. Every invocation answers
+    with ``respond(event)``, which by default returns a found book.
+    """
+
+    handler_class = _LambdaHandler
+
+    def __init__(self, latency=0.0, respond=None):
+        super().__init__(latency)
+        self.respond = respond or (lambda event: book_payload(event.get("isbn")))
+
+
+class LambdaFunctionStub(LambdaStub):
+    """
+    A stand-in for the Lambda invoke API that runs lambda_function, against
+    the Open Library at ``openlibrary_url``, as the deployed function would.
+
+    Invocations run on an event loop thread of their own, the way a warm
+    container keeps its loop and session, and take ``latency`` seconds more
+    for the invocation overhead.
+    """
+
+    def __init__(self, openlibrary_url, latency=0.0):
+        super().__init__(latency, respond=self._invoke)
+        self.openlibrary_url = openlibrary_url
+
+    def __enter__(self):
+        import lambda_function
+
+        self._function = lambda_function
+        # It logs its cache stats on every invocation.
+        lambda_function.stats_logger.setLevel(logging.WARNING)
+        lambda_function.OPEN_LIBRARY_URL = self.openlibrary_url
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._loop_thread.start()
+        return super().__enter__()
+
+    def __exit__(self, *exc_info):
+        super().__exit__(*exc_info)
+        asyncio.run_coroutine_threadsafe(
+            self._function.reset_session(), self._loop
+        ).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join()
+        self._loop.close()
+
+    def _invoke(self, event):
+        return asyncio.run_coroutine_threadsafe(
+            self._function.async_handler(event, None), self._loop
+        ).result()
@@ -0,0 +1,433 @@
+"""
+Throughput, latency and queries of every endpoint of the API.
+
+Seeds a throwaway database with --reviews reviews of --books books, a few
+books getting most of them (--skew). Book info comes from lambda_function, run
+by the Lambda stand-in against the Open Library stand-in, each adding latency
+of its own.
+
+Every URL of core/urls.py has a scenario, which builds the requests made to
+it, mostly about popular books like real traffic. Each scenario first runs
+in-process to count the queries of its requests, and then against gunicorn,
+--concurrency requests at a time, to time them.
+
+--save writes the results to a baseline file. --check compares them to one,
+and fails when an endpoint's p95 latency grew by more than --tolerance, or
+when it makes more queries. Latencies depend on the machine, save the baseline
+on the one that checks against it.
+
+Needs DATABASE_URL.
+
+    python -m benchmarks.suite [--requests 100] [--save benchmarks/baseline.json]
+    python -m benchmarks.suite --check benchmarks/baseline.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+
+from . import common
+from .stubs import LambdaFunctionStub
+
+USERNAME = "benchmark"
+PASSWORD = "benchmark-password"
+
+SEARCHES = ("mystery", "zeppelin", '"dark journey"', "slow OR boring")
+
+
+class Context:
+    """What scenarios build their requests from."""
+
+    def __init__(self, books, skew, seed=0):
+        self.books = books
+        self.skew = skew
+        self.random = random.Random(seed)
+        self.counter = itertools.count()
+        self.refresh_token = None
+
+    def isbn(self):
+        """Returns the ISBN of a seeded book, popular books more often."""
+        from reviews.management.commands.seed_reviews import seed_isbn
+
+        return seed_isbn(int(self.random.random() ** self.skew * self.books))
+
+    def isbns(self, count):
+        return list(dict.fromkeys(self.isbn() for _ in range(count)))
+
+
+def url(name, **kwargs):
+    from django.urls import reverse
+
+    return reverse(name, kwargs=kwargs)
+
+
+# Scenarios by URL name, each returning the (method, path, body) of a request.
+# Reads come first, so they see the seeded data rather than what writes add.
+SCENARIOS = {
+    "schema": lambda ctx: ("GET", url("schema"), None),
+    "swagger-ui": lambda ctx: ("GET", url("swagger-ui"), None),
+    "metrics": lambda ctx: ("GET", url("metrics"), None),
+    "get_book_reviews": lambda ctx: (
+        "GET",
+        url("get_book_reviews", isbn=ctx.isbn()),
+        None,
+    ),
+    "search_reviews": lambda ctx: (
+        "GET",
+        f"{url('search_reviews')}?{urlencode({'q': ctx.random.choice(SEARCHES)})}",
+        None,
+    ),
+    "export_reviews": lambda ctx: (
+        "GET",
+        f"{url('export_reviews')}?isbn={ctx.isbn()}",
+        None,
+    ),
+    "get_book_info": lambda ctx: (
+        "GET",
+        f"{url('get_book_info')}?isbn={ctx.isbn()}",
+        None,
+    ),
+    "get_books_info": lambda ctx: (
+        "POST",
+        url("get_books_info"),
+        {"isbns": ctx.isbns(10)},
+    ),
+    "get_book_stats": lambda ctx: (
+        "GET",
+        url("get_book_stats", isbn=ctx.isbn()),
+        None,
+    ),
+    "get_books_stats": lambda ctx: (
+        "POST",
+        url("get_books_stats"),
+        {"isbns": ctx.isbns(50)},
+    ),
+    "get_trending_books": lambda ctx: ("GET", url("get_trending_books"), None),
+    "token_obtain_pair": lambda ctx: (
+        "POST",
+        url("token_obtain_pair"),
+        {"username": USERNAME, "password": PASSWORD},
+    ),
+    "token_refresh": lambda ctx: (
+        "POST",
+        url("token_refresh"),
+        {"refresh": ctx.refresh_token},
+    ),
+    "register": lambda ctx: (
+        "POST",
+        url("register"),
+        {
+            "username": f"benchmark-{next(ctx.counter)}",
+            "email": "benchmark@example.com",
+            "password": PASSWORD,
+        },
+    ),
+    "add_review": lambda ctx: (
+        "POST",
+        url("add_review"),
+        {"isbn": ctx.isbn(), "title": "Benchmark", "comment": "A good read"},
+    ),
+    "add_reviews_bulk": lambda ctx: (
+        "POST",
+        url("add_reviews_bulk"),
+        [
+            {"isbn": ctx.isbn(), "title": "Benchmark", "comment": "A good read"}
+            for _ in range(100)
+        ],
+    ),
+}
+
+
+def check_coverage():
+    """Fails unless every named URL of the API has a scenario."""
+    from django.urls import URLPattern, get_resolver
+
+    names = {
+        pattern.name
+        for pattern in get_resolver().url_patterns
+        # The admin is Django's, it's included rather than routed here.
+        if isinstance(pattern, URLPattern)
+    }
+    missing = names - SCENARIOS.keys()
+    if missing:
+        sys.exit(f"URLs without a benchmark scenario: {', '.join(sorted(missing))}")
+
+
+def count_queries(ctx, headers, samples):
+    """
+    Makes ``samples`` requests of each scenario in-process, and returns the
+    mean number of queries they made, by scenario.
+    """
+    from asgiref.sync import sync_to_async
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from reviews import services
+
+    # Book info lookups run on the request's thread here, so their queries are
+    # counted too.
+    async def run_blocking(fn, *args):
+        return await sync_to_async(fn)(*args)
+
+    services.run_blocking, original = run_blocking, services.run_blocking
+    client = Client(headers=headers)
+    queries = {}
+    try:
+        for name, scenario in SCENARIOS.items():
+            counts = []
+            for _ in range(samples):
+                method, path, body = scenario(ctx)
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.generic(
+                        method,
+                        path,
+                        json.dumps(body) if body is not None else "",
+                        content_type="application/json",
+                    )
+                    content = (
+                        b"".join(response.streaming_content)
+                        if response.streaming
+                        else response.content
+                    )
+                if response.status_code >= 400:
+                    sys.exit(f"{name}: {method} {path} failed, {content[:500]}")
+                counts.append(len(captured))
+            queries[name] = sum(counts) / len(counts)
+    finally:
+        services.run_blocking = original
+    return queries
+
+
+async def load_scenario(session, base_url, requests, concurrency):
+    """
+    Makes ``requests`` to the server at ``base_url``, ``concurrency`` at a time,
+    and returns their throughput and latencies.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = []
+
+    async def request(method, path, body):
+        async with semaphore:
+            start = time.perf_counter()
+            async with session.request(
+                method, f"{base_url}{path}", json=body
+            ) as response:
+                await response.read()
+            latencies.append(time.perf_counter() - start)
+            if response.status >= 400:
+                failures.append(f"{method} {path}: {response.status}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request(*spec) for spec in requests))
+    elapsed = time.perf_counter() - start
+    if failures:
+        raise RuntimeError(f"{len(failures)} requests failed, {failures[0]}")
+    return {"throughput": len(requests) / elapsed, **common.summarize(latencies)}
+
+
+async def load(base_url, ctx, headers, requests, concurrency):
+    """Loads the server at ``base_url`` with each scenario in turn."""
+    results = {}
+    # Gunicorn closes connections idle for 2s (its keepalive), reusing one it's
+    # closing fails the request.
+    connector = aiohttp.TCPConnector(keepalive_timeout=1)
+    async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
+        for name, scenario in SCENARIOS.items():
+            try:
+                # Every worker loads what an endpoint loads lazily before the
+                # timed requests.
+                warmup = [scenario(ctx) for _ in range(concurrency)]
+                await load_scenario(session, base_url, warmup, concurrency)
+                specs = [scenario(ctx) for _ in range(requests)]
+                results[name] = await load_scenario(
+                    session, base_url, specs, concurrency
+                )
+            except RuntimeError as e:
+                sys.exit(f"{name}: {e}")
+    return results
+
+
+def print_results(title, results):
+    print(title)
+    print(f"  {'':<20}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'queries':>9}")
+    for name, result in results.items():
+        print(
+            f"  {name:<20}{result['throughput']:>9.1f}"
+            + "".join(f"{result[key]:>8.1f}ms" for key in ("p50", "p95", "p99"))
+            + f"{result['queries']:>9.1f}"
+        )
+
+
+def regressions(results, baseline, tolerance):
+    """Describes how ``results`` are worse than ``baseline``."""
+    found = []
+    for name, base in baseline.items():
+        result = results.get(name)
+        if result is None:
+            found.append(f"{name}: no longer benchmarked")
+            continue
+        if result["p95"] > base["p95"] * (1 + tolerance):
+            found.append(
+                f"{name}: p95 went from {base['p95']:.1f}ms to {result['p95']:.1f}ms"
+            )
+        # Requests of a scenario vary a little, half a query on average doesn't.
+        if result["queries"] > base["queries"] + 0.5:
+            found.append(
+                f"{name}: queries per request went from {base['queries']:.1f} "
+                f"to {result['queries']:.1f}"
+            )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--reviews", type=int, default=100_000)
+    parser.add_argument("--skew", type=float, default=3.0)
+    parser.add_argument(
+        "--requests", type=int, default=100, help="Timed requests per scenario"
+    )
+    parser.add_argument(
+        "--query-samples",
+        type=int,
+        default=10,
+        help="Requests per scenario whose queries are counted",
+    )
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument(
+        "--lambda-latency",
+        type=float,
+        default=0.02,
+        help="Seconds of overhead per Lambda invocation",
+    )
+    parser.add_argument(
+        "--openlibrary-latency",
+        type=float,
+        default=0.05,
+        help="Seconds per Open Library response",
+    )
+    parser.add_argument("--save", metavar="PATH", help="Saves the results there")
+    parser.add_argument("--check", metavar="PATH", help="Compares to a baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="How much slower than the baseline p95 is still fine, 0.25 is 25%%",
+    )
+    args = parser.parse_args()
+
+    common.setup_django()
+    check_coverage()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection
+    from openlibrary_stub import OpenLibraryStub, make_catalogue
+    from reviews.management.commands.seed_reviews import seed_isbn
+    from reviews.serializers import ClaimsTokenObtainPairSerializer
+    from reviews.services import LambdaWrapper
+
+    # Everything that shapes the numbers, a baseline is only comparable to
+    # runs with the same.
+    conditions = {
+        key: getattr(args, key)
+        for key in (
+            "books",
+            "reviews",
+            "skew",
+            "requests",
+            "query_samples",
+            "concurrency",
+            "workers",
+            "lambda_latency",
+            "openlibrary_latency",
+        )
+    }
+    baseline = None
+    if args.check:
+        with open(args.check) as f:
+            saved = json.load(f)
+        if saved["conditions"] != conditions:
+            sys.exit(
+                f"The baseline was run with {saved['conditions']}, not {conditions}"
+            )
+        baseline = saved["endpoints"]
+
+    catalogue = make_catalogue(
+        args.books, authors=100, works=args.books // 2, isbn=seed_isbn
+    )
+    with (
+        OpenLibraryStub(catalogue, latency=args.openlibrary_latency) as openlibrary,
+        LambdaFunctionStub(openlibrary.url, latency=args.lambda_latency) as stub,
+        common.test_database(),
+    ):
+        call_command(
+            "seed_reviews",
+            books=args.books,
+            reviews=args.reviews,
+            skew=args.skew,
+            verbosity=0,
+        )
+        user = User.objects.create_user(username=USERNAME, password=PASSWORD)
+        token = ClaimsTokenObtainPairSerializer.get_token(user)
+        headers = {"Authorization": f"Bearer {token.access_token}"}
+        ctx = Context(args.books, args.skew)
+        ctx.refresh_token = str(token)
+
+        settings.LAMBDA_ENDPOINT_URL = stub.url
+        LambdaWrapper.reset()
+        queries = count_queries(ctx, headers, args.query_samples)
+
+        database_url = common.test_database_url()
+        # The workers open connections of their own.
+        connection.close()
+        with (
+            tempfile.NamedTemporaryFile(
+                "w", prefix="benchmark-server-", suffix=".log", delete=False
+            ) as log,
+            common.serve(
+                log,
+                DATABASE_URL=database_url,
+                LAMBDA_ENDPOINT_URL=stub.url,
+                WEB_CONCURRENCY=str(args.workers),
+            ) as base_url,
+        ):
+            print(f"The server logs to {log.name}")
+            results = asyncio.run(
+                load(base_url, ctx, headers, args.requests, args.concurrency)
+            )
+
+    for name, result in results.items():
+        result["queries"] = queries[name]
+    print_results(
+        f"{args.requests} requests per endpoint, {args.concurrency} at a time, "
+        f"{args.workers} workers, {args.reviews} reviews of {args.books} books",
+        results,
+    )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"conditions": conditions, "endpoints": results}, f, indent=2)
+            f.write("\n")
+    if baseline is not None:
+        found = regressions(results, baseline, args.tolerance)
+        if found:
+            print("Regressions:")
+            for regression in found:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,183 @@
 import asyncio
 from asyncio.log import logger
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import quote
 import aiohttp
 
+OPEN_LIBRARY_URL = os.environ.get("OPEN_LIBRARY_URL", "https://openlibrary.org")
+# Maximum number of requests in flight to Open Library per invocation.
+MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENCY", "10"))
+# How books are fetched, unless an invocation asks otherwise. "chain" requests
+# the edition, then its author and work. "bibkeys" gets the editions of all the
+# ISBNs with their author names in one request to the books API.
+FETCH_STRATEGIES = ("chain", "bibkeys")
+FETCH_STRATEGY = os.environ.get("FETCH_STRATEGY", "chain")
+# Connection settings of the session shared by warm invocations.
+LIMIT_PER_HOST = int(os.environ.get("LIMIT_PER_HOST", "20"))
+DNS_CACHE_TTL = int(os.environ.get("DNS_CACHE_TTL", "300"))
+KEEPALIVE_TIMEOUT = float(os.environ.get("KEEPALIVE_TIMEOUT", "30"))
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "10"))
+
+# Author names and work descriptions, shared by warm invocations. Set
+# DOCUMENT_CACHE_PATH to a file under /tmp to also keep them on disk.
+DOCUMENT_CACHE_SIZE = int(os.environ.get("DOCUMENT_CACHE_SIZE", "10000"))
+DOCUMENT_CACHE_TTL = int(os.environ.get("DOCUMENT_CACHE_TTL", "86400"))
+DOCUMENT_CACHE_PATH = os.environ.get("DOCUMENT_CACHE_PATH")
+
+stats_logger = logging.getLogger("lambda_function")
+stats_logger.setLevel(logging.INFO)
+
+
+class DocumentCache:
+    """
+    A bounded LRU cache whose entries expire ``ttl`` seconds after they were set.
+
+    Expiry uses wall clock time, so entries saved to ``path`` keep their age when
+    a new container loads them. The file is a log of entries, one JSON line each,
+    that saves append to, and rewrite once it holds twice as many as the cache.
+    """
+
+    def __init__(self, maxsize, ttl, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        # Keys set since the last save, and the number of lines in the file.
+        self._unsaved = {}
+        self._lines = 0
+        self._rewrite = False
+        if path:
+            self.load()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.time():
+            self._data.pop(key, None)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.time() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        self._unsaved[key] = None
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = 0
+        self._unsaved.clear()
+        self._rewrite = True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._data),
+        }
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        now = time.time()
+        for line in lines:
+            try:
+                key, expires_at, value = json.loads(line)
+            except (TypeError, ValueError):
+                # Cut short by a container stopped while appending to it.
+                continue
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+        for key, (expires_at, _) in list(self._data.items()):
+            if expires_at <= now:
+                del self._data[key]
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        self._lines = len(lines)
+
+    def save(self):
+        if not self.path or not (self._unsaved or self._rewrite):
+            return
+        try:
+            if self._rewrite or self._lines + len(self._unsaved) > 2 * self.maxsize:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as f:
+                    self._lines = self._write(f, self._data)
+                os.replace(tmp_path, self.path)
+            else:
+                with open(self.path, "a") as f:
+                    self._lines += self._write(f, self._unsaved)
+        except OSError:
+            logger.exception("Couldn't save the document cache to %s", self.path)
+            return
+        self._unsaved.clear()
+        self._rewrite = False
+
+    def _write(self, f, keys):
+        # Keys evicted since they were set are left out.
+        lines = [
+            json.dumps([key, *self._data[key]]) + "\n"
+            for key in keys
+            if key in self._data
+        ]
+        f.writelines(lines)
+        return len(lines)
+
+
+documents = DocumentCache(DOCUMENT_CACHE_SIZE, DOCUMENT_CACHE_TTL, DOCUMENT_CACHE_PATH)
+
+# The event loop and the session live at module scope, so warm invocations of
+# the container skip creating them, and reuse resolved DNS and open connections.
+_loop = None
+_session = None
+_session_loop = None
+
+
+def get_loop():
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop
+
+
+async def get_session():
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit_per_host=LIMIT_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        )
+        _session_loop = loop
+    return _session
+
+
+async def reset_session():
+    """Closes the shared session, so the next invocation starts from scratch."""
+    global _session
+    session, _session = _session, None
+    if session is not None and not session.closed:
+        await session.close()
+
 
 async def fetch_json(session, url):
     async with session.get(url) as response:
@@ -10,57 +186,169 @@ async def fetch_json(session, url):
         return None
 
 
-async def get_author_name(session, book_data):
-    author_key = book_data.get("authors", [{}])[0].get("key")
+class Fetcher:
+    """
+    Fetches JSON documents from Open Library for one invocation.
+
+    Limits the number of requests in flight, and fetches every URL only once, so
+    authors and works shared by several books of a batch are requested once.
+    """
+
+    def __init__(self, session, concurrency=None):
+        self.session = session
+        self.failed = False
+        self._semaphore = asyncio.Semaphore(concurrency or MAX_CONCURRENCY)
+        self._documents = {}
+
+    def get(self, path):
+        if path not in self._documents:
+            self._documents[path] = asyncio.ensure_future(self._fetch(path))
+        return self._documents[path]
+
+    async def _fetch(self, path):
+        url = f"{OPEN_LIBRARY_URL}{path}"
+        async with self._semaphore:
+            try:
+                try:
+                    return await fetch_json(self.session, url)
+                except aiohttp.ServerDisconnectedError:
+                    # Open Library may have closed a kept-alive connection while
+                    # the container was frozen, retry once on a new one.
+                    return await fetch_json(self.session, url)
+            except (aiohttp.ClientError, TimeoutError):
+                self.failed = True
+                raise
+
+
+async def get_author_name(fetcher, book_data):
+    author = book_data.get("authors", [{}])[0]
+    author_key = author.get("key")
     if not author_key:
         return "Unknown"
-    url = f"https://openlibrary.org{author_key}.json"
-    author_data = await fetch_json(session, url)
-    return author_data.get("name", "Unknown") if author_data else "Unknown"
+    # The books API already fills in author names.
+    if author.get("name"):
+        return author["name"]
+    name = documents.get(author_key)
+    if name is None:
+        author_data = await fetcher.get(f"{author_key}.json")
+        if not author_data:
+            return "Unknown"
+        name = author_data.get("name", "Unknown")
+        documents.set(author_key, name)
+    return name
 
 
-async def get_description(session, book_data):
+async def get_description(fetcher, book_data):
     work_key = book_data.get("works", [{}])[0].get("key")
     if not work_key:
         return "Unknown"
-    url = f"https://openlibrary.org{work_key}.json"
-    works_data = await fetch_json(session, url)
-    return works_data.get("description", "Unknown") if works_data else "Unknown"
+    description = documents.get(work_key)
+    if description is None:
+        works_data = await fetcher.get(f"{work_key}.json")
+        if not works_data:
+            return "Unknown"
+        description = works_data.get("description", "Unknown")
+        documents.set(work_key, description)
+    return description
+
+
+async def build_book_response(fetcher, book_data):
+    if not book_data:
+        return {"statusCode": 404, "body": {"error": "Book not found"}}
+
+    author_name, description = await asyncio.gather(
+        get_author_name(fetcher, book_data), get_description(fetcher, book_data)
+    )
+
+    book_info = {
+        "title": book_data.get("title", "Unknown"),
+        "author": author_name,
+        "publish_date": book_data.get("publish_date", "Unknown"),
+        "description": description,
+    }
+
+    return {
+        "statusCode": 200,
+        "body": book_info,
+    }
+
+
+async def get_book(fetcher, isbn):
+    """Fetches a book with the edition first, and then its author and work."""
+    try:
+        book_data = await fetcher.get(f"/isbn/{isbn}.json")
+        return await build_book_response(fetcher, book_data)
+    except Exception as e:
+        return {"statusCode": 500, "body": {"error": str(e)}}
+
+
+async def get_books_bibkeys(fetcher, isbns):
+    """
+    Fetches books with a single request to the books API, which returns the
+    edition records of all the ISBNs with their author names. Only descriptions,
+    which live on the works, need a request of their own.
+
+    Returns a dict of ISBN to response, like the batch body.
+    """
+
+    async def get_book_details(isbn):
+        try:
+            details = books.get(f"ISBN:{isbn}", {}).get("details")
+            return await build_book_response(fetcher, details)
+        except Exception as e:
+            return {"statusCode": 500, "body": {"error": str(e)}}
+
+    bibkeys = quote(",".join(f"ISBN:{isbn}" for isbn in isbns), safe=":,")
+    try:
+        books = await fetcher.get(
+            f"/api/books?bibkeys={bibkeys}&format=json&jscmd=details"
+        )
+    except Exception as e:
+        return dict.fromkeys(isbns, {"statusCode": 500, "body": {"error": str(e)}})
+    books = books or {}
+    results = await asyncio.gather(*(get_book_details(isbn) for isbn in isbns))
+    return dict(zip(isbns, results))
+
+
+async def get_books(fetcher, isbns, strategy):
+    if strategy == "bibkeys":
+        return await get_books_bibkeys(fetcher, isbns)
+    results = await asyncio.gather(*(get_book(fetcher, isbn) for isbn in isbns))
+    return dict(zip(isbns, results))
 
 
 async def async_handler(event, context):
     isbn = event.get("isbn")
-    if not isbn:
+    isbns = event.get("isbns")
+    if not isbn and not isbns:
         logger.error("ISBN is required")
         return {"statusCode": 400, "body": {"error": "ISBN is required"}}
+    if isbns is not None and not isinstance(isbns, list):
+        return {"statusCode": 400, "body": {"error": "isbns must be a list"}}
+    strategy = event.get("strategy") or FETCH_STRATEGY
+    if strategy not in FETCH_STRATEGIES:
+        return {"statusCode": 400, "body": {"error": f"Unknown strategy {strategy}"}}
 
+    fetcher = None
     try:
-        async with aiohttp.ClientSession() as session:
-            book_url = f"https://openlibrary.org/isbn/{isbn}.json"
-            book_data = await fetch_json(session, book_url)
-
-            if not book_data:
-                return {"statusCode": 404, "body": {"error": "Book not found"}}
+        fetcher = Fetcher(await get_session())
+        if isbns is None:
+            return (await get_books(fetcher, [isbn], strategy))[isbn]
 
-            author_name, description = await asyncio.gather(
-                get_author_name(session, book_data), get_description(session, book_data)
-            )
-
-            book_info = {
-                "title": book_data.get("title", "Unknown"),
-                "author": author_name,
-                "publish_date": book_data.get("publish_date", "Unknown"),
-                "description": description,
-            }
-
-            return {
-                "statusCode": 200,
-                "body": book_info,
-            }
+        # Every ISBN gets its own result, so one missing book doesn't fail the
+        # whole batch.
+        isbns = list(dict.fromkeys(isbns))
+        return {"statusCode": 200, "body": await get_books(fetcher, isbns, strategy)}
 
     except Exception as e:
         return {"statusCode": 500, "body": {"error": str(e)}}
 
+    finally:
+        if fetcher is None or fetcher.failed:
+            await reset_session()
+        documents.save()
+        stats_logger.info("Document cache: %s", json.dumps(documents.stats()))
+
 
 def handler(event, context):
-    return asyncio.run(async_handler(event, context))
+    return get_loop().run_until_complete(async_handler(event, context))
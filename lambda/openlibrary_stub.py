@@ -0,0 +1,123 @@
+"""
+A local stand-in for the parts of the Open Library API used by the Lambda.
+
+It serves books from an in-memory catalogue over plain HTTP, optionally adding
+latency to every response, and counts the requests it gets per path. It is used
+by the tests and the benchmarks, and is not deployed with the function.
+"""
+
+import asyncio
+import threading
+from collections import Counter
+
+from aiohttp import web
+
+
+def make_catalogue(count, authors=10, works=None, isbn=lambda i: f"978{i:010d}"):
+    """
+    Builds a catalogue of ``count`` books with 13 digit ISBNs, the ``isbn(i)`` of
+    the ``i``th book.
+
+    Books share ``authors`` authors and, when ``works`` is given, that many works,
+    the way editions and reprints do.
+    """
+    works = works or count
+    editions = {}
+    for i in range(count):
+        editions[isbn(i)] = {
+            "title": f"Book {i}",
+            "publish_date": str(1900 + i % 120),
+            "authors": [{"key": f"/authors/OL{i % authors}A"}],
+            "works": [{"key": f"/works/OL{i % works}W"}],
+            "key": f"/books/OL{i}M",
+        }
+    return {
+        "editions": editions,
+        "authors": {
+            f"/authors/OL{i}A": {"name": f"Author {i}"} for i in range(authors)
+        },
+        "works": {
+            f"/works/OL{i}W": {"description": f"Description of work {i}"}
+            for i in range(works)
+        },
+    }
+
+
+class OpenLibraryStub:
+    def __init__(self, catalogue, latency=0.0):
+        self.catalogue = catalogue
+        self.latency = latency
+        self.requests = Counter()
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    async def _delay(self, request):
+        self.requests[request.path] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def _edition(self, request):
+        await self._delay(request)
+        isbn = request.match_info["isbn"]
+        edition = self.catalogue["editions"].get(isbn)
+        if edition is None:
+            raise web.HTTPNotFound()
+        return web.json_response(edition)
+
+    async def _document(self, request):
+        await self._delay(request)
+        kind = request.match_info["kind"]
+        key = f"/{kind}/{request.match_info['id']}"
+        document = self.catalogue[kind].get(key)
+        if document is None:
+            raise web.HTTPNotFound()
+        return web.json_response(document)
+
+    async def _books(self, request):
+        # Only the parts of the books API the Lambda uses, jscmd=details returns
+        # the edition records with author names filled in.
+        await self._delay(request)
+        if request.query.get("jscmd") != "details":
+            raise web.HTTPBadRequest()
+        books = {}
+        for bibkey in request.query.get("bibkeys", "").split(","):
+            edition = self.catalogue["editions"].get(bibkey.removeprefix("ISBN:"))
+            if edition is None:
+                continue
+            authors = [
+                {**author, "name": self.catalogue["authors"][author["key"]]["name"]}
+                for author in edition["authors"]
+            ]
+            books[bibkey] = {
+                "bib_key": bibkey,
+                "info_url": f"{self.url}{edition['key']}",
+                "details": {**edition, "authors": authors},
+            }
+        return web.json_response(books)
+
+    def _app(self):
+        app = web.Application()
+        app.router.add_get("/api/books", self._books)
+        app.router.add_get("/isbn/{isbn}.json", self._edition)
+        app.router.add_get("/{kind:authors|works}/{id}.json", self._document)
+        return app
+
+    def __enter__(self):
+        self._loop = asyncio.new_event_loop()
+        self._runner = web.AppRunner(self._app())
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        host, port = site._server.sockets[0].getsockname()[:2]
+        self.url = f"http://{host}:{port}"
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,269 @@
+import pytest
+
+import lambda_function
+from openlibrary_stub import OpenLibraryStub, make_catalogue
+
+
+@pytest.fixture(autouse=True)
+def close_session():
+    yield
+    lambda_function.get_loop().run_until_complete(lambda_function.reset_session())
+
+
+@pytest.fixture(autouse=True)
+def clear_documents():
+    lambda_function.documents.clear()
+
+
+@pytest.fixture
+def open_library(monkeypatch):
+    with OpenLibraryStub(make_catalogue(20, authors=2, works=5)) as stub:
+        monkeypatch.setattr(lambda_function, "OPEN_LIBRARY_URL", stub.url)
+        yield stub
+
+
+class TestHandler:
+    def test_single_isbn(self, open_library):
+        response = lambda_function.handler({"isbn": "9780000000001"}, None)
+
+        assert response == {
+            "statusCode": 200,
+            "body": {
+                "title": "Book 1",
+                "author": "Author 1",
+                "publish_date": "1901",
+                "description": "Description of work 1",
+            },
+        }
+
+    def test_single_isbn_not_found(self, open_library):
+        response = lambda_function.handler({"isbn": "0000000000"}, None)
+
+        assert response == {"statusCode": 404, "body": {"error": "Book not found"}}
+
+    def test_isbn_required(self):
+        response = lambda_function.handler({}, None)
+
+        assert response["statusCode"] == 400
+
+    def test_batch(self, open_library):
+        isbns = [f"978{i:010d}" for i in range(10)] + ["0000000000"]
+
+        response = lambda_function.handler({"isbns": isbns}, None)
+
+        assert response["statusCode"] == 200
+        assert list(response["body"]) == isbns
+        assert response["body"]["9780000000003"]["body"]["author"] == "Author 1"
+        assert response["body"]["0000000000"]["statusCode"] == 404
+
+    def test_batch_fetches_shared_documents_once(self, open_library):
+        isbns = [f"978{i:010d}" for i in range(10)]
+
+        lambda_function.handler({"isbns": isbns}, None)
+
+        # 10 editions, but only 2 authors and 5 works between them.
+        assert open_library.total_requests == 10 + 2 + 5
+        assert max(open_library.requests.values()) == 1
+
+    def test_batch_bounds_concurrency(self, open_library, monkeypatch):
+        in_flight = []
+        fetch_json = lambda_function.fetch_json
+
+        async def tracking_fetch_json(session, url):
+            in_flight.append(1)
+            assert len(in_flight) <= 3
+            try:
+                return await fetch_json(session, url)
+            finally:
+                in_flight.pop()
+
+        monkeypatch.setattr(lambda_function, "MAX_CONCURRENCY", 3)
+        monkeypatch.setattr(lambda_function, "fetch_json", tracking_fetch_json)
+        open_library.latency = 0.01
+
+        response = lambda_function.handler(
+            {"isbns": [f"978{i:010d}" for i in range(20)]}, None
+        )
+
+        assert all(r["statusCode"] == 200 for r in response["body"].values())
+
+
+class TestWarmInvocations:
+    def test_reuses_loop_and_session(self, open_library):
+        lambda_function.handler({"isbn": "9780000000001"}, None)
+        loop, session = lambda_function._loop, lambda_function._session
+
+        lambda_function.handler({"isbn": "9780000000002"}, None)
+
+        assert lambda_function._loop is loop
+        assert lambda_function._session is session
+        assert not session.closed
+
+    def test_recreates_session_after_errors(self, open_library, monkeypatch):
+        lambda_function.handler({"isbn": "9780000000001"}, None)
+        session = lambda_function._session
+        # Nothing listens on port 9 (discard) locally.
+        monkeypatch.setattr(lambda_function, "OPEN_LIBRARY_URL", "http://127.0.0.1:9")
+
+        response = lambda_function.handler({"isbn": "9780000000001"}, None)
+
+        assert response["statusCode"] == 500
+        assert session.closed
+        assert lambda_function._session is None
+
+        monkeypatch.setattr(lambda_function, "OPEN_LIBRARY_URL", open_library.url)
+        response = lambda_function.handler({"isbn": "9780000000001"}, None)
+
+        assert response["statusCode"] == 200
+        assert lambda_function._session is not session
+
+    def test_recreates_closed_loop(self, open_library):
+        loop = lambda_function.get_loop()
+        loop.run_until_complete(lambda_function.reset_session())
+        loop.close()
+
+        response = lambda_function.handler({"isbn": "9780000000001"}, None)
+
+        assert response["statusCode"] == 200
+
+
+class TestDocumentCache:
+    def test_warm_invocations_reuse_authors_and_works(self, open_library):
+        lambda_function.handler({"isbn": "9780000000001"}, None)
+        lambda_function.handler({"isbn": "9780000000011"}, None)
+
+        # Both books share their author and work.
+        assert open_library.requests["/authors/OL1A.json"] == 1
+        assert open_library.requests["/works/OL1W.json"] == 1
+        assert lambda_function.documents.stats() == {
+            "hits": 2,
+            "misses": 2,
+            "hit_rate": 0.5,
+            "size": 2,
+        }
+
+    def test_evicts_least_recently_used(self):
+        documents = lambda_function.DocumentCache(maxsize=2, ttl=60)
+        documents.set("a", 1)
+        documents.set("b", 2)
+        documents.get("a")
+        documents.set("c", 3)
+
+        assert documents.get("a") == 1
+        assert documents.get("b") is None
+
+    def test_expires_entries(self, monkeypatch):
+        documents = lambda_function.DocumentCache(maxsize=2, ttl=60)
+        documents.set("a", 1)
+        now = lambda_function.time.time()
+        monkeypatch.setattr(lambda_function.time, "time", lambda: now + 61)
+
+        assert documents.get("a") is None
+
+    def test_persists_to_disk(self, tmp_path):
+        path = tmp_path / "documents.json"
+        documents = lambda_function.DocumentCache(maxsize=2, ttl=60, path=path)
+        documents.set("/authors/OL1A", "Author 1")
+        documents.save()
+
+        reloaded = lambda_function.DocumentCache(maxsize=2, ttl=60, path=path)
+
+        assert reloaded.get("/authors/OL1A") == "Author 1"
+
+    def test_saves_append_new_entries(self, tmp_path):
+        path = tmp_path / "documents.json"
+        documents = lambda_function.DocumentCache(maxsize=4, ttl=60, path=path)
+        documents.set("/authors/OL1A", "Author 1")
+        documents.save()
+        documents.set("/authors/OL2A", "Author 2")
+        documents.save()
+        documents.save()
+
+        assert len(path.read_text().splitlines()) == 2
+        reloaded = lambda_function.DocumentCache(maxsize=4, ttl=60, path=path)
+        assert reloaded.get("/authors/OL1A") == "Author 1"
+        assert reloaded.get("/authors/OL2A") == "Author 2"
+
+    def test_rewrites_file_twice_the_size_of_the_cache(self, tmp_path):
+        path = tmp_path / "documents.json"
+        documents = lambda_function.DocumentCache(maxsize=2, ttl=60, path=path)
+        for i in range(5):
+            documents.set("/authors/OL1A", f"Author {i}")
+            documents.save()
+
+        assert len(path.read_text().splitlines()) == 1
+        reloaded = lambda_function.DocumentCache(maxsize=2, ttl=60, path=path)
+        assert reloaded.get("/authors/OL1A") == "Author 4"
+
+    def test_ignores_truncated_lines(self, tmp_path):
+        path = tmp_path / "documents.json"
+        documents = lambda_function.DocumentCache(maxsize=2, ttl=60, path=path)
+        documents.set("/authors/OL1A", "Author 1")
+        documents.save()
+        with open(path, "a") as f:
+            f.write('["/authors/OL2A", ')
+
+        reloaded = lambda_function.DocumentCache(maxsize=2, ttl=60, path=path)
+
+        assert reloaded.get("/authors/OL1A") == "Author 1"
+        assert reloaded.get("/authors/OL2A") is None
+
+    def test_ignores_unreadable_file(self, tmp_path):
+        path = tmp_path / "documents.json"
+        path.write_text("not json")
+
+        documents = lambda_function.DocumentCache(maxsize=2, ttl=60, path=path)
+
+        assert documents.get("/authors/OL1A") is None
+
+
+class TestBibkeysStrategy:
+    def test_single_isbn(self, open_library):
+        event = {"isbn": "9780000000001"}
+
+        response = lambda_function.handler({**event, "strategy": "bibkeys"}, None)
+
+        assert response == lambda_function.handler(event, None)
+        assert response["statusCode"] == 200
+
+    def test_batch_matches_chain(self, open_library):
+        isbns = [f"978{i:010d}" for i in range(10)] + ["0000000000"]
+
+        bibkeys = lambda_function.handler({"isbns": isbns, "strategy": "bibkeys"}, None)
+        lambda_function.documents.clear()
+        chain = lambda_function.handler({"isbns": isbns, "strategy": "chain"}, None)
+
+        assert bibkeys == chain
+        assert bibkeys["body"]["0000000000"]["statusCode"] == 404
+
+    def test_batch_requests(self, open_library):
+        isbns = [f"978{i:010d}" for i in range(10)]
+
+        lambda_function.handler({"isbns": isbns, "strategy": "bibkeys"}, None)
+
+        # One books API request, and one per work for the descriptions. Author
+        # names come with the editions.
+        assert open_library.requests["/api/books"] == 1
+        assert open_library.total_requests == 1 + 5
+
+    def test_cached_descriptions_take_one_request(self, open_library):
+        lambda_function.handler({"isbn": "9780000000001"}, None)
+        before = open_library.total_requests
+
+        lambda_function.handler({"isbn": "9780000000011", "strategy": "bibkeys"}, None)
+
+        assert open_library.total_requests == before + 1
+
+    def test_default_strategy(self, open_library, monkeypatch):
+        monkeypatch.setattr(lambda_function, "FETCH_STRATEGY", "bibkeys")
+
+        lambda_function.handler({"isbn": "9780000000001"}, None)
+
+        assert open_library.requests["/api/books"] == 1
+
+    def test_unknown_strategy(self):
+        response = lambda_function.handler(
+            {"isbn": "9780000000001", "strategy": "other"}, None
+        )
+
+        assert response["statusCode"] == 400
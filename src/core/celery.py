@@ -0,0 +1,16 @@
+"""
+Celery app of the Celery workers, started with ``make worker``.
+
+Configured from the CELERY_* Django settings, and runs the tasks of the apps'
+tasks modules.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+
+app = Celery("core")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt",
     "drf_spectacular",
@@ -48,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the middleware.
+    "reviews.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -83,12 +86,27 @@ WSGI_APPLICATION = "core.wsgi.application"
 
 DATABASES = {
     "default": dj_database_url.config(
-        conn_max_age=600,
+        # Persistent connections leak under ASGI, where requests don't run on a
+        # thread of their own, so gunicorn.conf.py sets this to 0 for it.
+        conn_max_age=int(environ.get("DB_CONN_MAX_AGE", "600")),
         conn_health_checks=True,
     )
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Shared across workers when REDIS_URL is set, per process otherwise.
+
+if environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": environ["REDIS_URL"],
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -136,13 +154,25 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    # Adds the username and active flag, so read-only views can authenticate
+    # from the token alone.
+    "TOKEN_OBTAIN_SERIALIZER": "reviews.serializers.ClaimsTokenObtainPairSerializer",
 }
 
+# How long read-only views trust a user's active flag before checking it again,
+# in seconds. Deactivating a user takes this long to lock their tokens out.
+USER_STATE_CACHE_SIZE = int(environ.get("USER_STATE_CACHE_SIZE", "10000"))
+USER_STATE_CACHE_TTL = int(environ.get("USER_STATE_CACHE_TTL", "60"))
+
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "reviews.renderers.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
 }
@@ -155,6 +185,146 @@ SPECTACULAR_SETTINGS = {
     "SERVE_INCLUDE_SCHEMA": False,
 }
 
+# OpenAPI schema generated ahead of time (`manage.py spectacular --format
+# openapi-json --file <path>`), served instead of generating it in each worker
+# on its first schema request. Generated live when unset.
+API_SCHEMA_FILE = environ.get("API_SCHEMA_FILE")
+
+# How long book metadata fetched from Open Library is served without refreshing.
+# Stale rows are still served, but trigger a background refresh.
+BOOK_INFO_TTL = timedelta(hours=int(environ.get("BOOK_INFO_TTL_HOURS", "24")))
+
+# Maximum number of ISBNs accepted by the batch book info endpoint.
+BOOK_INFO_BATCH_MAX_SIZE = int(environ.get("BOOK_INFO_BATCH_MAX_SIZE", "50"))
+
+# Book info caching, in seconds. Each worker keeps a small LRU in front of the
+# shared cache, and a lock in the shared cache coalesces concurrent misses.
+BOOK_INFO_LRU_SIZE = int(environ.get("BOOK_INFO_LRU_SIZE", "1024"))
+BOOK_INFO_LRU_TTL = int(environ.get("BOOK_INFO_LRU_TTL", "60"))
+BOOK_INFO_CACHE_TTL = int(environ.get("BOOK_INFO_CACHE_TTL", "600"))
+BOOK_INFO_LOCK_TIMEOUT = int(environ.get("BOOK_INFO_LOCK_TIMEOUT", "10"))
+# ISBNs Open Library doesn't know are remembered per worker, so looking them up
+# again doesn't invoke the Lambda until they expire, in seconds.
+BOOK_INFO_NOT_FOUND_SIZE = int(environ.get("BOOK_INFO_NOT_FOUND_SIZE", "10000"))
+BOOK_INFO_NOT_FOUND_TTL = int(environ.get("BOOK_INFO_NOT_FOUND_TTL", "3600"))
+
+# Where the function that fetches book info from Open Library runs. "lambda"
+# invokes it on AWS Lambda. "local" runs lambda_function.py, from
+# BOOK_INFO_FUNCTION_DIR, in each worker, skipping the hop through Lambda. It's
+# configured by the same environment variables as on Lambda, e.g.
+# OPEN_LIBRARY_URL.
+BOOK_INFO_BACKEND = environ.get("BOOK_INFO_BACKEND", "lambda")
+BOOK_INFO_FUNCTION_DIR = environ.get(
+    "BOOK_INFO_FUNCTION_DIR", str(BASE_DIR.parent / "lambda")
+)
+
+# Lambda function that fetches book info from Open Library. The client is shared
+# by all threads of a worker, so the pool should be at least the thread count.
+LAMBDA_FUNCTION_NAME = environ.get("LAMBDA_FUNCTION_NAME", "scalestack-lambda")
+LAMBDA_ENDPOINT_URL = environ.get("LAMBDA_ENDPOINT_URL") or None
+LAMBDA_MAX_POOL_CONNECTIONS = int(environ.get("LAMBDA_MAX_POOL_CONNECTIONS", "32"))
+LAMBDA_CONNECT_TIMEOUT = float(environ.get("LAMBDA_CONNECT_TIMEOUT", "2"))
+LAMBDA_READ_TIMEOUT = float(environ.get("LAMBDA_READ_TIMEOUT", "10"))
+LAMBDA_MAX_ATTEMPTS = int(environ.get("LAMBDA_MAX_ATTEMPTS", "2"))
+# Threads the async book info views hand blocking lookups to, per worker. This
+# bounds the Lambda invocations in flight, so keep the Lambda pool as large.
+BOOK_INFO_ASYNC_THREADS = int(
+    environ.get("BOOK_INFO_ASYNC_THREADS", str(LAMBDA_MAX_POOL_CONNECTIONS))
+)
+# How the Lambda fetches from Open Library, "chain" or "bibkeys". Unset lets the
+# function use its own default.
+BOOK_INFO_FETCH_STRATEGY = environ.get("BOOK_INFO_FETCH_STRATEGY") or None
+# Book info requests stop waiting after BOOK_INFO_DEADLINE seconds and answer
+# 504, while the lookup carries on in the background and warms the caches.
+BOOK_INFO_DEADLINE = float(environ.get("BOOK_INFO_DEADLINE", "5"))
+# The Lambda circuit breaker opens after LAMBDA_BREAKER_FAILURES invocations in a
+# row failed or took longer than LAMBDA_BREAKER_SLOW_CALL seconds. Books that were
+# never fetched are then answered 503 without invoking the Lambda, and stored ones
+# are served as they are, until a trial invocation succeeds. Trials are let
+# through LAMBDA_BREAKER_RESET_TIMEOUT seconds after the breaker opened.
+LAMBDA_BREAKER_FAILURES = int(environ.get("LAMBDA_BREAKER_FAILURES", "5"))
+LAMBDA_BREAKER_SLOW_CALL = float(
+    environ.get("LAMBDA_BREAKER_SLOW_CALL", str(BOOK_INFO_DEADLINE))
+)
+LAMBDA_BREAKER_RESET_TIMEOUT = float(
+    environ.get("LAMBDA_BREAKER_RESET_TIMEOUT", "30")
+)
+# Budgets of book info lookups that invoke the Lambda, as token buckets that get
+# BOOK_INFO_<SCOPE>_RATE tokens back per second and hold up to
+# BOOK_INFO_<SCOPE>_BURST: per user, per IP, and for every lookup. Lookups served
+# from the caches or the database are free, and requests over budget are
+# answered 429, like the books of a batch the budgets have no tokens left for.
+BOOK_INFO_USER_RATE = float(environ.get("BOOK_INFO_USER_RATE", "0.5"))
+BOOK_INFO_USER_BURST = int(environ.get("BOOK_INFO_USER_BURST", "20"))
+BOOK_INFO_IP_RATE = float(environ.get("BOOK_INFO_IP_RATE", "1"))
+BOOK_INFO_IP_BURST = int(environ.get("BOOK_INFO_IP_BURST", "40"))
+BOOK_INFO_UPSTREAM_RATE = float(environ.get("BOOK_INFO_UPSTREAM_RATE", "10"))
+BOOK_INFO_UPSTREAM_BURST = int(environ.get("BOOK_INFO_UPSTREAM_BURST", "50"))
+
+# Background prefetches of book info, queued when reviews are added to books
+# that were never fetched and when stale books are read. "thread" runs them on
+# threads of each worker, "celery" sends them to the Celery workers. At most
+# BOOK_INFO_PREFETCH_CONCURRENCY run at once per worker, and another prefetch of
+# a book isn't queued for BOOK_INFO_PREFETCH_TIMEOUT seconds while one is pending.
+BOOK_INFO_PREFETCH_BACKEND = environ.get("BOOK_INFO_PREFETCH_BACKEND", "thread")
+BOOK_INFO_PREFETCH_CONCURRENCY = int(
+    environ.get("BOOK_INFO_PREFETCH_CONCURRENCY", "4")
+)
+BOOK_INFO_PREFETCH_TIMEOUT = int(environ.get("BOOK_INFO_PREFETCH_TIMEOUT", "60"))
+
+# Celery workers, which run the prefetches with the "celery" backend.
+CELERY_BROKER_URL = environ.get("CELERY_BROKER_URL") or environ.get("REDIS_URL")
+CELERY_WORKER_CONCURRENCY = BOOK_INFO_PREFETCH_CONCURRENCY
+CELERY_TASK_IGNORE_RESULT = True
+
+# Bulk review ingestion. Requests take up to REVIEW_BULK_MAX_SIZE reviews, which
+# are validated and inserted in transactions of REVIEW_BULK_CHUNK_SIZE reviews.
+REVIEW_BULK_MAX_SIZE = int(environ.get("REVIEW_BULK_MAX_SIZE", "10000"))
+REVIEW_BULK_CHUNK_SIZE = int(environ.get("REVIEW_BULK_CHUNK_SIZE", "500"))
+
+# Rows fetched per round trip of the server-side cursor of review exports.
+REVIEW_EXPORT_CHUNK_SIZE = int(environ.get("REVIEW_EXPORT_CHUNK_SIZE", "2000"))
+
+# Days of daily review counts kept on each book's stats, the longest window the
+# recent activity counters cover.
+BOOK_STATS_ACTIVITY_DAYS = int(environ.get("BOOK_STATS_ACTIVITY_DAYS", "30"))
+
+# Trending books, the TRENDING_SIZE books most reviewed in the last
+# TRENDING_WINDOW_HOURS hours. Reviews are counted per book in buckets of
+# TRENDING_BUCKET_MINUTES as they're added, and the window slides a bucket at a
+# time. The leaderboard is added up from the buckets at most every
+# TRENDING_CACHE_TTL seconds, and compact_review_counts drops the buckets that
+# left the window, which Celery beat runs every TRENDING_COMPACT_INTERVAL seconds.
+TRENDING_WINDOW = timedelta(hours=int(environ.get("TRENDING_WINDOW_HOURS", "168")))
+TRENDING_BUCKET = timedelta(minutes=int(environ.get("TRENDING_BUCKET_MINUTES", "60")))
+TRENDING_SIZE = int(environ.get("TRENDING_SIZE", "10"))
+TRENDING_CACHE_TTL = int(environ.get("TRENDING_CACHE_TTL", "60"))
+TRENDING_COMPACT_INTERVAL = int(environ.get("TRENDING_COMPACT_INTERVAL", "3600"))
+CELERY_BEAT_SCHEDULE = {
+    "compact-review-counts": {
+        "task": "reviews.tasks.compact_review_counts",
+        "schedule": TRENDING_COMPACT_INTERVAL,
+    },
+}
+
+# Review listings are cached per book version, in seconds. Versions are
+# published to the cache as reviews change, so they can be kept long, and
+# pages of an outdated version are never served. Only a shared cache sees the
+# versions every worker publishes, so without REDIS_URL they're read from the
+# database instead, unless BOOK_VERSION_CACHE_TTL says otherwise.
+BOOK_VERSION_CACHE_TTL = int(
+    environ.get("BOOK_VERSION_CACHE_TTL", "3600" if environ.get("REDIS_URL") else "0")
+)
+REVIEW_PAGE_CACHE_TTL = int(environ.get("REVIEW_PAGE_CACHE_TTL", "300"))
+
+# Request metrics, served at /metrics. Worker processes share them through files
+# in PROMETHEUS_MULTIPROC_DIR, which gunicorn.conf.py sets. Scrapers must send
+# METRICS_TOKEN as a bearer token, and without one /metrics is forbidden, unless
+# METRICS_PUBLIC=True opens it to anyone who can reach the API.
+PROMETHEUS_MULTIPROC_DIR = environ.get("PROMETHEUS_MULTIPROC_DIR") or None
+METRICS_TOKEN = environ.get("METRICS_TOKEN") or None
+METRICS_PUBLIC = environ.get("METRICS_PUBLIC") == "True"
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -5,16 +5,22 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from reviews.views import (
     RegisterView,
     AddReviewView,
+    AddReviewsBulkView,
+    ExportReviewsView,
+    SearchReviewsView,
     GetBookReviewsView,
     GetBookInformationView,
+    GetBooksInformationView,
+    GetBookStatsView,
+    GetBooksStatsView,
+    GetTrendingBooksView,
+    SchemaView,
 )
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
+from drf_spectacular.views import SpectacularSwaggerView
+from reviews.metrics import metrics_view
 
 urlpatterns = [
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("api/schema/", SchemaView.as_view(), name="schema"),
     # Open API UI, to easily test the API. This is only available in development.
     path(
         "",
@@ -22,12 +28,34 @@ urlpatterns = [
         name="swagger-ui",
     ),
     path("admin/", admin.site.urls),
+    # Prometheus metrics of every worker.
+    path("metrics", metrics_view, name="metrics"),
     path("api/register/", RegisterView.as_view(), name="register"),
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/reviews/", AddReviewView.as_view(), name="add_review"),
+    # Before the reviews of a book, which would take these for ISBNs.
+    path("api/reviews/bulk/", AddReviewsBulkView.as_view(), name="add_reviews_bulk"),
+    path("api/reviews/export/", ExportReviewsView.as_view(), name="export_reviews"),
+    path("api/reviews/search/", SearchReviewsView.as_view(), name="search_reviews"),
     path(
         "api/reviews/<str:isbn>/", GetBookReviewsView.as_view(), name="get_book_reviews"
     ),
     path("api/book-info/", GetBookInformationView.as_view(), name="get_book_info"),
+    path(
+        "api/book-info/batch/",
+        GetBooksInformationView.as_view(),
+        name="get_books_info",
+    ),
+    path("api/books/stats/", GetBooksStatsView.as_view(), name="get_books_stats"),
+    path(
+        "api/books/trending/",
+        GetTrendingBooksView.as_view(),
+        name="get_trending_books",
+    ),
+    path(
+        "api/books/<str:isbn>/stats/",
+        GetBookStatsView.as_view(),
+        name="get_book_stats",
+    ),
 ]
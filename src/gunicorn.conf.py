@@ -0,0 +1,73 @@
+"""
+Gunicorn settings, picked up from the working directory (src/).
+
+Workers are uvicorn workers serving core.asgi by default, so the async book
+info views await the Lambda without pinning a worker, and the rest of the API
+keeps being served meanwhile. Set GUNICORN_WORKER_CLASS=sync to go back to
+sync workers serving core.wsgi.
+
+Workers keep their request metrics in files in PROMETHEUS_MULTIPROC_DIR, a
+fresh temporary directory unless it's set, and /metrics adds up the files of
+every worker, so it reports the same whichever worker serves it.
+
+Set GUNICORN_PRELOAD=True to import the app, URLs and views included, once in
+the master instead of in each worker, so workers start serving as soon as they
+fork and share the master's memory. Code changes then take a restart of the
+master, reloading with HUP doesn't pick them up.
+"""
+
+import glob
+import os
+import tempfile
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "uvicorn_worker.UvicornWorker")
+
+if worker_class == "sync":
+    wsgi_app = "core.wsgi:application"
+else:
+    wsgi_app = "core.asgi:application"
+    # Under ASGI, Django runs the sync code of requests on short-lived threads,
+    # and persistent connections would be left behind with them instead of
+    # reused. Each request opens and closes a connection then, which costs a
+    # few milliseconds against a nearby database, and a connection slot per
+    # request in flight. A pooler such as PgBouncer in front of Postgres takes
+    # both back. Setting DB_CONN_MAX_AGE overrides this.
+    os.environ.setdefault("DB_CONN_MAX_AGE", "0")
+
+preload_app = os.environ.get("GUNICORN_PRELOAD") == "True"
+
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
+access_log_format = '%(t)s "%(r)s" %(s)s %(L)s'
+
+# Set before the workers fork and import the app, which picks its metrics
+# storage when it's imported.
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="scalestack-metrics-")
+)
+
+
+def on_starting(server):
+    # Metrics of a previous run would be added to the ones of this one.
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        # Django only loads the URLs, and the views with them, on the first
+        # request.
+        from importlib import import_module
+
+        from django.conf import settings
+
+        import_module(settings.ROOT_URLCONF)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Book, Review
+from .models import Book, BookStats, Review, ReviewCount
 
 admin.site.register(Book)
 admin.site.register(Review)
+admin.site.register(BookStats)
+admin.site.register(ReviewCount)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ReviewsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "reviews"
+
+    def ready(self):
+        # Connects the signal handlers keeping book stats and user states up to
+        # date, and timing database queries.
+        from . import authentication, metrics, stats  # noqa: F401
@@ -0,0 +1,43 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+
+
+class AsyncViewMixin:
+    """
+    Lets DRF views define ``async def`` handlers.
+
+    Django serves views whose handlers are all coroutines natively under ASGI.
+    This dispatch mirrors APIView.dispatch, running the blocking steps before
+    the handler (authentication, permissions and throttling, which may query
+    the database) on Django's sync thread, and awaiting the handler on the
+    event loop. Under WSGI, Django runs the whole view in an event loop of its
+    own, so the views keep working there too.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
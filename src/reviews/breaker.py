@@ -0,0 +1,137 @@
+import math
+import threading
+import time
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call the breaker doesn't let through."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable, retry in {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    A thread-safe circuit breaker, which stops calling a dependency that keeps
+    failing or slowing down.
+
+    Closed, it lets calls through, and opens once ``failure_threshold`` calls in
+    a row failed or took longer than ``slow_call_duration`` seconds. Open, it
+    rejects calls for ``reset_timeout`` seconds, and then half-opens to let a
+    single trial call through, which closes it again if it succeeds and opens it
+    otherwise.
+
+    Callers check ``allow()`` before each call and ``record()`` its outcome.
+    Those with work to do before a call, which a rejection would waste, can
+    ``check()`` first.
+    """
+
+    outcomes = ("success", "failure", "slow", "rejected")
+
+    def __init__(
+        self,
+        name,
+        failure_threshold,
+        slow_call_duration,
+        reset_timeout,
+        timer=time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_duration = slow_call_duration
+        self.reset_timeout = reset_timeout
+        self._timer = timer
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def allow(self):
+        """Raises CircuitOpenError unless a call may be made now."""
+        with self._lock:
+            self._check()
+            if self._state == HALF_OPEN:
+                self._trial_in_flight = True
+
+    def check(self):
+        """
+        Raises CircuitOpenError unless a call may be made now, like ``allow()``
+        but without taking the trial call of a half-open breaker.
+        """
+        with self._lock:
+            self._check()
+
+    def record(self, succeeded, duration):
+        """
+        Records a call that was let through, and whether it ``succeeded`` in
+        ``duration`` seconds.
+
+        Returns its outcome, "success", "failure" or "slow".
+        """
+        if not succeeded:
+            outcome = "failure"
+        elif duration > self.slow_call_duration:
+            outcome = "slow"
+        else:
+            outcome = "success"
+        with self._lock:
+            self._counts[outcome] += 1
+            state = self._current_state()
+            if state == HALF_OPEN:
+                self._trial_in_flight = False
+                if outcome == "success":
+                    self._close()
+                else:
+                    self._open()
+            elif outcome != "success":
+                self._failures += 1
+                if state == CLOSED and self._failures >= self.failure_threshold:
+                    self._open()
+            else:
+                self._failures = 0
+        return outcome
+
+    def snapshot(self):
+        """Returns the state of the breaker and its counts of outcomes."""
+        with self._lock:
+            return {"state": self._current_state(), **self._counts}
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.outcomes, 0)
+            self._close()
+
+    def _check(self):
+        state = self._current_state()
+        if state == CLOSED or (state == HALF_OPEN and not self._trial_in_flight):
+            return
+        self._counts["rejected"] += 1
+        retry_after = self._opened_at + self.reset_timeout - self._timer()
+        raise CircuitOpenError(self.name, max(1, math.ceil(retry_after)))
+
+    def _current_state(self):
+        if (
+            self._state == OPEN
+            and self._timer() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = self._timer()
+
+    def _close(self):
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
@@ -0,0 +1,87 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from . import prefetch
+from .isbn import InvalidISBN, normalize_isbn
+from .models import Book, Review
+from .serializers import ReviewBulkItemSerializer
+from .stats import record_reviews
+
+
+def create_reviews(user, rows, chunk_size=None):
+    """
+    Creates reviews by ``user`` from ``rows`` of isbn, title and comment.
+
+    The books of all the rows are resolved with a single query. Rows are then
+    validated and inserted in chunks, each in its own transaction, so a failing
+    row doesn't prevent the others from being created.
+
+    Returns the number of reviews created, and a list of errors of the rows that
+    weren't, as {"index": ..., "errors": ...}.
+    """
+    chunk_size = chunk_size or settings.REVIEW_BULK_CHUNK_SIZE
+    isbns = set()
+    for row in rows:
+        if isinstance(row, dict) and isinstance(row.get("isbn"), str):
+            try:
+                isbns.add(normalize_isbn(row["isbn"]))
+            except InvalidISBN:
+                # Reported when the row is validated.
+                pass
+    books = {
+        book.isbn: book
+        for book in Book.objects.filter(isbn__in=isbns).only("isbn", "fetched_at")
+    }
+
+    # The fields are bound once and reused for every row.
+    item_serializer = ReviewBulkItemSerializer()
+    created = 0
+    errors = []
+    reviewed = set()
+    for start in range(0, len(rows), chunk_size):
+        reviews = []
+        for index, row in enumerate(rows[start : start + chunk_size], start):
+            try:
+                data = item_serializer.run_validation(row)
+            except serializers.ValidationError as e:
+                errors.append({"index": index, "errors": e.detail})
+                continue
+            book = books.get(data["isbn"])
+            if book is None:
+                message = (
+                    f"Book with ISBN {data['isbn']} does not exist in our database."
+                )
+                errors.append({"index": index, "errors": {"isbn": [message]}})
+                continue
+            reviews.append(
+                Review(
+                    book=book,
+                    user=user,
+                    title=data["title"],
+                    comment=data["comment"],
+                )
+            )
+        if reviews:
+            _insert_reviews(reviews)
+            created += len(reviews)
+            reviewed.update(review.book for review in reviews)
+
+    for book in reviewed:
+        if not book.is_fresh():
+            prefetch.enqueue(book.isbn)
+    return created, errors
+
+
+def _insert_reviews(reviews):
+    by_book = defaultdict(list)
+    with transaction.atomic():
+        for review in Review.objects.bulk_create(reviews):
+            by_book[review.book_id].append(review)
+        # Stats rows are locked in a fixed order, so concurrent requests
+        # reviewing the same books can't deadlock.
+        for book_id in sorted(by_book):
+            reviews = by_book[book_id]
+            record_reviews(reviews[0].book, reviews)
@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Review
+from .serializers import ReviewListSerializer
+
+CSV_COLUMNS = ("id", "user", "isbn", "title", "comment", "created_at")
+
+# Rendered rows are compressed once this many bytes accumulate, so gzip sees
+# blocks large enough to compress well without holding the export in memory.
+BUFFER_SIZE = 64 * 1024
+
+
+def export_queryset(isbn=None, username=None, since=None, after=None):
+    """
+    Returns the rows of the reviews to export, oldest first.
+
+    ``after`` is the (created_at, id) of the last review of a previous export,
+    which resumes right after it.
+    """
+    reviews = Review.objects.all()
+    if isbn:
+        reviews = reviews.filter(book__isbn=isbn)
+    if username:
+        reviews = reviews.filter(user__username=username)
+    if since:
+        reviews = reviews.filter(created_at__gte=since)
+    if after:
+        created_at, review_id = after
+        reviews = reviews.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=review_id)
+        )
+    return reviews.order_by("created_at", "id").values(
+        *ReviewListSerializer.values_fields
+    )
+
+
+def iter_reviews(rows):
+    """
+    Renders ``rows`` as they are read from a server-side cursor, a chunk of
+    REVIEW_EXPORT_CHUNK_SIZE rows at a time.
+    """
+    serializer = ReviewListSerializer()
+    for row in rows.iterator(chunk_size=settings.REVIEW_EXPORT_CHUNK_SIZE):
+        yield serializer.to_representation(row)
+
+
+def ndjson_lines(reviews):
+    for review in reviews:
+        yield json.dumps(review) + "\n"
+
+
+def csv_lines(reviews):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for review in reviews:
+        writer.writerow(
+            (
+                review["id"],
+                review["user"],
+                review["book"]["isbn"],
+                review["title"],
+                review["comment"],
+                review["created_at"],
+            )
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def encode(lines, compress=False):
+    """
+    Encodes ``lines`` to UTF-8 in blocks of about BUFFER_SIZE bytes, gzipped on
+    the fly when ``compress`` is true.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    block = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        block.append(data)
+        size += len(data)
+        if size >= BUFFER_SIZE:
+            data = b"".join(block)
+            block, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = b"".join(block)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+async def aiter_blocks(blocks):
+    """
+    Iterates ``blocks`` asynchronously, reading each one on Django's sync thread
+    for the request, which holds its database connection and cursor. Under
+    ASGI, Django reads sync iterators whole before sending any of them, but
+    streams async ones.
+    """
+    blocks = iter(blocks)
+    read = sync_to_async(next)
+    while (block := await read(blocks, None)) is not None:
+        yield block
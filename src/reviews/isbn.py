@@ -0,0 +1,57 @@
+"""
+ISBN validation and normalization.
+
+Books are stored and looked up by their ISBN-13. ISBNs given as ISBN-10, or
+with hyphens or spaces, are normalized to it first, so every form of an ISBN
+hits the same book and the same cache entries, and ISBNs with a bad check digit
+are rejected without a round trip to the Lambda.
+"""
+
+import re
+
+# Hyphens and spaces are allowed between the groups of an ISBN. Digits must be
+# ASCII ones, \d alone also matches the digits of other scripts.
+_SEPARATORS = re.compile(r"[\s-]", re.ASCII)
+_ISBN_10 = re.compile(r"\d{9}[\dX]", re.ASCII)
+_ISBN_13 = re.compile(r"97[89]\d{10}", re.ASCII)
+
+
+class InvalidISBN(ValueError):
+    pass
+
+
+def normalize_isbn(value):
+    """
+    Returns the ISBN-13 of ``value``, an ISBN-10 or ISBN-13.
+
+    Raises InvalidISBN if ``value`` isn't an ISBN or its check digit is wrong.
+    """
+    isbn = _SEPARATORS.sub("", value).upper()
+    if _ISBN_10.fullmatch(isbn):
+        if check_digit_10(isbn[:9]) != isbn[9]:
+            raise InvalidISBN(f"{value} has an invalid check digit.")
+        return to_isbn_13(isbn[:9])
+    if _ISBN_13.fullmatch(isbn):
+        if check_digit_13(isbn[:12]) != isbn[12]:
+            raise InvalidISBN(f"{value} has an invalid check digit.")
+        return isbn
+    raise InvalidISBN(f"{value} isn't an ISBN-10 or ISBN-13.")
+
+
+def check_digit_10(digits):
+    """Returns the check digit of the first 9 digits of an ISBN-10."""
+    total = sum(int(digit) * (10 - i) for i, digit in enumerate(digits))
+    check = -total % 11
+    return "X" if check == 10 else str(check)
+
+
+def check_digit_13(digits):
+    """Returns the check digit of the first 12 digits of an ISBN-13."""
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(digits))
+    return str(-total % 10)
+
+
+def to_isbn_13(digits):
+    """Returns the ISBN-13 of the ISBN-10 whose first 9 digits are ``digits``."""
+    digits = f"978{digits}"
+    return digits + check_digit_13(digits)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from reviews.trending import compact_review_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Drops the review counts that left the trending window, and caches the "
+        "trending books afresh."
+    )
+
+    def handle(self, *args, **options):
+        dropped = compact_review_counts()
+        self.stdout.write(f"Dropped {dropped} review counts.")
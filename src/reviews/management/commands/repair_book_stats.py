@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from reviews.models import Book
+from reviews.stats import recompute_book_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes the review stats of books from their reviews, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of books recomputed per transaction",
+        )
+        parser.add_argument(
+            "isbns", nargs="*", help="ISBNs of the books to repair, all by default"
+        )
+
+    def handle(self, *args, chunk_size, isbns, **options):
+        books = Book.objects.order_by("id")
+        if isbns:
+            books = books.filter(isbn__in=isbns)
+
+        # Walking the ids keeps each chunk a short transaction, instead of
+        # locking the stats of every book at once.
+        repaired = drifted = 0
+        last_id = 0
+        while True:
+            book_ids = list(
+                books.filter(id__gt=last_id).values_list("id", flat=True)[:chunk_size]
+            )
+            if not book_ids:
+                break
+            drifted += recompute_book_stats(book_ids)
+            repaired += len(book_ids)
+            last_id = book_ids[-1]
+
+        self.stdout.write(
+            f"Recomputed the stats of {repaired} books, {drifted} had drifted."
+        )
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from reviews.models import Review
+
+INDEX_NAME = "review_search_idx"
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates or rebuilds the full-text search index of reviews, without "
+        "locking out writes."
+    )
+
+    def add_arguments(self, parser):
+        action = parser.add_mutually_exclusive_group(required=True)
+        action.add_argument(
+            "--create", action="store_true", help="Creates the index if it's missing"
+        )
+        action.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Rebuilds the index, which compacts it after many updates",
+        )
+
+    def handle(self, *args, create, rebuild, **options):
+        index = next(
+            (index for index in Review._meta.indexes if index.name == INDEX_NAME), None
+        )
+        if index is None:
+            raise CommandError(f"Review has no index named {INDEX_NAME}.")
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Review._meta.db_table
+            )
+        exists = INDEX_NAME in constraints
+
+        # Concurrent builds can't run in a transaction, so this runs in
+        # autocommit, which is Django's default outside of atomic blocks.
+        with connection.schema_editor(atomic=False) as schema_editor:
+            if create and exists:
+                self.stdout.write(f"{INDEX_NAME} already exists.")
+            elif create:
+                schema_editor.execute(
+                    index.create_sql(Review, schema_editor, concurrently=True)
+                )
+                self.stdout.write(f"Created {INDEX_NAME}.")
+            elif not exists:
+                raise CommandError(f"{INDEX_NAME} doesn't exist, create it first.")
+            else:
+                schema_editor.execute(
+                    f"REINDEX INDEX CONCURRENTLY {schema_editor.quote_name(INDEX_NAME)}"
+                )
+                self.stdout.write(f"Rebuilt {INDEX_NAME}.")
+            schema_editor.execute(
+                f"ANALYZE {schema_editor.quote_name(Review._meta.db_table)}"
+            )
@@ -0,0 +1,117 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from reviews.isbn import to_isbn_13
+from reviews.models import Book
+
+# Reviews are made of these words, picked at random.
+WORDS = (
+    "book story plot characters writing author chapter ending pages read "
+    "great good bad boring slow fast long short classic novel love hate "
+    "beautiful dark funny sad thrilling mystery adventure history world war "
+    "family friends life death journey city night time years young old "
+    "first last best worst recommend again finished couldn't put down "
+    "prose style voice narrator twist surprise predictable original "
+    "translation edition cover series sequel fantasy science fiction magic"
+).split()
+# Words in about one review in a thousand, so searches can be tried for words
+# that match many reviews and words that match a handful.
+RARE_WORDS = ("zeppelin", "quixotic", "labyrinthine")
+
+WORD = """
+    CASE WHEN random() < %(rare_odds)s
+        THEN (%(rare_words)s::text[])[1 + floor(random() * %(rare_count)s)::int]
+        ELSE (%(words)s::text[])[1 + floor(random() * %(word_count)s)::int]
+    END
+"""
+
+INSERT_REVIEWS = f"""
+    INSERT INTO reviews_review (book_id, user_id, title, comment, created_at)
+    SELECT
+        (%(books)s::bigint[])[
+            1 + floor(power(random(), %(skew)s) * %(book_count)s)::int
+        ],
+        (%(users)s::int[])[1 + floor(random() * %(user_count)s)::int],
+        initcap(array_to_string(ARRAY(
+            SELECT {WORD} FROM generate_series(1, 2 + n %% 3)
+        ), ' ')),
+        array_to_string(ARRAY(
+            SELECT {WORD} FROM generate_series(1, 10 + n %% 30)
+        ), ' '),
+        now() - random() * interval '365 days'
+    FROM generate_series(1, %(count)s) AS n
+"""
+
+
+def seed_isbn(i):
+    """Returns the ISBN of the ``i``th seeded book, the most reviewed first."""
+    return to_isbn_13(f"{i:09d}")
+
+
+class Command(BaseCommand):
+    help = "Fills the database with random books, users and reviews, to benchmark."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--reviews", type=int, default=100_000)
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.0,
+            help="How much more some books are reviewed than others. 1 spreads "
+            "reviews evenly, at 3 a tenth of the books get about half of them.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100_000,
+            help="Number of reviews inserted per statement",
+        )
+
+    def handle(self, *args, books, users, reviews, skew, batch_size, **options):
+        # Seeding again adds reviews to the same books and users. The ISBNs are
+        # the ones of the Open Library stand-in's catalogue.
+        isbns = [seed_isbn(i) for i in range(books)]
+        usernames = [f"seed-{i}" for i in range(users)]
+        Book.objects.bulk_create(
+            (Book(isbn=isbn) for isbn in isbns), batch_size=1000, ignore_conflicts=True
+        )
+        User.objects.bulk_create(
+            (User(username=username, password="!") for username in usernames),
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        book_ids = dict(Book.objects.filter(isbn__in=isbns).values_list("isbn", "id"))
+        user_ids = User.objects.filter(username__in=usernames).values_list(
+            "id", flat=True
+        )
+        params = {
+            # In ISBN order, so the first books are the popular ones.
+            "books": [book_ids[isbn] for isbn in isbns],
+            "users": list(user_ids),
+            "skew": skew,
+            "words": list(WORDS),
+            "rare_words": list(RARE_WORDS),
+            # Reviews average 27 words.
+            "rare_odds": 1 / 27 / 1000,
+        }
+        params["book_count"] = len(params["books"])
+        params["user_count"] = len(params["users"])
+        params["word_count"] = len(WORDS)
+        params["rare_count"] = len(RARE_WORDS)
+
+        inserted = 0
+        while inserted < reviews:
+            count = min(batch_size, reviews - inserted)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(INSERT_REVIEWS, {**params, "count": count})
+            inserted += count
+            self.stdout.write(f"Inserted {inserted} reviews.")
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE reviews_review")
+        # The reviews were inserted behind the stats' back.
+        call_command("repair_book_stats", *isbns, stdout=self.stdout)
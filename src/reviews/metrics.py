@@ -0,0 +1,251 @@
+"""
+Per-request timings, and their aggregation into Prometheus metrics.
+
+RequestMetricsMiddleware starts a RequestTimings for every request, which the
+rest of the app adds to while it serves the request: database queries, Lambda
+invocations, rendering and cache lookups. They are reported in a Server-Timing
+header, in a log line, and in histograms served at /metrics.
+
+Gunicorn runs several worker processes, each with metrics of its own. When
+PROMETHEUS_MULTIPROC_DIR is set, as gunicorn.conf.py does, workers write their
+metrics to files there and /metrics adds up the files of every worker.
+"""
+
+import contextvars
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Labelled by route rather than path, so there's one series per endpoint.
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve requests, up to the response headers",
+    ["method", "route", "status"],
+)
+DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in database queries per request",
+    ["route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database queries per request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250),
+)
+LAMBDA_DURATION = Histogram(
+    "http_request_lambda_duration_seconds",
+    "Time spent invoking the book info Lambda per request, when it was invoked",
+    ["route"],
+)
+RENDER_DURATION = Histogram(
+    "http_request_render_duration_seconds",
+    "Time spent rendering response bodies per request",
+    ["route"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1),
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups",
+    "Cache lookups by cache and result",
+    ["cache", "result"],
+)
+LAMBDA_CALLS = Counter(
+    "lambda_calls",
+    "Book info Lambda invocations by outcome, rejected ones weren't made because "
+    "the circuit breaker was open",
+    ["outcome"],
+)
+# The highest state of any live worker.
+LAMBDA_CIRCUIT_STATE = Gauge(
+    "lambda_circuit_state",
+    "State of the book info Lambda circuit breaker, 0 closed, 1 half open, 2 open",
+    multiprocess_mode="livemax",
+)
+_CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+BOOK_INFO_THROTTLED = Counter(
+    "book_info_throttled",
+    "Book info lookups that weren't sent upstream by the budget they were over",
+    ["scope"],
+)
+
+
+class RequestTimings:
+    """What serving a request took, by where the time went."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.lambda_calls = 0
+        self.lambda_seconds = 0.0
+        self.render_seconds = 0.0
+        # {(cache, result): count}
+        self.cache_lookups = {}
+        # Book info lookups run on threads of their own while the request waits.
+        self._lock = threading.Lock()
+
+    def add(self, field, seconds, count=1):
+        with self._lock:
+            setattr(
+                self, f"{field}_seconds", getattr(self, f"{field}_seconds") + seconds
+            )
+            if field == "db":
+                self.db_queries += count
+            elif field == "lambda":
+                self.lambda_calls += count
+
+    def count_cache(self, cache, result, count):
+        with self._lock:
+            key = (cache, result)
+            self.cache_lookups[key] = self.cache_lookups.get(key, 0) + count
+
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def server_timing(self):
+        """Returns the value of the Server-Timing header."""
+        metrics = [
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"',
+            f"render;dur={self.render_seconds * 1000:.1f}",
+        ]
+        if self.lambda_calls:
+            metrics.append(
+                f"lambda;dur={self.lambda_seconds * 1000:.1f};"
+                f'desc="{self.lambda_calls} invocations"'
+            )
+        for (cache, result), count in sorted(self.cache_lookups.items()):
+            metrics.append(f'cache-{cache}-{result};desc="{count}"')
+        metrics.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def log_fields(self):
+        """Returns the timings as fields for a structured log record."""
+        return {
+            "duration_ms": round(self.elapsed() * 1000, 1),
+            "db_queries": self.db_queries,
+            "db_ms": round(self.db_seconds * 1000, 1),
+            "lambda_calls": self.lambda_calls,
+            "lambda_ms": round(self.lambda_seconds * 1000, 1),
+            "render_ms": round(self.render_seconds * 1000, 1),
+            "cache": {
+                f"{cache}_{result}": count
+                for (cache, result), count in self.cache_lookups.items()
+            },
+        }
+
+    def observe(self, method, route, status):
+        """Adds the timings to the Prometheus metrics."""
+        REQUEST_DURATION.labels(method, route, status).observe(self.elapsed())
+        DB_DURATION.labels(route).observe(self.db_seconds)
+        DB_QUERIES.labels(route).observe(self.db_queries)
+        RENDER_DURATION.labels(route).observe(self.render_seconds)
+        if self.lambda_calls:
+            LAMBDA_DURATION.labels(route).observe(self.lambda_seconds)
+
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current_timings():
+    """Returns the timings of the request being served, if any."""
+    return _current.get()
+
+
+@contextmanager
+def timed(field):
+    """Adds the time the block takes to ``field`` of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _current.get()
+        if timings is not None:
+            timings.add(field, time.perf_counter() - start)
+
+
+def count_cache(cache, result, count=1):
+    """Counts ``count`` lookups in ``cache`` that ended in ``result``."""
+    if not count:
+        return
+    CACHE_LOOKUPS.labels(cache, result).inc(count)
+    timings = _current.get()
+    if timings is not None:
+        timings.count_cache(cache, result, count)
+
+
+def count_lambda_call(outcome, circuit_state):
+    """Counts a Lambda call that ended in ``outcome``, and the breaker's state."""
+    LAMBDA_CALLS.labels(outcome).inc()
+    LAMBDA_CIRCUIT_STATE.set(_CIRCUIT_STATES[circuit_state])
+
+
+def count_throttled(scope):
+    """Counts a lookup refused for being over its ``scope`` budget."""
+    BOOK_INFO_THROTTLED.labels(scope).inc()
+
+
+def _time_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add("db", time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    # Connections are created per thread, including the book info threads, and
+    # again after they are closed.
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def metrics_view(request):
+    """
+    Serves the metrics of every worker in the Prometheus text format, to
+    requests with METRICS_TOKEN as a bearer token, or to any with METRICS_PUBLIC.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        authorized = hmac.compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        )
+    else:
+        authorized = settings.METRICS_PUBLIC
+    if not authorized:
+        return HttpResponseForbidden()
+    if settings.PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,72 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+
+logger = logging.getLogger("reviews.requests")
+
+
+class RequestMetricsMiddleware:
+    """
+    Times requests, and reports where the time went in a Server-Timing header,
+    a log line with the timings as key=value fields, and the metrics served at
+    /metrics.
+
+    Goes first in MIDDLEWARE, so the timings cover the other middleware too.
+    Streamed responses are timed up to their headers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self.report(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        timings, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self.report(request, response, timings)
+        return response
+
+    def report(self, request, response, timings):
+        match = request.resolver_match
+        route = (match.url_name or match.route) if match else "unmatched"
+        response["Server-Timing"] = timings.server_timing()
+        timings.observe(request.method, route, response.status_code)
+        fields = {
+            "method": request.method,
+            "route": route,
+            "status": response.status_code,
+            **timings.log_fields(),
+        }
+        # The fields are in the message too, as key=value pairs, for handlers
+        # that only output the message.
+        logger.info("%s", _key_values(fields), extra=fields)
+
+
+def _key_values(fields):
+    pairs = []
+    for name, value in fields.items():
+        if isinstance(value, dict):
+            pairs += [(f"{name}_{key}", value[key]) for key in sorted(value)]
+        else:
+            pairs.append((name, value))
+    return " ".join(f"{name}={value}" for name, value in pairs)
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reviews", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="author",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="description",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="fetched_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="publish_date",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="title",
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:14
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the index without locking the reviews table against writes.
+    atomic = False
+
+    dependencies = [
+        ("reviews", "0002_book_metadata"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="review",
+            index=models.Index(
+                fields=["book", "created_at", "id"], name="review_book_created_idx"
+            ),
+        ),
+    ]
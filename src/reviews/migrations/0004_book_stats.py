@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reviews", "0003_review_book_created_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookStats",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="reviews.book",
+                    ),
+                ),
+                ("review_count", models.PositiveIntegerField(default=0)),
+                ("first_review_at", models.DateTimeField(blank=True, null=True)),
+                ("last_review_at", models.DateTimeField(blank=True, null=True)),
+                ("daily_counts", models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                "verbose_name_plural": "book stats",
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reviews", "0004_book_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookstats",
+            name="changed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="bookstats",
+            name="version",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
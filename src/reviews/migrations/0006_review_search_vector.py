@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:50
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reviews", "0005_book_stats_version"),
+    ]
+
+    operations = [
+        # Adding a stored generated column rewrites the reviews table, plan it for
+        # a quiet moment on large installs.
+        migrations.AddField(
+            model_name="review",
+            name="search_vector",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.contrib.postgres.search.CombinedSearchVector(
+                    django.contrib.postgres.search.SearchVector(
+                        "title", config="english", weight="A"
+                    ),
+                    "||",
+                    django.contrib.postgres.search.SearchVector(
+                        "comment", config="english", weight="B"
+                    ),
+                    django.contrib.postgres.search.SearchConfig("english"),
+                ),
+                output_field=django.contrib.postgres.search.SearchVectorField(),
+            ),
+        ),
+    ]
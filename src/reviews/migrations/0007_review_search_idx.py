@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:50
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Build the index without locking the reviews table against writes.
+    atomic = False
+
+    dependencies = [
+        ("reviews", "0006_review_search_vector"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="review",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="review_search_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from reviews.isbn import InvalidISBN, normalize_isbn
+
+
+def normalize_book_isbns(apps, schema_editor):
+    # Books are looked up by their ISBN-13. Books stored under another form of
+    # their ISBN are moved to it, unless a book already has it. Books whose ISBN
+    # isn't valid are left as they are, they can't be looked up anymore.
+    Book = apps.get_model("reviews", "Book")
+    isbns = set(Book.objects.values_list("isbn", flat=True))
+    for isbn in sorted(isbns):
+        try:
+            normalized = normalize_isbn(isbn)
+        except InvalidISBN:
+            continue
+        if normalized != isbn and normalized not in isbns:
+            Book.objects.filter(isbn=isbn).update(isbn=normalized)
+            isbns.add(normalized)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reviews", "0007_review_search_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_book_isbns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reviews", "0008_normalize_book_isbns"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReviewCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="review_counts",
+                        to="reviews.book",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["bucket"], name="review_count_bucket_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("book", "bucket"), name="review_count_book_bucket_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,13 +1,39 @@
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from datetime import timedelta
 
 
 class Book(models.Model):
     isbn = models.CharField(max_length=13, unique=True)
+    title = models.TextField(blank=True)
+    author = models.TextField(blank=True)
+    publish_date = models.CharField(max_length=64, blank=True)
+    description = models.TextField(blank=True)
+    # When the metadata above was last fetched from Open Library. Null for books
+    # that were never looked up.
+    fetched_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.title} (ISBN: {self.isbn})"
 
+    @property
+    def info(self):
+        return {
+            "title": self.title,
+            "author": self.author,
+            "publish_date": self.publish_date,
+            "description": self.description,
+        }
+
+    def is_fresh(self):
+        if self.fetched_at is None:
+            return False
+        return timezone.now() - self.fetched_at < settings.BOOK_INFO_TTL
+
 
 class Review(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="reviews")
@@ -15,6 +41,82 @@ class Review(models.Model):
     title = models.CharField(max_length=100)
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by Postgres from the title and comment, for full-text search.
+    search_vector = models.GeneratedField(
+        expression=SearchVector("title", weight="A", config="english")
+        + SearchVector("comment", weight="B", config="english"),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # Serves the paginated reviews of a book in (created_at, id) order.
+            models.Index(
+                fields=["book", "created_at", "id"], name="review_book_created_idx"
+            ),
+            GinIndex(fields=["search_vector"], name="review_search_idx"),
+        ]
 
     def __str__(self):
         return f"Review for {self.book.title} by {self.user.username}"
+
+
+class BookStats(models.Model):
+    """
+    Review statistics of a book, kept up to date as reviews are added and
+    deleted so listings don't have to count them.
+    """
+
+    book = models.OneToOneField(
+        Book, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    review_count = models.PositiveIntegerField(default=0)
+    first_review_at = models.DateTimeField(null=True, blank=True)
+    last_review_at = models.DateTimeField(null=True, blank=True)
+    # Reviews per day, as {"YYYY-MM-DD": count}, for the last
+    # BOOK_STATS_ACTIVITY_DAYS days.
+    daily_counts = models.JSONField(default=dict, blank=True)
+    # Bumped whenever a review of the book is added or deleted, so responses
+    # listing its reviews can be cached and revalidated by version.
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "book stats"
+
+    def __str__(self):
+        return f"Stats for {self.book_id}: {self.review_count} reviews"
+
+    def recent_count(self, days):
+        """Returns the number of reviews of the last ``days`` days, today included."""
+        since = (timezone.localdate() - timedelta(days=days - 1)).isoformat()
+        return sum(count for day, count in self.daily_counts.items() if day >= since)
+
+
+class ReviewCount(models.Model):
+    """
+    Number of reviews of a book created in the bucket of TRENDING_BUCKET_MINUTES
+    starting at ``bucket``, counted as they're added so trending books don't
+    have to count reviews. Buckets are only kept while they're in the window.
+    """
+
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name="review_counts"
+    )
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["book", "bucket"], name="review_count_book_bucket_uniq"
+            ),
+        ]
+        indexes = [
+            # Serves adding up the buckets in the window, and dropping older ones.
+            models.Index(fields=["bucket"], name="review_count_bucket_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.count} reviews of {self.book_id} from {self.bucket}"
@@ -1,7 +1,128 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    CursorPagination,
+    PageNumberPagination,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
+
+
+class ReviewCursorPagination(CursorPagination):
+    """
+    Keyset pagination over reviews. Pages cost the same however deep they are,
+    and no count query is run.
+    """
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("created_at", "id")
+
+
+class RankCursorPagination(BasePagination):
+    """
+    Keyset pagination over rows ordered by ``rank`` and then ``id``, both
+    descending, as search results are. The cursor holds the rank and id of the
+    last row of the previous page, so pages cost the same however deep they
+    are. There are only next links.
+    """
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        if position is not None:
+            rank, last_id = position
+            queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=last_id))
+
+        rows = list(queryset[: page_size + 1])
+        self.next_position = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_position = (rows[-1]["rank"], rows[-1]["id"])
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            rank, last_id = (
+                base64.urlsafe_b64decode(encoded.encode("ascii"))
+                .decode("ascii")
+                .split(",")
+            )
+            return float(rank), int(last_id)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        # repr round-trips the rank exactly, so the next page starts right after it.
+        rank, last_id = position
+        encoded = base64.urlsafe_b64encode(f"{rank!r},{last_id}".encode("ascii"))
+        return encoded.decode("ascii")
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Cursor of the page, from the next link",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results per page",
+                "schema": {"type": "integer"},
+            },
+        ]
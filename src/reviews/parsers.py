@@ -0,0 +1,29 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline delimited JSON, one value per line, into a list.
+
+    The body is read line by line, so a large stream is never decoded as a
+    whole. Blank lines are skipped.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return []
+        values = []
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                values.append(json.loads(line))
+            except ValueError as e:
+                raise ParseError(f"NDJSON parse error on line {number} - {e}")
+        return values
@@ -0,0 +1,132 @@
+"""
+Background prefetches of book info.
+
+Adding a review for a book whose info was never fetched, or reading a book
+whose info is stale, queues a fetch, so later readers are served warm data
+instead of waiting for the Lambda. Prefetches of an ISBN are deduplicated
+while one is pending, across workers when the Django cache is shared.
+
+Prefetches run on a backend picked by BOOK_INFO_PREFETCH_BACKEND:
+
+- "thread", the default, runs them on a pool of threads of each worker, and
+  needs no broker. Pending prefetches are lost when the worker exits.
+- "celery" sends them to the Celery workers started by ``make worker``,
+  through CELERY_BROKER_URL.
+
+Both run at most BOOK_INFO_PREFETCH_CONCURRENCY prefetches at once, per worker.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .breaker import CircuitOpenError
+from .throttling import ThrottledError
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(isbn):
+    """
+    Queues a prefetch of the book info of ``isbn``, unless one is pending.
+
+    Returns whether it was queued.
+    """
+    key = _pending_key(isbn)
+    if not cache.add(key, True, settings.BOOK_INFO_PREFETCH_TIMEOUT):
+        return False
+    try:
+        get_backend().submit(isbn)
+    except Exception:
+        cache.delete(key)
+        logger.exception("Couldn't queue a prefetch of ISBN %s.", isbn)
+        return False
+    return True
+
+
+def prefetch(isbn):
+    """Fetches and stores the book info of ``isbn``. Run by the backends."""
+    from .services import fetch_book_info
+
+    try:
+        fetch_book_info(isbn)
+    except (CircuitOpenError, ThrottledError) as e:
+        # Nothing to retry, reading the book fetches it again once the breaker
+        # and the budgets let invocations through.
+        logger.warning("Didn't prefetch book info for ISBN %s: %s", isbn, e)
+    except Exception:
+        logger.exception("Couldn't prefetch book info for ISBN %s.", isbn)
+    finally:
+        cache.delete(_pending_key(isbn))
+
+
+def _pending_key(isbn):
+    return f"book-info-prefetch:{isbn}"
+
+
+class ThreadBackend:
+    """Runs prefetches on a pool of threads of the worker."""
+
+    def __init__(self, max_workers):
+        self.executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="book-prefetch"
+        )
+
+    def submit(self, isbn):
+        self.executor.submit(self._run, isbn)
+
+    @staticmethod
+    def _run(isbn):
+        try:
+            prefetch(isbn)
+        finally:
+            # Threads get their own connection, which Django won't clean up.
+            connection.close()
+
+
+class CeleryBackend:
+    """Sends prefetches to the Celery workers."""
+
+    def __init__(self):
+        # Configures the app the task is sent with.
+        from core.celery import app  # noqa: F401
+
+        from .tasks import prefetch_book_info
+
+        self.task = prefetch_book_info
+
+    def submit(self, isbn):
+        self.task.delay(isbn)
+
+
+BACKENDS = {
+    "thread": lambda: ThreadBackend(settings.BOOK_INFO_PREFETCH_CONCURRENCY),
+    "celery": CeleryBackend,
+}
+
+# Created on first use, and per process.
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = BACKENDS[settings.BOOK_INFO_PREFETCH_BACKEND]()
+    return _backend
+
+
+def _reset_backend():
+    global _backend, _backend_lock
+    _backend = None
+    _backend_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_backend)
@@ -0,0 +1,23 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+from .models import Review
+
+
+def search_reviews(text, isbn=None):
+    """
+    Returns the reviews whose title or comment match ``text``, best matches
+    first, with their ``rank``.
+
+    ``text`` is parsed like web search engines do, with quoted phrases, OR and
+    -word. Matches come from the GIN index on the generated search vector.
+    """
+    query = SearchQuery(text, config="english", search_type="websearch")
+    reviews = Review.objects.filter(search_vector=query)
+    if isbn:
+        reviews = reviews.filter(book__isbn=isbn)
+    # ts_rank returns a real, which is read back rounded to its shortest
+    # decimal. As a double it round-trips, so pagination cursors match it exactly.
+    rank = Cast(SearchRank(F("search_vector"), query), FloatField())
+    return reviews.annotate(rank=rank).order_by("-rank", "-id")
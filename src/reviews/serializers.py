@@ -1,9 +1,42 @@
 from rest_framework import serializers, exceptions
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import Review, Book
+from django.db import transaction
+from . import metrics, prefetch
+from .isbn import InvalidISBN, normalize_isbn
+from .models import Review, Book, BookStats
+from .stats import record_reviews
 
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedDataMixin:
+    """
+    Adds the time a serializer takes to represent its data to the request's
+    render timing, which TimedJSONRenderer adds rendering it to.
+    """
+
+    @property
+    def data(self):
+        with metrics.timed("render"):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    """The list serializer of serializers with TimedDataMixin, timed as a whole."""
+
+
+class ISBNField(serializers.CharField):
+    """An ISBN-10 or ISBN-13, validated and normalized to its ISBN-13."""
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        try:
+            return normalize_isbn(value)
+        except InvalidISBN as e:
+            raise serializers.ValidationError(str(e)) from e
+
+
+class UserSerializer(TimedDataMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -20,6 +53,17 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Issues tokens carrying the claims ClaimsJWTAuthentication relies on."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["username"] = user.username
+        token["is_active"] = user.is_active
+        return token
+
+
 class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
@@ -33,13 +77,73 @@ class BookInformationSerializer(serializers.Serializer):
     description = serializers.CharField()
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class BookInformationBatchSerializer(serializers.Serializer):
+    isbns = serializers.ListField(
+        child=ISBNField(),
+        min_length=1,
+        max_length=settings.BOOK_INFO_BATCH_MAX_SIZE,
+    )
+
+
+class BookInformationResultSerializer(serializers.Serializer):
+    isbn = serializers.CharField()
+    status = serializers.IntegerField()
+    body = serializers.DictField(
+        help_text="The book information, or an error when status isn't 200."
+    )
+
+
+class BookStatsBatchSerializer(serializers.Serializer):
+    isbns = serializers.ListField(
+        child=ISBNField(),
+        min_length=1,
+        max_length=settings.BOOK_INFO_BATCH_MAX_SIZE,
+    )
+
+
+class BookStatsSerializer(TimedDataMixin, serializers.ModelSerializer):
+    isbn = serializers.ReadOnlyField(source="book.isbn")
+    reviews_last_7_days = serializers.SerializerMethodField()
+    reviews_last_30_days = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BookStats
+        list_serializer_class = TimedListSerializer
+        fields = (
+            "isbn",
+            "review_count",
+            "first_review_at",
+            "last_review_at",
+            "reviews_last_7_days",
+            "reviews_last_30_days",
+        )
+
+    def get_reviews_last_7_days(self, stats) -> int:
+        return stats.recent_count(7)
+
+    def get_reviews_last_30_days(self, stats) -> int:
+        return stats.recent_count(30)
+
+
+class TrendingBookSerializer(serializers.Serializer):
+    isbn = serializers.CharField()
+    title = serializers.CharField()
+    review_count = serializers.IntegerField()
+
+
+class TrendingBooksSerializer(TimedDataMixin, serializers.Serializer):
+    since = serializers.DateTimeField()
+    results = TrendingBookSerializer(many=True)
+
+
+class ReviewSerializer(TimedDataMixin, serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source="user.username")
     book = BookSerializer(read_only=True)
-    isbn = serializers.CharField(write_only=True)
+    isbn = ISBNField(write_only=True)
 
     class Meta:
         model = Review
+        list_serializer_class = TimedListSerializer
         fields = ("id", "user", "book", "title", "comment", "created_at", "isbn")
         read_only_fields = ("id", "user", "book", "created_at")
 
@@ -48,9 +152,107 @@ class ReviewSerializer(serializers.ModelSerializer):
             isbn = validated_data.pop("isbn")
             book = Book.objects.get(isbn=isbn)
             user = self.context["request"].user
-            review = Review.objects.create(user=user, book=book, **validated_data)
+            with transaction.atomic():
+                review = Review.objects.create(user=user, book=book, **validated_data)
+                record_reviews(book, [review])
+            if not book.is_fresh():
+                # So the first reader of the book doesn't wait for the Lambda.
+                transaction.on_commit(lambda: prefetch.enqueue(isbn))
             return review
         except Book.DoesNotExist:
             raise exceptions.ValidationError(
                 {"isbn": f"Book with ISBN {isbn} does not exist in our database."}
             )
+
+
+class ReviewBulkItemSerializer(serializers.ModelSerializer):
+    """Validates one review of a bulk request, without touching the database."""
+
+    isbn = ISBNField()
+
+    class Meta:
+        model = Review
+        fields = ("isbn", "title", "comment")
+
+
+class ReviewExportQuerySerializer(serializers.Serializer):
+    isbn = ISBNField(required=False)
+    user = serializers.CharField(required=False, help_text="Username of the reviewer")
+    since = serializers.DateTimeField(required=False)
+    after = serializers.CharField(
+        required=False,
+        help_text=(
+            "Resumes an export after the review with this created_at and id,"
+            " separated by a comma"
+        ),
+    )
+    output = serializers.ChoiceField(choices=("ndjson", "csv"), default="ndjson")
+
+    def validate_after(self, value):
+        created_at, _, review_id = value.rpartition(",")
+        try:
+            created_at = serializers.DateTimeField().to_internal_value(created_at)
+            return created_at, int(review_id)
+        except (serializers.ValidationError, ValueError):
+            raise serializers.ValidationError(
+                "Expected the created_at and id of a review, separated by a comma."
+            )
+
+    def validate(self, data):
+        if not any(data.get(field) for field in ("isbn", "user", "since")):
+            raise serializers.ValidationError(
+                "Scope the export to a book, a user, or a starting time."
+            )
+        return data
+
+
+class ReviewListSerializer(TimedDataMixin, serializers.BaseSerializer):
+    """
+    Renders reviews for listings, with the same output as ReviewSerializer.
+
+    It works on rows from ``Review.objects.values(*values_fields)`` instead of
+    model instances, which skips building the instances and running every field
+    of the ModelSerializer.
+    """
+
+    values_fields = (
+        "id",
+        "user__username",
+        "book__isbn",
+        "title",
+        "comment",
+        "created_at",
+    )
+    _created_at = serializers.DateTimeField()
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    def to_representation(self, row):
+        return {
+            "id": row["id"],
+            "user": row["user__username"],
+            "book": {"isbn": row["book__isbn"]},
+            "title": row["title"],
+            "comment": row["comment"],
+            "created_at": self._created_at.to_representation(row["created_at"]),
+        }
+
+
+class ReviewSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(
+        help_text="Words to search for in titles and comments. Supports quoted"
+        " phrases, OR and -word, like web search engines."
+    )
+    isbn = ISBNField(required=False)
+
+
+class ReviewSearchResultSerializer(ReviewListSerializer):
+    """Renders search results, which are reviews with their rank."""
+
+    values_fields = ReviewListSerializer.values_fields + ("rank",)
+
+    def to_representation(self, row):
+        review = super().to_representation(row)
+        review["rank"] = row["rank"]
+        return review
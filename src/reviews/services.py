@@ -1,31 +1,490 @@
-from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+import asyncio
+import contextvars
+import importlib.util
 import json
 import logging
-import boto3
+import os
+import threading
+import time
+from pathlib import Path
+
+from . import metrics, prefetch, throttling
+from .breaker import CircuitBreaker, CircuitOpenError
+from .cache import CacheStats, LRUCache, SingleFlight
+from .models import Book
 
 logger = logging.getLogger(__name__)
 
+# Book info is cached per process in front of the shared Django cache. Only
+# successful lookups are cached.
+book_info_cache = LRUCache(settings.BOOK_INFO_LRU_SIZE, settings.BOOK_INFO_LRU_TTL)
+book_info_cache_stats = CacheStats()
+# ISBNs Open Library reported as not found, which are answered again without
+# leaving the process until they expire.
+book_info_not_found = LRUCache(
+    settings.BOOK_INFO_NOT_FOUND_SIZE, settings.BOOK_INFO_NOT_FOUND_TTL
+)
+_book_info_flight = SingleFlight()
+# Stops invoking the Lambda while it keeps failing or slowing down, per process.
+lambda_breaker = CircuitBreaker(
+    "Open Library",
+    failure_threshold=settings.LAMBDA_BREAKER_FAILURES,
+    slow_call_duration=settings.LAMBDA_BREAKER_SLOW_CALL,
+    reset_timeout=settings.LAMBDA_BREAKER_RESET_TIMEOUT,
+)
+
+
+# Threads the async views run blocking lookups on, so awaiting the Lambda doesn't
+# block the event loop of the worker. Created on first use, and per process.
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    settings.BOOK_INFO_ASYNC_THREADS, thread_name_prefix="book-info"
+                )
+    return _executor
+
+
+def _reset_executor():
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+async def run_blocking(fn, *args):
+    """Runs ``fn(*args)`` on the book info threads and waits for its result."""
+    # In the caller's context, so the work counts towards the request's timings.
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), context.run, _close_connections_after, fn, *args
+    )
+
+
+def _close_connections_after(fn, *args):
+    # Executor threads keep their own connection between calls, which Django
+    # only cleans up around requests of its own threads.
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+async def aget_book_info(isbn):
+    """
+    Async version of get_book_info. Cache hits are served without leaving the
+    event loop, everything else runs on the book info threads.
+
+    Raises TimeoutError if the lookup takes longer than BOOK_INFO_DEADLINE.
+    """
+    payload = book_info_cache.get(isbn)
+    if payload is not None:
+        _count_book_info("hits")
+        return payload
+    payload = _known_not_found(isbn)
+    if payload is not None:
+        return payload
+    return await _within_deadline(run_blocking(get_book_info, isbn))
+
+
+async def aget_books_info(isbns):
+    """
+    Async version of get_books_info.
+
+    Raises TimeoutError if the lookup takes longer than BOOK_INFO_DEADLINE.
+    """
+    return await _within_deadline(run_blocking(get_books_info, isbns))
+
+
+async def _within_deadline(lookup):
+    # Only the request stops waiting. The lookup carries on in its thread, and
+    # what it fetches is still stored and cached for the next requests.
+    return await asyncio.wait_for(lookup, settings.BOOK_INFO_DEADLINE)
+
 
 def get_book_info(isbn):
     """
-    Gets information about a book from the Open Library API.
+    Gets information about a book, going through the caches and the database
+    first.
+
+    Concurrent lookups of the same ISBN that go upstream are coalesced into a
+    single one, both within the process and, through a lock in the Django
+    cache, across workers.
+
+    Returns a payload shaped like the one of the Lambda function, including the
+    statusCode
+    """
+    payload = _known_not_found(isbn)
+    if payload is not None:
+        return payload
+    payload = book_info_cache.get(isbn)
+    if payload is None:
+        payload = cache.get(_book_info_cache_key(isbn))
+        if payload is not None:
+            book_info_cache.set(isbn, payload)
+    if payload is not None:
+        _count_book_info("hits")
+        return payload
+    payload = stored_book_info(isbn)
+    if payload is not None:
+        _count_book_info("misses")
+        return payload
+
+    # Stored books are served above for free. Lookups that may go upstream are
+    # charged to the request before they're coalesced, so each request pays for
+    # the book out of its own budgets, and isn't throttled for another's.
+    check_breaker()
+    with throttling.charge(upstream=False):
+        payload, shared = _book_info_flight.do(isbn, lambda: _load_book_info_once(isbn))
+    _count_book_info("coalesced" if shared else "misses")
+    return payload
+
+
+def _count_book_info(field, amount=1):
+    book_info_cache_stats.incr(field, amount)
+    metrics.count_cache("book_info", field, amount)
+
+
+def _known_not_found(isbn):
+    payload = book_info_not_found.get(isbn)
+    if payload is not None:
+        metrics.count_cache("book_info_not_found", "hits")
+    return payload
+
+
+def _load_book_info_once(isbn):
+    lock_key = f"book-info-lock:{isbn}"
+    locked = cache.add(lock_key, True, settings.BOOK_INFO_LOCK_TIMEOUT)
+    try:
+        if locked:
+            # get_book_info found no stored book, but a worker that fetched it
+            # since published it before letting go of the lock.
+            payload = cache.get(_book_info_cache_key(isbn))
+        else:
+            # Another worker is loading this book, wait for it to publish the
+            # result and fetch it ourselves only if it doesn't.
+            payload = _wait_for_book_info(isbn, lock_key)
+        if payload is not None:
+            book_info_cache.set(isbn, payload)
+            return payload
+        return fetch_book_info(isbn)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def _wait_for_book_info(isbn, lock_key):
+    deadline = time.monotonic() + settings.BOOK_INFO_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        payload = cache.get(_book_info_cache_key(isbn))
+        if payload is not None or cache.get(lock_key) is None:
+            return payload
+    return None
+
+
+def _book_info_cache_key(isbn):
+    return f"book-info:{isbn}"
+
+
+def cache_book_info(isbn, payload):
+    book_info_cache.set(isbn, payload)
+    cache.set(_book_info_cache_key(isbn), payload, settings.BOOK_INFO_CACHE_TTL)
+
+
+def stored_book_info(isbn):
+    """
+    Gets information about a book from the database, and caches it.
+
+    Fresh rows are returned as they are. Stale rows are returned too, but a
+    background prefetch is queued so later readers get up to date metadata.
+
+    Returns a payload shaped like the one of the Lambda function, including the
+    statusCode, or None if the book was never fetched
+    """
+    book = Book.objects.filter(isbn=isbn, fetched_at__isnull=False).first()
+    if book is None:
+        return None
+    if not book.is_fresh():
+        prefetch.enqueue(isbn)
+    payload = {"statusCode": 200, "body": book.info}
+    cache_book_info(isbn, payload)
+    return payload
+
+
+def fetch_book_info(isbn):
+    """
+    Gets information about a book from the Open Library API and stores it.
+
+    Raises CircuitOpenError without invoking the Lambda while lambda_breaker is
+    open, and ThrottledError while the upstream budget is short. The budgets
+    of the request are charged by get_book_info.
 
     Returns the payload of the Lambda function, including the statusCode
     """
-    lambda_client = boto3.client("lambda")
-    iam_resource = boto3.resource("iam")
-    wrapper = LambdaWrapper(lambda_client, iam_resource)
-    response = wrapper.invoke_function("scalestack-lambda", {"isbn": isbn})
-    if "FunctionError" in response:
+    check_breaker()
+    with throttling.charge(client=False):
+        payload = invoke_book_info(isbn=isbn)
+    if payload is None:
         logger.error("Couldn't get book info for ISBN %s.", isbn)
         return None
-    return json.loads(response["Payload"].read().decode("utf-8"))
+    if payload.get("statusCode") == 200:
+        store_book_info(isbn, payload["body"])
+        cache_book_info(isbn, payload)
+    elif payload.get("statusCode") == 404:
+        book_info_not_found.set(isbn, payload)
+    return payload
+
+
+def get_books_info(isbns):
+    """
+    Gets information about several books at once.
+
+    Books are served from the caches and the database like get_book_info does,
+    and the remaining ones are fetched with a single Lambda invocation.
+
+    Returns a dict of ISBN to payload, each including its statusCode
+    """
+    payloads = {}
+    not_found = {}
+    isbns = list(dict.fromkeys(isbns))
+    for isbn in isbns:
+        payload = book_info_cache.get(isbn)
+        if payload is not None:
+            payloads[isbn] = payload
+            continue
+        payload = _known_not_found(isbn)
+        if payload is not None:
+            not_found[isbn] = payload
+
+    missing = [isbn for isbn in isbns if isbn not in payloads and isbn not in not_found]
+    shared = cache.get_many([_book_info_cache_key(isbn) for isbn in missing])
+    for isbn in missing:
+        payload = shared.get(_book_info_cache_key(isbn))
+        if payload is not None:
+            book_info_cache.set(isbn, payload)
+            payloads[isbn] = payload
+    _count_book_info("hits", len(payloads))
+
+    missing = [isbn for isbn in missing if isbn not in payloads]
+    if missing:
+        _count_book_info("misses", len(missing))
+        books = Book.objects.filter(isbn__in=missing, fetched_at__isnull=False)
+        for book in books:
+            if not book.is_fresh():
+                prefetch.enqueue(book.isbn)
+            payloads[book.isbn] = {"statusCode": 200, "body": book.info}
+            cache_book_info(book.isbn, payloads[book.isbn])
+
+    missing = [isbn for isbn in missing if isbn not in payloads]
+    if missing:
+        payloads.update(fetch_books_info(missing))
+    payloads.update(not_found)
+    return {isbn: payloads[isbn] for isbn in isbns}
+
+
+def fetch_books_info(isbns):
+    """
+    Gets information about several books from the Open Library API with a single
+    Lambda invocation, and stores the ones that were found. While lambda_breaker
+    is open, the books are answered 503 without invoking the Lambda.
+
+    Only the books the budgets have tokens for are fetched, and the others are
+    answered 429. Raises ThrottledError without invoking the Lambda if there
+    are none.
+
+    Returns a dict of ISBN to payload, each including its statusCode
+    """
+    try:
+        check_breaker()
+        taken, throttled = throttling.take_some(len(isbns))
+        try:
+            payloads = _invoke_books_info(isbns[:taken])
+        except CircuitOpenError:
+            throttling.give_back(taken)
+            raise
+    except CircuitOpenError as e:
+        return dict.fromkeys(isbns, {"statusCode": 503, "body": {"error": str(e)}})
+    if throttled is not None:
+        payloads.update(
+            dict.fromkeys(
+                isbns[taken:], {"statusCode": 429, "body": {"error": str(throttled)}}
+            )
+        )
+    return payloads
+
+
+def _invoke_books_info(isbns):
+    payload = invoke_book_info(isbns=isbns)
+    if payload is None:
+        logger.error("Couldn't get book info for ISBNs %s.", ", ".join(isbns))
+        payload = {"statusCode": 500, "body": {"error": "Internal Server Error"}}
+    if payload.get("statusCode") != 200:
+        return dict.fromkeys(isbns, payload)
+
+    missing = {"statusCode": 500, "body": {"error": "Missing from the response"}}
+    payloads = {isbn: payload["body"].get(isbn, missing) for isbn in isbns}
+    for isbn, book_payload in payloads.items():
+        if book_payload.get("statusCode") == 200:
+            store_book_info(isbn, book_payload["body"])
+            cache_book_info(isbn, book_payload)
+        elif book_payload.get("statusCode") == 404:
+            book_info_not_found.set(isbn, book_payload)
+    return payloads
+
+
+def invoke_book_info(**params):
+    """
+    Invokes the book info Lambda function with ``params``, on the backend picked
+    by BOOK_INFO_BACKEND, through lambda_breaker.
+
+    Invocations that raise, fail, answer a server error or are slow count
+    against the breaker, and while it's open this raises CircuitOpenError
+    without invoking the function. Callers charge the invocation to the budgets
+    beforehand.
+
+    Returns the payload of the function, including the statusCode, or None if
+    the function failed
+    """
+    try:
+        lambda_breaker.allow()
+    except CircuitOpenError:
+        metrics.count_lambda_call("rejected", lambda_breaker.state)
+        raise
+    start = time.monotonic()
+    succeeded = False
+    try:
+        payload = get_book_info_backend().invoke(_lambda_event(**params))
+        succeeded = payload is not None and not _is_server_error(
+            payload, batch="isbns" in params
+        )
+        return payload
+    finally:
+        outcome = lambda_breaker.record(succeeded, time.monotonic() - start)
+        metrics.count_lambda_call(outcome, lambda_breaker.state)
+
+
+def check_breaker():
+    """
+    Raises CircuitOpenError if lambda_breaker wouldn't let an invocation
+    through, before the lookup is charged to any budget.
+    """
+    try:
+        lambda_breaker.check()
+    except CircuitOpenError:
+        metrics.count_lambda_call("rejected", lambda_breaker.state)
+        raise
+
+
+def _is_server_error(payload, batch):
+    if payload.get("statusCode", 500) >= 500:
+        return True
+    # Batches are answered 200 even when fetching each of their books failed.
+    if batch and payload["statusCode"] == 200 and payload["body"]:
+        return all(
+            book.get("statusCode", 500) >= 500 for book in payload["body"].values()
+        )
+    return False
+
+
+def _lambda_event(**params):
+    if settings.BOOK_INFO_FETCH_STRATEGY:
+        params["strategy"] = settings.BOOK_INFO_FETCH_STRATEGY
+    return params
+
+
+def store_book_info(isbn, info):
+    """
+    Stores fetched book info on its Book row. Failing to store it is logged but
+    doesn't fail the lookup, which can still be served from the payload.
+    """
+    if len(isbn) > Book._meta.get_field("isbn").max_length:
+        logger.warning("Not storing book info for ISBN %s, it is too long.", isbn)
+        return
+    description = info.get("description", "")
+    # Open Library returns some descriptions as {"type": ..., "value": ...}.
+    if isinstance(description, dict):
+        description = description.get("value", "")
+    try:
+        with transaction.atomic():
+            Book.objects.update_or_create(
+                isbn=isbn,
+                defaults={
+                    "title": info.get("title", ""),
+                    "author": info.get("author", ""),
+                    "publish_date": str(info.get("publish_date", ""))[:64],
+                    "description": description,
+                    "fetched_at": timezone.now(),
+                },
+            )
+    except DatabaseError:
+        logger.exception("Couldn't store book info for ISBN %s.", isbn)
+
+
+def create_lambda_client():
+    """
+    Creates a Lambda client with a connection pool sized for the worker threads
+    and timeouts that fail fast instead of hanging a worker.
+    """
+    # boto3 takes about a tenth of a second to import, which workers only pay
+    # when they first invoke the Lambda, not when they start.
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=settings.LAMBDA_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.LAMBDA_CONNECT_TIMEOUT,
+        read_timeout=settings.LAMBDA_READ_TIMEOUT,
+        tcp_keepalive=True,
+        retries={"max_attempts": settings.LAMBDA_MAX_ATTEMPTS, "mode": "standard"},
+    )
+    return boto3.client(
+        "lambda", endpoint_url=settings.LAMBDA_ENDPOINT_URL, config=config
+    )
+
+
+class LambdaError(Exception):
+    """Raised when the Lambda couldn't be invoked."""
 
 
 class LambdaWrapper:
-    def __init__(self, lambda_client, iam_resource):
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, lambda_client):
         self.lambda_client = lambda_client
-        self.iam_resource = iam_resource
+
+    @classmethod
+    def instance(cls):
+        """
+        Returns the process-wide wrapper, so credentials, endpoint resolution and
+        pooled connections are reused across requests.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(create_lambda_client())
+        return cls._instance
+
+    @classmethod
+    def reset(cls):
+        """
+        Drops the process-wide wrapper. Called in forked children, which must not
+        share the parent's connections.
+        """
+        cls._instance = None
+        cls._instance_lock = threading.Lock()
 
     def invoke_function(self, function_name, function_params, get_log=False):
         """
@@ -37,15 +496,112 @@ class LambdaWrapper:
         :param get_log: When true, the last 4 KB of the execution log are included in
                         the response.
         :return: The response from the function invocation.
+        :raises LambdaError: If the function couldn't be invoked.
         """
+        from botocore.exceptions import ClientError
+
         try:
-            response = self.lambda_client.invoke(
-                FunctionName=function_name,
-                Payload=json.dumps(function_params),
-                LogType="Tail" if get_log else "None",
-            )
+            with metrics.timed("lambda"):
+                response = self.lambda_client.invoke(
+                    FunctionName=function_name,
+                    Payload=json.dumps(function_params),
+                    LogType="Tail" if get_log else "None",
+                )
             logger.info("Invoked function %s.", function_name)
-        except ClientError:
+        except ClientError as e:
             logger.exception("Couldn't invoke function %s.", function_name)
-            raise
+            raise LambdaError(str(e)) from e
         return response
+
+
+class LambdaBackend:
+    """Invokes the book info function deployed to Lambda."""
+
+    def invoke(self, event):
+        response = LambdaWrapper.instance().invoke_function(
+            settings.LAMBDA_FUNCTION_NAME, event
+        )
+        if "FunctionError" in response:
+            return None
+        return json.loads(response["Payload"].read().decode("utf-8"))
+
+
+class LocalBackend:
+    """
+    Runs the book info function in the worker, without the hop through Lambda.
+
+    The function is loaded from ``function_dir`` and runs on an event loop
+    thread of its own, so its Open Library session and author and work cache
+    are kept across lookups, like in a warm Lambda container.
+    """
+
+    def __init__(self, function_dir):
+        self.function = load_function(function_dir)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="book-info-loop", daemon=True
+        )
+        self.thread.start()
+
+    def invoke(self, event):
+        with metrics.timed("lambda"):
+            payload = asyncio.run_coroutine_threadsafe(
+                self.function.async_handler(event, None), self.loop
+            ).result()
+        # Payloads come back through JSON, like the Lambda's, so they don't share
+        # objects with the function's cache.
+        return json.loads(json.dumps(payload))
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(
+            self.function.reset_session(), self.loop
+        ).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def load_function(function_dir):
+    """
+    Loads lambda_function.py from ``function_dir``, as a module of its own so
+    it shares no session or cache with other imports of it.
+    """
+    path = Path(function_dir) / "lambda_function.py"
+    if not path.is_file():
+        raise ImproperlyConfigured(
+            f"BOOK_INFO_BACKEND is local, but {path} doesn't exist."
+        )
+    spec = importlib.util.spec_from_file_location("book_info_function", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+BOOK_INFO_BACKENDS = {
+    "lambda": LambdaBackend,
+    "local": lambda: LocalBackend(settings.BOOK_INFO_FUNCTION_DIR),
+}
+
+# Created on first use, and per process.
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_book_info_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = BOOK_INFO_BACKENDS[settings.BOOK_INFO_BACKEND]()
+    return _backend
+
+
+def _reset_backend():
+    global _backend, _backend_lock
+    _backend = None
+    _backend_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=LambdaWrapper.reset)
+os.register_at_fork(after_in_child=_reset_executor)
+os.register_at_fork(after_in_child=_reset_backend)
@@ -0,0 +1,224 @@
+import threading
+from datetime import datetime, time, timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, Min
+from django.db.models.functions import TruncDate
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Book, BookStats, Review
+from .trending import count_reviews, recount_reviews
+
+
+def record_reviews(book, reviews):
+    """
+    Adds newly created ``reviews`` of ``book`` to its stats.
+
+    Must be called in the transaction that created the reviews. The stats row is
+    locked until it commits, so concurrent reviews of a book are counted in turn.
+    """
+    if not reviews:
+        return
+    with transaction.atomic():
+        stats, _ = BookStats.objects.select_for_update().get_or_create(book=book)
+        created = [review.created_at for review in reviews]
+        if stats.first_review_at is not None:
+            created.append(stats.first_review_at)
+        if stats.last_review_at is not None:
+            created.append(stats.last_review_at)
+        stats.review_count += len(reviews)
+        stats.first_review_at = min(created)
+        stats.last_review_at = max(created)
+        for review in reviews:
+            day = timezone.localdate(review.created_at).isoformat()
+            stats.daily_counts[day] = stats.daily_counts.get(day, 0) + 1
+        stats.daily_counts = _trim_daily_counts(stats.daily_counts)
+        stats.version += 1
+        stats.changed_at = timezone.now()
+        stats.save()
+        count_reviews(book, reviews)
+        _publish_versions([(book.isbn, stats.version, stats.changed_at)])
+
+
+def get_book_version(isbn):
+    """
+    Returns the version of the reviews of the book with ``isbn``, and when they
+    last changed, as (version, changed_at). Books never reviewed are at version
+    0.
+
+    Versions are read from the cache, where writers publish them as they
+    commit, so checking whether reviews changed rarely touches the database.
+    With BOOK_VERSION_CACHE_TTL at 0, as when the cache isn't shared by the
+    workers, they're read from the database.
+    """
+    if not settings.BOOK_VERSION_CACHE_TTL:
+        return _read_book_version(isbn)
+    key = _version_cache_key(isbn)
+    version = cache.get(key)
+    if version is None:
+        version = _read_book_version(isbn)
+        # Doesn't overwrite a version a writer published since it was read.
+        cache.add(key, version, settings.BOOK_VERSION_CACHE_TTL)
+    return version
+
+
+def _read_book_version(isbn):
+    return BookStats.objects.filter(book__isbn=isbn).values_list(
+        "version", "changed_at"
+    ).first() or (0, None)
+
+
+def _version_cache_key(isbn):
+    return f"book-version:{isbn}"
+
+
+def _publish_versions(versions):
+    """Caches ``versions`` of (isbn, version, changed_at) once they commit."""
+    if not settings.BOOK_VERSION_CACHE_TTL:
+        return
+    transaction.on_commit(
+        partial(
+            cache.set_many,
+            {
+                _version_cache_key(isbn): (version, changed_at)
+                for isbn, version, changed_at in versions
+            },
+            settings.BOOK_VERSION_CACHE_TTL,
+        )
+    )
+
+
+def recompute_book_stats(book_ids):
+    """
+    Recomputes the stats of the books with ``book_ids`` from their reviews, and
+    their review counts for trending books.
+
+    The versions of books whose stored stats differed are bumped, as they had
+    reviews added or deleted behind the stats' back. Returns their number.
+    """
+    book_ids = list(book_ids)
+    with transaction.atomic():
+        # Locking first means reviews committed meanwhile are in the counts below.
+        stored = BookStats.objects.select_for_update().in_bulk(book_ids)
+        computed = {
+            book_id: BookStats(book_id=book_id, daily_counts={}) for book_id in book_ids
+        }
+        totals = (
+            Review.objects.filter(book_id__in=book_ids)
+            .values("book_id")
+            .annotate(
+                count=Count("id"), first=Min("created_at"), last=Max("created_at")
+            )
+        )
+        for row in totals:
+            stats = computed[row["book_id"]]
+            stats.review_count = row["count"]
+            stats.first_review_at = row["first"]
+            stats.last_review_at = row["last"]
+
+        midnight = timezone.make_aware(datetime.combine(_activity_start(), time.min))
+        days = (
+            Review.objects.filter(book_id__in=book_ids, created_at__gte=midnight)
+            .annotate(day=TruncDate("created_at"))
+            .values("book_id", "day")
+            .annotate(count=Count("id"))
+        )
+        for row in days:
+            stats = computed[row["book_id"]]
+            stats.daily_counts[row["day"].isoformat()] = row["count"]
+
+        recount_reviews(book_ids)
+        BookStats.objects.bulk_create(
+            computed.values(),
+            update_conflicts=True,
+            unique_fields=["book"],
+            update_fields=[
+                "review_count",
+                "first_review_at",
+                "last_review_at",
+                "daily_counts",
+            ],
+        )
+
+        drifted = [
+            book_id
+            for book_id, stats in computed.items()
+            if _stats_values(stored.get(book_id, BookStats())) != _stats_values(stats)
+        ]
+        if drifted:
+            _bump_versions(drifted)
+    return len(drifted)
+
+
+def _bump_versions(book_ids):
+    BookStats.objects.filter(book_id__in=book_ids).update(
+        version=F("version") + 1, changed_at=timezone.now()
+    )
+    _publish_versions(
+        BookStats.objects.filter(book_id__in=book_ids).values_list(
+            "book__isbn", "version", "changed_at"
+        )
+    )
+
+
+def _stats_values(stats):
+    return (
+        stats.review_count,
+        stats.first_review_at,
+        stats.last_review_at,
+        _trim_daily_counts(stats.daily_counts),
+    )
+
+
+def _activity_start():
+    return timezone.localdate() - timedelta(days=settings.BOOK_STATS_ACTIVITY_DAYS - 1)
+
+
+def _trim_daily_counts(daily_counts):
+    since = _activity_start().isoformat()
+    return {day: count for day, count in sorted(daily_counts.items()) if day >= since}
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, origin=None, **kwargs):
+    # Deleting a book deletes its stats along with its reviews.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is Book:
+        return
+    # The first and last review can't be derived from the deleted ones, so the
+    # stats of their books are recomputed, once the delete commits and with a
+    # single recompute for all the reviews it deleted. The counts changed, so
+    # this bumps the versions too.
+    _deleted_review_books().add(instance.book_id)
+    # Every review registers the callback, the first to run recomputes them all.
+    transaction.on_commit(_recompute_deleted_review_books)
+
+
+# Books of the reviews deleted by the transactions of each thread, until their
+# stats are recomputed. Books of deletes that rolled back are recomputed along
+# with the next ones, which changes nothing.
+_deleted = threading.local()
+
+
+def _deleted_review_books():
+    if not hasattr(_deleted, "book_ids"):
+        _deleted.book_ids = set()
+    return _deleted.book_ids
+
+
+def _recompute_deleted_review_books():
+    pending = _deleted_review_books()
+    if not pending:
+        return
+    book_ids = set(pending)
+    pending.clear()
+    # Books deleted since their reviews were have no stats to recompute.
+    recompute_book_stats(
+        Book.objects.filter(pk__in=book_ids).values_list("pk", flat=True)
+    )
@@ -0,0 +1,13 @@
+from celery import shared_task
+
+from . import prefetch, trending
+
+
+@shared_task(ignore_result=True)
+def prefetch_book_info(isbn):
+    prefetch.prefetch(isbn)
+
+
+@shared_task(ignore_result=True)
+def compact_review_counts():
+    trending.compact_review_counts()
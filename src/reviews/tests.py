@@ -1,14 +1,69 @@
+import asyncio
+import csv
+import gzip
 import json
+import os
 import pytest
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from rest_framework.test import APIClient
 from rest_framework import status
-from reviews.models import Book, Review
+from rest_framework_simplejwt.tokens import AccessToken
+from reviews import metrics, prefetch, services, throttling, trending
+from reviews.authentication import is_user_active, user_states
+from reviews.breaker import CircuitBreaker, CircuitOpenError
+from reviews.cache import LRUCache, SingleFlight
+from reviews.isbn import InvalidISBN, normalize_isbn, to_isbn_13
+from reviews.models import Book, BookStats, Review, ReviewCount
+from reviews.serializers import (
+    ClaimsTokenObtainPairSerializer,
+    ReviewListSerializer,
+    ReviewSerializer,
+)
+from reviews.search import search_reviews
+from reviews.stats import get_book_version, record_reviews
+from reviews.views import GetBookInformationView, GetBooksInformationView
+from django.apps import apps
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connection, connections
+from django.db.models import Count, Sum
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta
+from importlib import import_module
+from io import StringIO
 
 from unittest.mock import patch, Mock
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    cache.clear()
+    services.book_info_cache.clear()
+    services.book_info_not_found.clear()
+    services.book_info_cache_stats.reset()
+    services.lambda_breaker.reset()
+    user_states.clear()
+
+
+@pytest.fixture(autouse=True)
+def prefetched(monkeypatch):
+    # Prefetches would fetch book info on threads of their own, record them.
+    backend = Mock()
+    monkeypatch.setattr(prefetch, "get_backend", lambda: backend)
+    return backend.submit
+
+
 @pytest.fixture(scope="session")
 def test_user(django_db_setup, django_db_blocker):
     with django_db_blocker.unblock():
@@ -29,12 +84,38 @@ def authenticated_client(api_client, test_user):
 
 @pytest.fixture
 def create_book():
-    def _create_book(isbn="1234567890123"):
+    def _create_book(isbn="9780141439587"):
         return Book.objects.create(isbn=isbn)
 
     return _create_book
 
 
+@pytest.fixture
+def mock_lambda_client():
+    services.LambdaWrapper.reset()
+    with patch("boto3.client") as mock_client:
+        yield mock_client
+    services.LambdaWrapper.reset()
+
+
+@pytest.fixture
+def run_blocking_inline(monkeypatch):
+    # The book info views hand lookups to threads of their own, which wouldn't
+    # see the test transaction. Run them on the test's thread instead.
+    async def run_blocking(fn, *args):
+        return await sync_to_async(fn)(*args)
+
+    monkeypatch.setattr(services, "run_blocking", run_blocking)
+
+
+def lambda_response(payload):
+    """Builds a Lambda invoke response returning ``payload``."""
+    return {
+        "StatusCode": 200,
+        "Payload": Mock(read=Mock(return_value=json.dumps(payload).encode("utf-8"))),
+    }
+
+
 @pytest.mark.django_db
 class TestUserAPI:
     def test_user_registration(self, api_client):
@@ -80,6 +161,27 @@ class TestBookReviewAPI:
         assert response.status_code == status.HTTP_201_CREATED
         assert Review.objects.filter(book__isbn=review_data["isbn"]).exists()
 
+    def test_add_review_by_isbn_10(self, authenticated_client, review_data):
+        review_data["isbn"] = "0-14-143958-0"
+
+        url = reverse("add_review")
+        response = authenticated_client.post(url, review_data)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["book"] == {"isbn": "9780141439587"}
+
+    def test_add_review_invalid_isbn(
+        self, authenticated_client, review_data, django_assert_num_queries
+    ):
+        review_data["isbn"] = "9780141439588"
+
+        url = reverse("add_review")
+        with django_assert_num_queries(0):
+            response = authenticated_client.post(url, review_data)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "isbn" in response.data
+
     def test_add_review_unauthenticated(self, api_client, review_data):
         url = reverse("add_review")
         response = api_client.post(url, review_data)
@@ -95,8 +197,8 @@ class TestBookReviewAPI:
             Review.objects.create(
                 book=book,
                 user=test_user,
-                title=f"Review {i+1}",
-                comment=f"Comment {i+1}",
+                title=f"Review {i + 1}",
+                comment=f"Comment {i + 1}",
             )
 
         url = reverse("get_book_reviews", kwargs={"isbn": book.isbn})
@@ -105,6 +207,85 @@ class TestBookReviewAPI:
         assert response.status_code == status.HTTP_200_OK
         assert len(response.data["results"]) == expected_count
 
+    def test_get_reviews_by_cursor(self, authenticated_client, test_user, create_book):
+        book = create_book()
+        for i in range(5):
+            Review.objects.create(
+                book=book, user=test_user, title=f"Review {i}", comment="Comment"
+            )
+
+        url = reverse("get_book_reviews", kwargs={"isbn": book.isbn})
+        titles = []
+        with CaptureQueriesContext(connection) as queries:
+            # The next links carry the cursor and the page size.
+            response = authenticated_client.get(url, {"page_size": 2})
+            for _ in range(5):
+                assert response.status_code == status.HTTP_200_OK
+                assert "count" not in response.data
+                titles += [review["title"] for review in response.data["results"]]
+                if response.data["next"] is None:
+                    break
+                response = authenticated_client.get(response.data["next"])
+
+        assert titles == [f"Review {i}" for i in range(5)]
+        assert not any("COUNT(" in query["sql"] for query in queries)
+
+    def test_get_reviews_by_page(self, authenticated_client, test_user, create_book):
+        book = create_book()
+        for i in range(5):
+            Review.objects.create(
+                book=book, user=test_user, title=f"Review {i}", comment="Comment"
+            )
+
+        url = reverse("get_book_reviews", kwargs={"isbn": book.isbn})
+        response = authenticated_client.get(url, {"page": 2, "page_size": 2})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["count"] == 5
+        assert [review["title"] for review in response.data["results"]] == [
+            "Review 2",
+            "Review 3",
+        ]
+
+    @pytest.fixture
+    def many_reviews(self, create_book):
+        book = create_book()
+        users = User.objects.bulk_create(
+            User(username=f"reviewer{i}", password="x") for i in range(10)
+        )
+        Review.objects.bulk_create(
+            Review(book=book, user=users[i % 10], title=f"Review {i}", comment="Text")
+            for i in range(100)
+        )
+        return book
+
+    def test_get_reviews_query_count(
+        self, authenticated_client, many_reviews, django_assert_num_queries, settings
+    ):
+        url = reverse("get_book_reviews", kwargs={"isbn": many_reviews.isbn})
+        # The book's version is cached, as it is once the book was listed once
+        # with a shared cache.
+        settings.BOOK_VERSION_CACHE_TTL = 3600
+        get_book_version(many_reviews.isbn)
+
+        with django_assert_num_queries(1):
+            response = authenticated_client.get(url, {"page_size": 100})
+        assert len(response.data["results"]) == 100
+
+        # Page number pagination adds its count query.
+        with django_assert_num_queries(2):
+            authenticated_client.get(url, {"page": 1, "page_size": 100})
+
+    def test_review_list_serializer_matches_review_serializer(self, many_reviews):
+        reviews = Review.objects.filter(book=many_reviews).select_related(
+            "user", "book"
+        )
+        rows = reviews.values(*ReviewListSerializer.values_fields)
+
+        assert ReviewListSerializer(rows, many=True).data == (
+            ReviewSerializer(reviews, many=True).data
+        )
+
     def test_get_reviews_unauthenticated(self, api_client, create_book):
         book = create_book()
         url = reverse("get_book_reviews", kwargs={"isbn": book.isbn})
@@ -113,83 +294,2362 @@ class TestBookReviewAPI:
 
 
 @pytest.mark.django_db
-class TestBookInformationAPI:
+class TestReviewListCaching:
+    @pytest.fixture(autouse=True)
+    def shared_cache(self, settings):
+        # As with REDIS_URL set, versions are cached only in a shared cache.
+        settings.BOOK_VERSION_CACHE_TTL = 3600
+
     @pytest.fixture
-    def mock_lambda_client(self):
-        with patch("boto3.client") as mock_client:
-            yield mock_client
+    def book(self, test_user, create_book, django_capture_on_commit_callbacks):
+        book = create_book()
+        with django_capture_on_commit_callbacks(execute=True):
+            self.add_review(book, test_user)
+        return book
 
-    def test_get_book_information_success(
-        self, authenticated_client, mock_lambda_client
-    ):
-        mock_lambda_response = {
-            "StatusCode": 200,
-            "Payload": Mock(
-                read=Mock(
-                    return_value=json.dumps(
-                        {
-                            "statusCode": 200,
-                            "body": {
-                                "title": "Test Book",
-                                "author": "Test Author",
-                                "publish_date": 2020,
-                                "description": "Unknown",
-                            },
-                        }
-                    ).encode("utf-8")
-                )
-            ),
-        }
-        mock_lambda_client.return_value.invoke.return_value = mock_lambda_response
+    def add_review(self, book, user):
+        review = Review.objects.create(
+            book=book, user=user, title="Review", comment="Text"
+        )
+        record_reviews(book, [review])
+        return review
 
-        url = reverse("get_book_info")
-        response = authenticated_client.get(url, {"isbn": "1234567890"})
+    def get(self, client, book, **headers):
+        url = reverse("get_book_reviews", kwargs={"isbn": book.isbn})
+        return client.get(url, {"page_size": 5}, headers=headers)
 
+    def test_not_modified(self, authenticated_client, book, django_assert_num_queries):
+        response = self.get(authenticated_client, book)
         assert response.status_code == status.HTTP_200_OK
-        assert response.data == {
-            "title": "Test Book",
-            "author": "Test Author",
-            "publish_date": 2020,
-            "description": "Unknown",
-        }
+        assert response["Cache-Control"] == "private, no-cache"
 
-    def test_get_book_information_not_found(
-        self, authenticated_client, mock_lambda_client
+        with django_assert_num_queries(0):
+            revalidated = self.get(
+                authenticated_client, book, if_none_match=response["ETag"]
+            )
+        assert revalidated.status_code == status.HTTP_304_NOT_MODIFIED
+        assert revalidated["ETag"] == response["ETag"]
+
+        revalidated = self.get(
+            authenticated_client, book, if_modified_since=response["Last-Modified"]
+        )
+        assert revalidated.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_pages_are_cached(
+        self, authenticated_client, book, django_assert_num_queries
     ):
-        mock_lambda_response = {
-            "StatusCode": 200,
-            "Payload": Mock(
-                read=Mock(
-                    return_value=json.dumps(
-                        {"statusCode": 404, "body": {"error": "Book not found"}}
-                    ).encode("utf-8")
-                )
-            ),
-        }
-        mock_lambda_client.return_value.invoke.return_value = mock_lambda_response
+        response = self.get(authenticated_client, book)
 
-        url = reverse("get_book_info")
-        response = authenticated_client.get(url, {"isbn": "0000000000"})
+        with django_assert_num_queries(0):
+            cached = self.get(authenticated_client, book)
 
-        assert response.status_code == status.HTTP_404_NOT_FOUND
-        assert response.data == {"error": "Book not found"}
+        assert cached.status_code == status.HTTP_200_OK
+        assert cached.data == response.data
 
-    def test_get_book_information_no_isbn(self, authenticated_client):
-        url = reverse("get_book_info")
-        response = authenticated_client.get(url)
+    def test_pages_have_their_own_etag(self, authenticated_client, book):
+        response = self.get(authenticated_client, book)
+        url = reverse("get_book_reviews", kwargs={"isbn": book.isbn})
 
-        assert response.status_code == status.HTTP_400_BAD_REQUEST
-        assert "error" in response.data
+        other_page = authenticated_client.get(url, {"page_size": 1})
 
-    def test_get_book_information_lambda_error(
-        self, authenticated_client, mock_lambda_client
+        assert other_page["ETag"] != response["ETag"]
+
+    def test_new_reviews_change_the_version(
+        self, authenticated_client, test_user, book, django_capture_on_commit_callbacks
     ):
-        mock_lambda_client.return_value.invoke.side_effect = Exception(
-            "Lambda invocation failed"
+        response = self.get(authenticated_client, book)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            self.add_review(book, test_user)
+        updated = self.get(authenticated_client, book, if_none_match=response["ETag"])
+
+        assert updated.status_code == status.HTTP_200_OK
+        assert updated["ETag"] != response["ETag"]
+        assert len(updated.data["results"]) == 2
+
+    def test_deleted_reviews_change_the_version(
+        self, authenticated_client, book, django_capture_on_commit_callbacks
+    ):
+        response = self.get(authenticated_client, book)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Review.objects.filter(book=book).delete()
+        updated = self.get(authenticated_client, book, if_none_match=response["ETag"])
+
+        assert updated.status_code == status.HTTP_200_OK
+        assert updated.data["results"] == []
+
+    def test_versions_are_read_from_the_database_without_a_shared_cache(
+        self, authenticated_client, book, settings, django_assert_num_queries
+    ):
+        settings.BOOK_VERSION_CACHE_TTL = 0
+        version = get_book_version(book.isbn)
+        # What another worker's own cache would have kept.
+        cache.set(f"book-version:{book.isbn}", (version[0] - 1, None))
+        response = self.get(authenticated_client, book)
+
+        with django_assert_num_queries(1):
+            revalidated = self.get(
+                authenticated_client, book, if_none_match=response["ETag"]
+            )
+
+        assert revalidated.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response["ETag"].startswith(f'"{version[0]}-')
+
+    def test_repair_changes_the_version_of_drifted_books(
+        self, test_user, book, django_capture_on_commit_callbacks
+    ):
+        version = get_book_version(book.isbn)
+        Review.objects.create(book=book, user=test_user, title="Review", comment="")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            call_command("repair_book_stats", stdout=StringIO())
+
+        assert get_book_version(book.isbn)[0] == version[0] + 1
+
+
+@pytest.mark.django_db
+class TestClaimsAuthentication:
+    def token_client(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        return client
+
+    def claims_client(self, user):
+        token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+        return self.token_client(token)
+
+    def list_reviews(self, client, book):
+        url = reverse("get_book_reviews", kwargs={"isbn": book.isbn})
+        return client.get(url)
+
+    def test_documented(self, api_client):
+        response = api_client.get(reverse("schema"), {"format": "json"})
+
+        operation = response.json()["paths"]["/api/reviews/{isbn}/"]["get"]
+        assert {"jwtClaimsAuth": []} in operation["security"]
+
+    def test_issued_tokens_carry_claims(self, api_client, test_user):
+        url = reverse("token_obtain_pair")
+        response = api_client.post(
+            url, {"username": "testuser", "password": "testpass123"}
         )
 
-        url = reverse("get_book_info")
-        response = authenticated_client.get(url, {"isbn": "1234567890"})
+        token = AccessToken(response.data["access"])
+        assert token["username"] == "testuser"
+        assert token["is_active"] is True
 
-        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
-        assert "error" in response.data
+    def test_reads_without_loading_the_user(
+        self, test_user, create_book, django_assert_num_queries, settings
+    ):
+        settings.BOOK_VERSION_CACHE_TTL = 3600
+        book = create_book()
+        client = self.claims_client(test_user)
+        assert self.list_reviews(client, book).status_code == status.HTTP_200_OK
+
+        # The user state, the book version and the page are all cached now.
+        with django_assert_num_queries(0):
+            response = self.list_reviews(client, book)
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_deactivated_users_are_rejected(self, create_book):
+        user = User.objects.create(username="reader")
+        client = self.claims_client(user)
+        book = create_book()
+        assert self.list_reviews(client, book).status_code == status.HTTP_200_OK
+
+        user.is_active = False
+        user.save()
+
+        response = self.list_reviews(client, book)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_deleted_users_are_rejected(self, create_book):
+        user = User.objects.create(username="reader")
+        client = self.claims_client(user)
+        user.delete()
+
+        response = self.list_reviews(client, create_book())
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_user_states_are_cached(self, test_user, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            assert is_user_active(test_user.id)
+            assert is_user_active(test_user.id)
+
+    def test_tokens_without_claims_load_the_user(self, test_user, create_book):
+        client = self.token_client(AccessToken.for_user(test_user))
+
+        response = self.list_reviews(client, create_book())
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_write_views_load_the_user(self, test_user, create_book):
+        client = self.claims_client(test_user)
+
+        response = client.post(
+            reverse("add_review"),
+            {"isbn": create_book().isbn, "title": "Review", "comment": "Text"},
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Review.objects.get().user == test_user
+
+
+@pytest.mark.django_db
+class TestBulkReviewAPI:
+    @pytest.fixture
+    def books(self, create_book):
+        return [create_book("9780306406157"), create_book("9780140449136")]
+
+    def rows(self, books, count):
+        return [
+            {"isbn": books[i % 2].isbn, "title": f"Review {i}", "comment": "Text"}
+            for i in range(count)
+        ]
+
+    def test_json_array(self, authenticated_client, books):
+        url = reverse("add_reviews_bulk")
+        response = authenticated_client.post(url, self.rows(books, 5), format="json")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data == {"created": 5, "errors": []}
+        assert Review.objects.filter(book=books[0]).count() == 3
+        assert BookStats.objects.get(book=books[0]).review_count == 3
+        assert BookStats.objects.get(book=books[1]).review_count == 2
+
+    def test_ndjson(self, authenticated_client, books):
+        body = "\n".join(json.dumps(row) for row in self.rows(books, 3)) + "\n\n"
+
+        url = reverse("add_reviews_bulk")
+        response = authenticated_client.post(
+            url, body, content_type="application/x-ndjson"
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Review.objects.count() == 3
+
+    def test_invalid_ndjson(self, authenticated_client, books):
+        body = json.dumps(self.rows(books, 1)[0]) + "\n{not json\n"
+
+        url = reverse("add_reviews_bulk")
+        response = authenticated_client.post(
+            url, body, content_type="application/x-ndjson"
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "line 2" in response.data["detail"]
+        assert not Review.objects.exists()
+
+    def test_reports_row_errors(self, authenticated_client, books):
+        rows = self.rows(books, 4)
+        rows[1]["isbn"] = "9780000000002"
+        del rows[2]["title"]
+        rows.append("not a review")
+
+        url = reverse("add_reviews_bulk")
+        response = authenticated_client.post(url, rows, format="json")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["created"] == 2
+        assert [error["index"] for error in response.data["errors"]] == [1, 2, 4]
+        assert "isbn" in response.data["errors"][0]["errors"]
+        assert "title" in response.data["errors"][1]["errors"]
+        assert Review.objects.count() == 2
+
+    def test_nothing_created(self, authenticated_client, books):
+        url = reverse("add_reviews_bulk")
+        response = authenticated_client.post(
+            url,
+            [{"isbn": "9780000000002", "title": "A", "comment": "B"}],
+            format="json",
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["created"] == 0
+
+    @pytest.mark.parametrize("body", [{}, []])
+    def test_requires_a_list(self, authenticated_client, body):
+        url = reverse("add_reviews_bulk")
+        response = authenticated_client.post(url, body, format="json")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_too_many_reviews(self, authenticated_client, books, settings):
+        settings.REVIEW_BULK_MAX_SIZE = 2
+
+        url = reverse("add_reviews_bulk")
+        response = authenticated_client.post(url, self.rows(books, 3), format="json")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not Review.objects.exists()
+
+    def test_resolves_books_once(self, authenticated_client, books, settings):
+        settings.REVIEW_BULK_CHUNK_SIZE = 10
+
+        url = reverse("add_reviews_bulk")
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.post(
+                url, self.rows(books, 50), format="json"
+            )
+
+        assert response.data["created"] == 50
+        book_queries = [q for q in queries if 'FROM "reviews_book"' in q["sql"]]
+        review_inserts = [
+            q for q in queries if q["sql"].startswith('INSERT INTO "reviews_review"')
+        ]
+        assert len(book_queries) == 1
+        assert len(review_inserts) == 5
+
+    def test_unauthenticated(self, api_client, books):
+        url = reverse("add_reviews_bulk")
+        response = api_client.post(url, self.rows(books, 1), format="json")
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+class TestExportReviewsAPI:
+    @pytest.fixture
+    def reviews(self, test_user, create_book):
+        books = [create_book("9780306406157"), create_book("9780140449136")]
+        other_user = User.objects.create(username="other")
+        return Review.objects.bulk_create(
+            Review(
+                book=books[i % 2],
+                user=test_user if i < 4 else other_user,
+                title=f"Review {i}",
+                comment="Text, with a comma",
+            )
+            for i in range(6)
+        )
+
+    def export(self, client, **params):
+        response = client.get(reverse("export_reviews"), params)
+        assert response.status_code == status.HTTP_200_OK
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def ndjson(self, client, **params):
+        return [json.loads(line) for line in self.export(client, **params).splitlines()]
+
+    def test_by_book(self, authenticated_client, reviews, settings):
+        # Small chunks, so the export spans several cursor fetches.
+        settings.REVIEW_EXPORT_CHUNK_SIZE = 2
+
+        exported = self.ndjson(authenticated_client, isbn="9780306406157")
+
+        expected = Review.objects.filter(book__isbn="9780306406157").order_by(
+            "created_at", "id"
+        )
+        assert exported == ReviewSerializer(expected, many=True).data
+
+    def test_by_user_as_csv(self, authenticated_client, reviews):
+        exported = self.export(authenticated_client, user="other", output="csv")
+
+        rows = list(csv.reader(exported.splitlines()))
+        assert rows[0] == ["id", "user", "isbn", "title", "comment", "created_at"]
+        assert [row[3] for row in rows[1:]] == ["Review 4", "Review 5"]
+        assert rows[1][4] == "Text, with a comma"
+
+    def test_since(self, authenticated_client, reviews):
+        Review.objects.filter(id__in=[r.id for r in reviews[:3]]).update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+
+        exported = self.ndjson(authenticated_client, since=since)
+
+        assert [review["title"] for review in exported] == [
+            "Review 3",
+            "Review 4",
+            "Review 5",
+        ]
+
+    def test_resumes_after_watermark(self, authenticated_client, reviews):
+        exported = self.ndjson(authenticated_client, user="testuser")
+        last = exported[1]
+
+        resumed = self.ndjson(
+            authenticated_client,
+            user="testuser",
+            after=f"{last['created_at']},{last['id']}",
+        )
+
+        assert resumed == exported[2:]
+
+    def test_gzip(self, authenticated_client, reviews):
+        url = reverse("export_reviews")
+        response = authenticated_client.get(
+            url, {"isbn": "9780306406157"}, HTTP_ACCEPT_ENCODING="gzip, deflate"
+        )
+
+        assert response["Content-Encoding"] == "gzip"
+        body = gzip.decompress(b"".join(response.streaming_content))
+        assert body.decode("utf-8") == self.export(
+            authenticated_client, isbn="9780306406157"
+        )
+
+    @pytest.mark.django_db(transaction=True)
+    def test_streams_under_asgi(self, test_user, reviews, settings):
+        settings.REVIEW_EXPORT_CHUNK_SIZE = 2
+        token = ClaimsTokenObtainPairSerializer.get_token(test_user).access_token
+
+        async def export():
+            response = await AsyncClient().get(
+                reverse("export_reviews"),
+                {"user": "testuser"},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            assert response.status_code == status.HTTP_200_OK
+            # Django only streams async iterators under ASGI.
+            assert response.is_async
+            try:
+                return b"".join([block async for block in response.streaming_content])
+            finally:
+                # The connection of Django's sync thread, left open by tests.
+                await sync_to_async(connections.close_all)()
+
+        exported = asyncio.run(export()).decode("utf-8").splitlines()
+
+        assert [json.loads(line)["title"] for line in exported] == [
+            f"Review {i}" for i in range(4)
+        ]
+
+    @pytest.mark.parametrize(
+        "params", [{}, {"output": "csv"}, {"isbn": "9780306406157", "after": "x,1"}]
+    )
+    def test_invalid_params(self, authenticated_client, params):
+        response = authenticated_client.get(reverse("export_reviews"), params)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_unauthenticated(self, api_client):
+        response = api_client.get(reverse("export_reviews"), {"user": "testuser"})
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+class TestSearchReviewsAPI:
+    @pytest.fixture
+    def reviews(self, test_user, create_book):
+        books = [create_book("9780306406157"), create_book("9780140449136")]
+        return Review.objects.bulk_create(
+            [
+                Review(
+                    book=books[0],
+                    user=test_user,
+                    title="A thrilling mystery",
+                    comment="Kept me guessing",
+                ),
+                Review(
+                    book=books[1],
+                    user=test_user,
+                    title="Slow start",
+                    comment="The mystery only picks up late",
+                ),
+                Review(
+                    book=books[1],
+                    user=test_user,
+                    title="Lovely prose",
+                    comment="Nothing happens",
+                ),
+            ]
+        )
+
+    def search(self, client, **params):
+        response = client.get(reverse("search_reviews"), params)
+        assert response.status_code == status.HTTP_200_OK
+        return response.data
+
+    def test_search_vector_is_generated(self, reviews):
+        assert Review.objects.filter(search_vector="thrill").count() == 1
+
+    def test_ranks_title_matches_first(self, authenticated_client, reviews):
+        results = self.search(authenticated_client, q="mysteries")["results"]
+
+        assert [review["id"] for review in results] == [reviews[0].id, reviews[1].id]
+        assert results[0]["rank"] > results[1]["rank"]
+        assert results[0]["book"] == {"isbn": "9780306406157"}
+
+    def test_websearch_syntax(self, authenticated_client, reviews):
+        results = self.search(authenticated_client, q='"picks up" OR prose')["results"]
+
+        assert {review["id"] for review in results} == {reviews[1].id, reviews[2].id}
+
+    def test_by_book(self, authenticated_client, reviews):
+        results = self.search(authenticated_client, q="mystery", isbn="9780140449136")[
+            "results"
+        ]
+
+        assert [review["id"] for review in results] == [reviews[1].id]
+
+    def test_pages(self, authenticated_client, test_user, create_book):
+        book = create_book()
+        # Equal ranks, so pages are told apart by id alone.
+        reviews = Review.objects.bulk_create(
+            Review(book=book, user=test_user, title="Mystery", comment="")
+            for _ in range(5)
+        )
+
+        page = self.search(authenticated_client, q="mystery", page_size=2)
+        ids = [review["id"] for review in page["results"]]
+        for _ in range(len(reviews)):
+            if not page["next"]:
+                break
+            page = authenticated_client.get(page["next"]).data
+            ids += [review["id"] for review in page["results"]]
+
+        assert ids == sorted((review.id for review in reviews), reverse=True)
+
+    def test_missing_query(self, authenticated_client):
+        response = authenticated_client.get(reverse("search_reviews"))
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_invalid_cursor(self, authenticated_client, reviews):
+        response = authenticated_client.get(
+            reverse("search_reviews"), {"q": "mystery", "cursor": "not-a-cursor"}
+        )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_unauthenticated(self, api_client):
+        response = api_client.get(reverse("search_reviews"), {"q": "mystery"})
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_documented(self, api_client):
+        response = api_client.get(reverse("schema"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert "/api/reviews/search/" in response.content.decode()
+
+    def test_search_index_exists(self):
+        out = StringIO()
+
+        call_command("search_index", "--create", stdout=out)
+
+        assert "review_search_idx already exists" in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestSeedReviews:
+    def test_seeded_reviews_are_searchable(self):
+        call_command(
+            "seed_reviews",
+            books=5,
+            users=5,
+            reviews=200,
+            batch_size=150,
+            stdout=StringIO(),
+        )
+
+        assert Review.objects.count() == 200
+        assert BookStats.objects.aggregate(total=Sum("review_count"))["total"] == 200
+        assert search_reviews("book OR story").exists()
+
+    def test_popular_books_get_most_reviews(self):
+        call_command(
+            "seed_reviews", books=10, users=5, reviews=1000, skew=3, stdout=StringIO()
+        )
+
+        counts = list(
+            BookStats.objects.order_by("book__isbn").values_list(
+                "review_count", flat=True
+            )
+        )
+        # The first book gets about 46% of the reviews, the last about 3.5%.
+        assert counts[0] > 300
+        assert counts[0] > counts[-1] * 5
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("run_blocking_inline")
+class TestBookInformationAPI:
+    def test_get_book_information_success(
+        self, authenticated_client, mock_lambda_client
+    ):
+        mock_lambda_response = lambda_response(
+            {
+                "statusCode": 200,
+                "body": {
+                    "title": "Test Book",
+                    "author": "Test Author",
+                    "publish_date": 2020,
+                    "description": "Unknown",
+                },
+            }
+        )
+        mock_lambda_client.return_value.invoke.return_value = mock_lambda_response
+
+        url = reverse("get_book_info")
+        response = authenticated_client.get(url, {"isbn": "9780441172719"})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            "title": "Test Book",
+            "author": "Test Author",
+            "publish_date": 2020,
+            "description": "Unknown",
+        }
+
+    def test_get_book_information_not_found(
+        self, authenticated_client, mock_lambda_client
+    ):
+        mock_lambda_response = lambda_response(
+            {"statusCode": 404, "body": {"error": "Book not found"}}
+        )
+        mock_lambda_client.return_value.invoke.return_value = mock_lambda_response
+
+        url = reverse("get_book_info")
+        response = authenticated_client.get(url, {"isbn": "9780000000002"})
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.data == {"error": "Book not found"}
+
+    def test_get_book_information_no_isbn(self, authenticated_client):
+        url = reverse("get_book_info")
+        response = authenticated_client.get(url)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "error" in response.data
+
+    def test_get_book_information_lambda_error(
+        self, authenticated_client, mock_lambda_client
+    ):
+        mock_lambda_client.return_value.invoke.side_effect = Exception(
+            "Lambda invocation failed"
+        )
+
+        url = reverse("get_book_info")
+        response = authenticated_client.get(url, {"isbn": "9780441172719"})
+
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+        assert "error" in response.data
+
+    def test_get_book_information_persists_book(
+        self, authenticated_client, mock_lambda_client
+    ):
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {
+                "statusCode": 200,
+                "body": {
+                    "title": "Test Book",
+                    "author": "Test Author",
+                    "publish_date": "2020",
+                    "description": {"type": "/type/text", "value": "Nice"},
+                },
+            }
+        )
+
+        url = reverse("get_book_info")
+        authenticated_client.get(url, {"isbn": "9780441172719"})
+
+        book = Book.objects.get(isbn="9780441172719")
+        assert book.title == "Test Book"
+        assert book.author == "Test Author"
+        assert book.description == "Nice"
+        assert book.fetched_at is not None
+
+    def test_get_book_information_normalizes_isbn(
+        self, authenticated_client, mock_lambda_client
+    ):
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {"statusCode": 200, "body": {"title": "Test Book"}}
+        )
+
+        url = reverse("get_book_info")
+        for isbn in ("978-0-14-143958-7", "0141439580", "0-14-143958-0"):
+            response = authenticated_client.get(url, {"isbn": isbn})
+            assert response.status_code == status.HTTP_200_OK
+            assert response.data == {"title": "Test Book"}
+
+        invoke = mock_lambda_client.return_value.invoke
+        invoke.assert_called_once()
+        assert json.loads(invoke.call_args.kwargs["Payload"]) == {
+            "isbn": "9780141439587"
+        }
+        assert Book.objects.get().isbn == "9780141439587"
+
+    @pytest.mark.parametrize("isbn", ["9780141439588", "014143958X", "12345"])
+    def test_get_book_information_invalid_isbn(
+        self, authenticated_client, mock_lambda_client, isbn
+    ):
+        url = reverse("get_book_info")
+        response = authenticated_client.get(url, {"isbn": isbn})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert isbn in response.data["error"]
+        mock_lambda_client.return_value.invoke.assert_not_called()
+
+    def test_get_book_information_remembers_not_found(
+        self, authenticated_client, mock_lambda_client
+    ):
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {"statusCode": 404, "body": {"error": "Book not found"}}
+        )
+
+        url = reverse("get_book_info")
+        for _ in range(3):
+            response = authenticated_client.get(url, {"isbn": "9780000000002"})
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+
+        mock_lambda_client.return_value.invoke.assert_called_once()
+
+    def test_get_book_information_store_error(
+        self, authenticated_client, mock_lambda_client
+    ):
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {"statusCode": 200, "body": {"title": "Test Book"}}
+        )
+
+        url = reverse("get_book_info")
+        with patch.object(
+            Book.objects, "update_or_create", side_effect=DatabaseError("boom")
+        ):
+            response = authenticated_client.get(url, {"isbn": "9780441172719"})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {"title": "Test Book"}
+
+    def test_get_book_information_fresh_book(
+        self, authenticated_client, mock_lambda_client, create_book, prefetched
+    ):
+        book = create_book()
+        Book.objects.filter(pk=book.pk).update(
+            title="Stored Book",
+            author="Stored Author",
+            publish_date="1999",
+            description="Stored",
+            fetched_at=timezone.now(),
+        )
+
+        url = reverse("get_book_info")
+        response = authenticated_client.get(url, {"isbn": book.isbn})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            "title": "Stored Book",
+            "author": "Stored Author",
+            "publish_date": "1999",
+            "description": "Stored",
+        }
+        mock_lambda_client.return_value.invoke.assert_not_called()
+        prefetched.assert_not_called()
+
+    def test_get_book_information_stale_book(
+        self,
+        authenticated_client,
+        mock_lambda_client,
+        create_book,
+        settings,
+        prefetched,
+    ):
+        book = create_book()
+        Book.objects.filter(pk=book.pk).update(
+            title="Stored Book",
+            fetched_at=timezone.now() - settings.BOOK_INFO_TTL - timedelta(minutes=1),
+        )
+
+        url = reverse("get_book_info")
+        response = authenticated_client.get(url, {"isbn": book.isbn})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["title"] == "Stored Book"
+        mock_lambda_client.return_value.invoke.assert_not_called()
+        prefetched.assert_called_once_with(book.isbn)
+
+    def test_get_book_information_cached(
+        self, authenticated_client, mock_lambda_client
+    ):
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {"statusCode": 200, "body": {"title": "Test Book"}}
+        )
+
+        url = reverse("get_book_info")
+        for _ in range(3):
+            response = authenticated_client.get(url, {"isbn": "9780441172719"})
+            assert response.data == {"title": "Test Book"}
+
+        assert mock_lambda_client.return_value.invoke.call_count == 1
+        assert services.book_info_cache_stats.snapshot() == {
+            "hits": 2,
+            "misses": 1,
+            "coalesced": 0,
+        }
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("run_blocking_inline")
+class TestBooksInformationAPI:
+    def test_get_books_information(
+        self, authenticated_client, mock_lambda_client, create_book
+    ):
+        book = create_book()
+        Book.objects.filter(pk=book.pk).update(
+            title="Stored Book", fetched_at=timezone.now()
+        )
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {
+                "statusCode": 200,
+                "body": {
+                    "9780316769488": {"statusCode": 200, "body": {"title": "Fetched"}},
+                    "9780000000002": {
+                        "statusCode": 404,
+                        "body": {"error": "Book not found"},
+                    },
+                },
+            }
+        )
+
+        url = reverse("get_books_info")
+        response = authenticated_client.post(
+            url,
+            {"isbns": [book.isbn, "9780316769488", "9780000000002"]},
+            format="json",
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [
+            (result["isbn"], result["status"]) for result in response.data["results"]
+        ] == [(book.isbn, 200), ("9780316769488", 200), ("9780000000002", 404)]
+        assert response.data["results"][0]["body"]["title"] == "Stored Book"
+        assert response.data["results"][2]["body"] == {"error": "Book not found"}
+        invoke = mock_lambda_client.return_value.invoke
+        invoke.assert_called_once()
+        assert json.loads(invoke.call_args.kwargs["Payload"]) == {
+            "isbns": ["9780316769488", "9780000000002"]
+        }
+        assert Book.objects.get(isbn="9780316769488").title == "Fetched"
+
+    def test_get_books_information_fetch_strategy(
+        self, authenticated_client, mock_lambda_client, settings
+    ):
+        settings.BOOK_INFO_FETCH_STRATEGY = "bibkeys"
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {"statusCode": 200, "body": {}}
+        )
+
+        url = reverse("get_books_info")
+        response = authenticated_client.post(
+            url, {"isbns": ["9780316769488"]}, format="json"
+        )
+
+        assert response.data["results"][0]["status"] == 500
+        invoke = mock_lambda_client.return_value.invoke
+        assert json.loads(invoke.call_args.kwargs["Payload"]) == {
+            "isbns": ["9780316769488"],
+            "strategy": "bibkeys",
+        }
+
+    def test_get_books_information_remembers_not_found(
+        self, authenticated_client, mock_lambda_client
+    ):
+        invoke = mock_lambda_client.return_value.invoke
+        invoke.return_value = lambda_response(
+            {
+                "statusCode": 200,
+                "body": {
+                    "9780000000002": {
+                        "statusCode": 404,
+                        "body": {"error": "Book not found"},
+                    },
+                },
+            }
+        )
+        url = reverse("get_books_info")
+        authenticated_client.post(url, {"isbns": ["9780000000002"]}, format="json")
+
+        invoke.return_value = lambda_response(
+            {
+                "statusCode": 200,
+                "body": {
+                    "9780316769488": {"statusCode": 200, "body": {"title": "Fetched"}}
+                },
+            }
+        )
+        response = authenticated_client.post(
+            url, {"isbns": ["9780000000002", "0-316-76948-7"]}, format="json"
+        )
+
+        assert [
+            (result["isbn"], result["status"]) for result in response.data["results"]
+        ] == [("9780000000002", 404), ("9780316769488", 200)]
+        assert json.loads(invoke.call_args.kwargs["Payload"]) == {
+            "isbns": ["9780316769488"]
+        }
+
+    def test_get_books_information_lambda_error(
+        self, authenticated_client, mock_lambda_client
+    ):
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {"statusCode": 500, "body": {"error": "Open Library is down"}}
+        )
+
+        url = reverse("get_books_info")
+        response = authenticated_client.post(
+            url, {"isbns": ["9780316769488"]}, format="json"
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["results"] == [
+            {
+                "isbn": "9780316769488",
+                "status": 500,
+                "body": {"error": "Open Library is down"},
+            }
+        ]
+
+    @pytest.mark.parametrize(
+        "isbns",
+        [[], ["9780316769488"] * 51, "9780316769488", ["9780316769489"]],
+    )
+    def test_get_books_information_invalid(self, authenticated_client, isbns):
+        url = reverse("get_books_info")
+        response = authenticated_client.post(url, {"isbns": isbns}, format="json")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestBookStats:
+    def add_review(self, client, isbn, title="Review"):
+        url = reverse("add_review")
+        response = client.post(url, {"isbn": isbn, "title": title, "comment": "Text"})
+        assert response.status_code == status.HTTP_201_CREATED
+        return Review.objects.get(id=response.data["id"])
+
+    def test_adding_reviews_updates_stats(self, authenticated_client, create_book):
+        book = create_book()
+        first = self.add_review(authenticated_client, book.isbn)
+        last = self.add_review(authenticated_client, book.isbn)
+
+        url = reverse("get_book_stats", kwargs={"isbn": book.isbn})
+        response = authenticated_client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["isbn"] == book.isbn
+        assert response.data["review_count"] == 2
+        assert (
+            response.data["first_review_at"]
+            == (ReviewSerializer(first).data["created_at"])
+        )
+        assert (
+            response.data["last_review_at"]
+            == (ReviewSerializer(last).data["created_at"])
+        )
+        assert response.data["reviews_last_7_days"] == 2
+        assert response.data["reviews_last_30_days"] == 2
+
+    def test_book_without_reviews(self, authenticated_client, create_book):
+        book = create_book()
+
+        url = reverse("get_book_stats", kwargs={"isbn": book.isbn})
+        response = authenticated_client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["review_count"] == 0
+        assert response.data["last_review_at"] is None
+
+    def test_book_by_isbn_10(self, authenticated_client, create_book):
+        create_book("9780141439587")
+
+        url = reverse("get_book_stats", kwargs={"isbn": "0-14-143958-0"})
+        response = authenticated_client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["isbn"] == "9780141439587"
+
+    def test_invalid_isbn(self, authenticated_client):
+        url = reverse("get_book_stats", kwargs={"isbn": "9780141439588"})
+        response = authenticated_client.get(url)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "isbn" in response.data
+
+    def test_unknown_book(self, authenticated_client):
+        url = reverse("get_book_stats", kwargs={"isbn": "9780000000002"})
+        response = authenticated_client.get(url)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_unauthenticated(self, api_client, create_book):
+        url = reverse("get_book_stats", kwargs={"isbn": create_book().isbn})
+        response = api_client.get(url)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_batch(self, authenticated_client, create_book, django_assert_num_queries):
+        reviewed = create_book("9780306406157")
+        unreviewed = create_book("9780140449136")
+        self.add_review(authenticated_client, reviewed.isbn)
+        isbns = [unreviewed.isbn, "9780000000002", reviewed.isbn]
+
+        url = reverse("get_books_stats")
+        with django_assert_num_queries(1):
+            response = authenticated_client.post(url, {"isbns": isbns}, format="json")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [
+            (stats["isbn"], stats["review_count"]) for stats in response.data["results"]
+        ] == [(unreviewed.isbn, 0), (reviewed.isbn, 1)]
+
+    def test_deleting_reviews_recomputes_stats(
+        self, authenticated_client, create_book, django_capture_on_commit_callbacks
+    ):
+        book = create_book()
+        first = self.add_review(authenticated_client, book.isbn)
+        last = self.add_review(authenticated_client, book.isbn)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            last.delete()
+        book.stats.refresh_from_db()
+
+        assert book.stats.review_count == 1
+        assert book.stats.last_review_at == first.created_at
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Review.objects.filter(book=book).delete()
+        book.stats.refresh_from_db()
+
+        assert book.stats.review_count == 0
+        assert book.stats.first_review_at is None
+        assert book.stats.daily_counts == {}
+
+    def test_deletes_recompute_once(
+        self, test_user, create_book, django_capture_on_commit_callbacks
+    ):
+        books = [create_book(f"97800000000{i}{i}") for i in range(2)]
+
+        def delete(count):
+            for book in books:
+                Review.objects.bulk_create(
+                    Review(book=book, user=test_user, title="Review", comment="")
+                    for _ in range(count)
+                )
+            with CaptureQueriesContext(connection) as queries:
+                with django_capture_on_commit_callbacks(execute=True):
+                    for review in Review.objects.all():
+                        review.delete()
+            return len(queries)
+
+        # Each review costs its delete, the stats are recomputed once.
+        assert delete(10) - delete(5) == 2 * 5
+        assert BookStats.objects.filter(review_count=0).count() == 2
+
+    def test_deleting_book_deletes_stats(self, authenticated_client, create_book):
+        book = create_book()
+        self.add_review(authenticated_client, book.isbn)
+
+        book.delete()
+
+        assert not BookStats.objects.exists()
+
+    def test_recent_counts_only_cover_recent_days(self, create_book):
+        today = timezone.localdate()
+        stats = BookStats(
+            book=create_book(),
+            daily_counts={
+                (today - timedelta(days=days)).isoformat(): 1
+                for days in (0, 6, 7, 29, 30)
+            },
+        )
+
+        assert stats.recent_count(7) == 2
+        assert stats.recent_count(30) == 4
+
+    def test_repair_command(self, test_user, create_book):
+        books = [create_book("9780306406157"), create_book("9780140449136")]
+        # Bulk inserts skip the stats, and the repair puts them back.
+        Review.objects.bulk_create(
+            Review(book=books[i % 2], user=test_user, title="Review", comment="Text")
+            for i in range(5)
+        )
+        BookStats.objects.create(book=books[1], review_count=10)
+        out = StringIO()
+
+        call_command("repair_book_stats", "--chunk-size", "1", stdout=out)
+
+        assert "Recomputed the stats of 2 books, 2 had drifted." in out.getvalue()
+        counts = dict(BookStats.objects.values_list("book__isbn", "review_count"))
+        assert counts == {"9780306406157": 3, "9780140449136": 2}
+        assert BookStats.objects.get(book=books[0]).recent_count(7) == 3
+
+
+@pytest.mark.django_db
+class TestTrendingBooks:
+    @pytest.fixture
+    def seeded(self, settings):
+        # A month of the seeded year of reviews, in hours, so books get dozens.
+        settings.TRENDING_WINDOW = timedelta(days=30)
+        settings.TRENDING_SIZE = 5
+        call_command(
+            "seed_reviews", books=20, users=5, reviews=3000, skew=2, stdout=StringIO()
+        )
+        return list(Book.objects.order_by("isbn"))
+
+    def brute_force(self, since, size):
+        rows = (
+            Review.objects.filter(created_at__gte=since)
+            .values("book__isbn")
+            .annotate(review_count=Count("id"))
+            .order_by("-review_count", "book__isbn")[:size]
+        )
+        return [(row["book__isbn"], row["review_count"]) for row in rows]
+
+    def get_trending(self, client):
+        response = client.get(reverse("get_trending_books"))
+        assert response.status_code == status.HTTP_200_OK
+        return response.data
+
+    def ranking(self, trending):
+        return [(book["isbn"], book["review_count"]) for book in trending["results"]]
+
+    def test_matches_brute_force(self, authenticated_client, seeded):
+        trending_data = self.get_trending(authenticated_client)
+
+        since = datetime.fromisoformat(trending_data["since"])
+        assert since == trending.window_start()
+        assert len(trending_data["results"]) == 5
+        assert self.ranking(trending_data) == self.brute_force(since, 5)
+
+    def test_follows_added_and_deleted_reviews(
+        self, authenticated_client, seeded, django_capture_on_commit_callbacks
+    ):
+        ranking = self.brute_force(trending.window_start(), 20)
+        # Enough reviews for the least reviewed book to lead, some of them in bulk.
+        last = ranking[-1][0]
+        for _ in range(3):
+            authenticated_client.post(
+                reverse("add_review"), {"isbn": last, "title": "Up", "comment": "Text"}
+            )
+        rows = [{"isbn": last, "title": "Up", "comment": "Text"}] * ranking[0][1]
+        response = authenticated_client.post(
+            reverse("add_reviews_bulk"), rows, format="json"
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        with django_capture_on_commit_callbacks(execute=True):
+            Review.objects.filter(book__isbn=ranking[1][0]).latest(
+                "created_at"
+            ).delete()
+        cache.clear()
+
+        trending_data = self.get_trending(authenticated_client)
+
+        since = datetime.fromisoformat(trending_data["since"])
+        assert trending_data["results"][0]["isbn"] == last
+        assert self.ranking(trending_data) == self.brute_force(since, 5)
+
+    @pytest.mark.parametrize(
+        "window, bucket",
+        [
+            (timedelta(hours=24), timedelta(minutes=60)),
+            (timedelta(days=7), timedelta(minutes=7)),
+            (timedelta(days=90), timedelta(days=1)),
+        ],
+    )
+    def test_windows_and_buckets(self, settings, window, bucket):
+        settings.TRENDING_WINDOW = window
+        settings.TRENDING_BUCKET = bucket
+        settings.TRENDING_SIZE = 8
+        call_command(
+            "seed_reviews", books=30, users=5, reviews=5000, skew=2, stdout=StringIO()
+        )
+
+        computed = trending.compute_trending_books()
+
+        assert computed["since"] == trending.window_start()
+        assert computed["since"] > timezone.now() - window
+        assert self.ranking(computed) == self.brute_force(computed["since"], 8)
+
+    def test_reviews_are_counted_as_added(self, authenticated_client, create_book):
+        book = create_book()
+        for _ in range(2):
+            authenticated_client.post(
+                reverse("add_review"),
+                {"isbn": book.isbn, "title": "Review", "comment": "Text"},
+            )
+
+        (count,) = ReviewCount.objects.filter(book=book)
+        assert count.count == 2
+        assert count.bucket == trending.bucket_start(timezone.now())
+
+    def test_served_from_cache(self, authenticated_client, create_book):
+        book = create_book()
+        url = reverse("add_review")
+        authenticated_client.post(
+            url, {"isbn": book.isbn, "title": "Review", "comment": "Text"}
+        )
+        first = self.get_trending(authenticated_client)
+        authenticated_client.post(
+            url, {"isbn": book.isbn, "title": "Review", "comment": "Text"}
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.get_trending(authenticated_client)
+
+        assert cached == first
+        assert not any("reviews_reviewcount" in q["sql"] for q in queries)
+
+    def test_compaction(self, authenticated_client, seeded, settings):
+        self.get_trending(authenticated_client)
+        settings.TRENDING_WINDOW = timedelta(days=7)
+        since = trending.window_start()
+        old = ReviewCount.objects.filter(bucket__lt=since).count()
+        assert old > 0
+
+        out = StringIO()
+        call_command("compact_review_counts", stdout=out)
+
+        assert out.getvalue() == f"Dropped {old} review counts.\n"
+        assert not ReviewCount.objects.filter(bucket__lt=since).exists()
+        # The cached trending books were replaced with the new window's.
+        trending_data = self.get_trending(authenticated_client)
+        assert datetime.fromisoformat(trending_data["since"]) == since
+        assert self.ranking(trending_data) == self.brute_force(since, 5)
+
+    def test_unauthenticated(self, api_client):
+        response = api_client.get(reverse("get_trending_books"))
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+class TestISBN:
+    @pytest.mark.parametrize(
+        "value",
+        [
+            "9780141439587",
+            "978-0-14-143958-7",
+            "978 0 14 143958 7",
+            "0141439580",
+            "0-14-143958-0",
+        ],
+    )
+    def test_normalizes_to_isbn_13(self, value):
+        assert normalize_isbn(value) == "9780141439587"
+
+    def test_isbn_10_check_digit_x(self):
+        assert normalize_isbn("080442957x") == "9780804429573"
+
+    @pytest.mark.parametrize(
+        "value",
+        ["9780141439588", "0141439581", "1234567890123", "97801414395", "", "isbn"],
+    )
+    def test_rejects_invalid_isbns(self, value):
+        with pytest.raises(InvalidISBN):
+            normalize_isbn(value)
+
+    def test_rejects_non_ascii_digits(self):
+        # 9780141439587 in Arabic-Indic digits.
+        arabic = "9780141439587".translate(str.maketrans("0123456789", "٠١٢٣٤٥٦٧٨٩"))
+        with pytest.raises(InvalidISBN):
+            normalize_isbn(arabic)
+
+    @pytest.mark.django_db
+    def test_migration_normalizes_stored_isbns(self, create_book):
+        migration = import_module("reviews.migrations.0008_normalize_book_isbns")
+        create_book("0141439580")
+        create_book("0-306-40615-2")
+        create_book("9780306406157")
+        create_book("12345")
+
+        migration.normalize_book_isbns(apps, None)
+
+        # The second book is left alone, a book already has its ISBN-13.
+        assert set(Book.objects.values_list("isbn", flat=True)) == {
+            "9780141439587",
+            "0-306-40615-2",
+            "9780306406157",
+            "12345",
+        }
+
+
+class TestCache:
+    def test_lru_evicts_least_recently_used(self):
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+
+        assert lru.get("a") == 1
+        assert lru.get("b") is None
+        assert lru.get("c") == 3
+
+    def test_lru_expires_entries(self):
+        now = [0]
+        lru = LRUCache(maxsize=2, ttl=60, timer=lambda: now[0])
+        lru.set("a", 1)
+        now[0] = 59
+        assert lru.get("a") == 1
+        now[0] = 60
+        assert lru.get("a") is None
+        assert len(lru) == 0
+
+    def test_single_flight_coalesces_concurrent_calls(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(timeout=5)
+            return "value"
+
+        def call():
+            results.append(flight.do("k", slow))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(timeout=5)
+        followers = [threading.Thread(target=call) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        # Give the followers time to join the call in flight.
+        time.sleep(0.1)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join()
+
+        assert [value for value, _ in results] == ["value"] * 4
+        # Every call of slow produced exactly one result that wasn't shared.
+        assert len(calls) == sum(not shared for _, shared in results)
+        assert len(calls) < 4
+
+    def test_single_flight_propagates_errors(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            flight.do("k", fail)
+        assert flight.do("k", lambda: "ok") == ("ok", False)
+
+
+class TestCircuitBreaker:
+    @pytest.fixture
+    def now(self):
+        return [0]
+
+    @pytest.fixture
+    def breaker(self, now):
+        return CircuitBreaker(
+            "Upstream",
+            failure_threshold=3,
+            slow_call_duration=1,
+            reset_timeout=30,
+            timer=lambda: now[0],
+        )
+
+    def call(self, breaker, succeeded=True, duration=0):
+        breaker.allow()
+        return breaker.record(succeeded, duration)
+
+    def test_opens_after_consecutive_failures(self, breaker):
+        self.call(breaker, succeeded=False)
+        self.call(breaker, succeeded=False)
+        self.call(breaker)
+        self.call(breaker, succeeded=False)
+        self.call(breaker, succeeded=False)
+        assert breaker.state == "closed"
+
+        self.call(breaker, succeeded=False)
+
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+
+    def test_slow_calls_count_as_failures(self, breaker):
+        assert self.call(breaker, duration=1) == "success"
+        assert [self.call(breaker, duration=1.5) for _ in range(3)] == ["slow"] * 3
+
+        assert breaker.state == "open"
+
+    def test_rejects_until_reset_timeout(self, breaker, now):
+        for _ in range(3):
+            self.call(breaker, succeeded=False)
+        now[0] = 10.5
+
+        with pytest.raises(CircuitOpenError) as e:
+            breaker.allow()
+
+        assert e.value.retry_after == 20
+        assert breaker.snapshot() == {
+            "state": "open",
+            "success": 0,
+            "failure": 3,
+            "slow": 0,
+            "rejected": 1,
+        }
+        now[0] = 30
+        assert breaker.state == "half_open"
+
+    def test_half_open_lets_a_single_trial_through(self, breaker, now):
+        for _ in range(3):
+            self.call(breaker, succeeded=False)
+        now[0] = 30
+
+        breaker.allow()
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+        breaker.record(True, 0)
+
+        assert breaker.state == "closed"
+        breaker.allow()
+
+    def test_check_leaves_the_trial(self, breaker, now):
+        for _ in range(3):
+            self.call(breaker, succeeded=False)
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+        now[0] = 30
+
+        breaker.check()
+        breaker.allow()
+
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+
+    def test_failed_trial_opens_again(self, breaker, now):
+        for _ in range(3):
+            self.call(breaker, succeeded=False)
+        now[0] = 30
+
+        self.call(breaker, duration=2)
+
+        assert breaker.state == "open"
+        now[0] = 59
+        assert breaker.state == "open"
+        now[0] = 60
+        assert breaker.state == "half_open"
+
+
+@pytest.mark.django_db
+class TestBookInfoPrefetch:
+    def add_review(self, client, isbn, capture):
+        with capture(execute=True):
+            response = client.post(
+                reverse("add_review"),
+                {"isbn": isbn, "title": "Review", "comment": "Text"},
+            )
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_reviews_prefetch_unfetched_books(
+        self,
+        authenticated_client,
+        create_book,
+        prefetched,
+        django_capture_on_commit_callbacks,
+    ):
+        book = create_book()
+
+        self.add_review(
+            authenticated_client, book.isbn, django_capture_on_commit_callbacks
+        )
+
+        prefetched.assert_called_once_with(book.isbn)
+
+    def test_reviews_of_fresh_books_dont_prefetch(
+        self,
+        authenticated_client,
+        create_book,
+        prefetched,
+        django_capture_on_commit_callbacks,
+    ):
+        book = create_book()
+        Book.objects.filter(pk=book.pk).update(fetched_at=timezone.now())
+
+        self.add_review(
+            authenticated_client, book.isbn, django_capture_on_commit_callbacks
+        )
+
+        prefetched.assert_not_called()
+
+    def test_bulk_reviews_prefetch_each_book_once(
+        self, authenticated_client, create_book, prefetched
+    ):
+        books = [create_book("9780306406157"), create_book("9780140449136")]
+        rows = [
+            {"isbn": book.isbn, "title": "Review", "comment": "Text"}
+            for book in books * 3
+        ]
+
+        response = authenticated_client.post(
+            reverse("add_reviews_bulk"), rows, format="json"
+        )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert sorted(call.args[0] for call in prefetched.call_args_list) == sorted(
+            book.isbn for book in books
+        )
+
+    def test_pending_prefetches_are_deduplicated(
+        self, mock_lambda_client, create_book, prefetched
+    ):
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {"statusCode": 200, "body": {"title": "Prefetched"}}
+        )
+        book = create_book()
+
+        assert prefetch.enqueue(book.isbn)
+        assert not prefetch.enqueue(book.isbn)
+        prefetch.prefetch(book.isbn)
+        assert prefetch.enqueue(book.isbn)
+
+        assert prefetched.call_count == 2
+
+    def test_prefetch_warms_book_info(self, mock_lambda_client, create_book):
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {"statusCode": 200, "body": {"title": "Prefetched"}}
+        )
+        book = create_book()
+
+        prefetch.prefetch(book.isbn)
+
+        book.refresh_from_db()
+        assert book.title == "Prefetched"
+        assert book.is_fresh()
+        assert services.get_book_info(book.isbn)["body"] == {"title": "Prefetched"}
+        assert services.book_info_cache_stats.snapshot()["hits"] == 1
+
+    def test_failed_submissions_can_be_retried(self, prefetched):
+        prefetched.side_effect = [ConnectionError, None]
+
+        assert not prefetch.enqueue("9780000000002")
+        assert prefetch.enqueue("9780000000002")
+
+
+class TestPrefetchBackends:
+    def test_thread_backend_bounds_concurrency(self, monkeypatch):
+        running = 0
+        most_running = 0
+        lock = threading.Lock()
+        done = threading.Event()
+        prefetched = []
+
+        def fake_prefetch(isbn):
+            nonlocal running, most_running
+            with lock:
+                running += 1
+                most_running = max(most_running, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+                prefetched.append(isbn)
+                if len(prefetched) == 6:
+                    done.set()
+
+        monkeypatch.setattr(prefetch, "prefetch", fake_prefetch)
+        backend = prefetch.ThreadBackend(2)
+        for i in range(6):
+            backend.submit(str(i))
+
+        assert done.wait(timeout=5)
+        backend.executor.shutdown()
+        assert sorted(prefetched) == [str(i) for i in range(6)]
+        assert most_running == 2
+
+    def test_celery_backend_sends_tasks(self):
+        backend = prefetch.CeleryBackend()
+        with patch.object(backend.task, "delay") as delay:
+            backend.submit("9780000000002")
+
+        delay.assert_called_once_with("9780000000002")
+
+    def test_celery_task_prefetches(self, monkeypatch):
+        from core.celery import app
+
+        fake_prefetch = Mock()
+        monkeypatch.setattr(prefetch, "prefetch", fake_prefetch)
+
+        app.tasks["reviews.tasks.prefetch_book_info"].apply(("9780000000002",))
+
+        fake_prefetch.assert_called_once_with("9780000000002")
+
+
+class TestAsyncBookInfo:
+    def test_views_are_async(self):
+        assert GetBookInformationView.view_is_async
+        assert GetBooksInformationView.view_is_async
+
+    def test_run_blocking_uses_book_info_threads(self):
+        thread = asyncio.run(services.run_blocking(threading.current_thread))
+
+        assert thread.name.startswith("book-info")
+
+    def test_run_blocking_runs_concurrently(self):
+        # Both calls have to be waiting at once for the barrier to let them go.
+        barrier = threading.Barrier(2, timeout=5)
+
+        async def wait_twice():
+            return await asyncio.gather(
+                services.run_blocking(barrier.wait),
+                services.run_blocking(barrier.wait),
+            )
+
+        asyncio.run(wait_twice())
+
+    def test_cache_hits_stay_on_the_event_loop(self, monkeypatch):
+        payload = {"statusCode": 200, "body": {"title": "Cached"}}
+        services.book_info_cache.set("9780441172719", payload)
+        monkeypatch.setattr(services, "run_blocking", Mock(side_effect=AssertionError))
+
+        assert asyncio.run(services.aget_book_info("9780441172719")) == payload
+
+
+class TestLambdaWrapper:
+    def test_instance_is_shared(self, settings):
+        services.LambdaWrapper.reset()
+        with patch("boto3.client") as mock_client:
+            first = services.LambdaWrapper.instance()
+            second = services.LambdaWrapper.instance()
+        services.LambdaWrapper.reset()
+
+        assert first is second
+        mock_client.assert_called_once()
+        config = mock_client.call_args.kwargs["config"]
+        assert config.max_pool_connections == settings.LAMBDA_MAX_POOL_CONNECTIONS
+        assert config.tcp_keepalive
+
+    def test_reset_creates_new_instance(self):
+        services.LambdaWrapper.reset()
+        with patch("boto3.client"):
+            first = services.LambdaWrapper.instance()
+            services.LambdaWrapper.reset()
+            second = services.LambdaWrapper.instance()
+        services.LambdaWrapper.reset()
+
+        assert first is not second
+
+
+class StubLambdaClient:
+    """
+    Stands in for the Lambda client. Invocations take ``latency`` seconds, and
+    then raise ``error`` if it's set or answer ``payload``.
+    """
+
+    def __init__(self, payload, latency=0, error=None):
+        self.payload = payload
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+
+    def invoke(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return lambda_response(self.payload)
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("run_blocking_inline")
+class TestLambdaResilience:
+    book = {
+        "title": "Dune",
+        "author": "Frank Herbert",
+        "publish_date": "1965",
+        "description": "Spice",
+    }
+
+    @pytest.fixture
+    def now(self):
+        return [0]
+
+    @pytest.fixture(autouse=True)
+    def breaker(self, monkeypatch, now):
+        breaker = CircuitBreaker(
+            "Open Library",
+            failure_threshold=2,
+            slow_call_duration=0.05,
+            reset_timeout=30,
+            timer=lambda: now[0],
+        )
+        monkeypatch.setattr(services, "lambda_breaker", breaker)
+        return breaker
+
+    @pytest.fixture
+    def lambda_stub(self, monkeypatch):
+        stub = StubLambdaClient({"statusCode": 200, "body": self.book})
+        wrapper = services.LambdaWrapper(stub)
+        monkeypatch.setattr(services.LambdaWrapper, "_instance", wrapper)
+        return stub
+
+    def open_breaker(self, breaker):
+        for _ in range(breaker.failure_threshold):
+            breaker.allow()
+            breaker.record(False, 0)
+
+    def get_book_info(self, client, isbn="9780441172719"):
+        return client.get(reverse("get_book_info"), {"isbn": isbn})
+
+    def test_invocation_errors_open_the_breaker(
+        self, authenticated_client, lambda_stub, breaker
+    ):
+        lambda_stub.error = ClientError(
+            {"Error": {"Code": "ServiceException", "Message": "Down"}}, "Invoke"
+        )
+
+        assert self.get_book_info(authenticated_client).status_code == 500
+        assert self.get_book_info(authenticated_client).status_code == 500
+        response = self.get_book_info(authenticated_client)
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response["Retry-After"] == "30"
+        assert lambda_stub.calls == 2
+        assert breaker.snapshot() == {
+            "state": "open",
+            "success": 0,
+            "failure": 2,
+            "slow": 0,
+            "rejected": 1,
+        }
+
+    def test_open_library_errors_open_the_breaker(
+        self, authenticated_client, lambda_stub
+    ):
+        lambda_stub.payload = {"statusCode": 500, "body": {"error": "Bad gateway"}}
+
+        statuses = [
+            self.get_book_info(authenticated_client).status_code for _ in range(3)
+        ]
+
+        assert statuses == [500, 500, 503]
+        assert lambda_stub.calls == 2
+
+    def test_slow_invocations_open_the_breaker(self, authenticated_client, lambda_stub):
+        lambda_stub.latency = 0.06
+        isbns = ["9780441172719", "9780316769488", "9780306406157"]
+
+        statuses = [
+            self.get_book_info(authenticated_client, isbn).status_code for isbn in isbns
+        ]
+
+        assert statuses == [200, 200, 503]
+        assert lambda_stub.calls == 2
+
+    def test_failed_batches_open_the_breaker(self, authenticated_client, lambda_stub):
+        error = {"statusCode": 500, "body": {"error": "Bad gateway"}}
+        lambda_stub.payload = {
+            "statusCode": 200,
+            "body": {"9780441172719": error, "9780316769488": error},
+        }
+        url = reverse("get_books_info")
+        data = {"isbns": ["9780441172719", "9780316769488"]}
+
+        for _ in range(3):
+            response = authenticated_client.post(url, data, format="json")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [result["status"] for result in response.data["results"]] == [503, 503]
+        assert lambda_stub.calls == 2
+
+    def test_serves_stored_books_while_open(
+        self, authenticated_client, lambda_stub, breaker, settings
+    ):
+        Book.objects.create(
+            isbn="9780441172719",
+            title="Dune",
+            fetched_at=timezone.now() - settings.BOOK_INFO_TTL * 2,
+        )
+        self.open_breaker(breaker)
+
+        response = self.get_book_info(authenticated_client)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["title"] == "Dune"
+        assert lambda_stub.calls == 0
+
+    def test_batch_serves_stored_books_while_open(
+        self, authenticated_client, lambda_stub, breaker
+    ):
+        Book.objects.create(
+            isbn="9780441172719", title="Dune", fetched_at=timezone.now()
+        )
+        self.open_breaker(breaker)
+
+        response = authenticated_client.post(
+            reverse("get_books_info"),
+            {"isbns": ["9780441172719", "9780316769488"]},
+            format="json",
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        first, second = response.data["results"]
+        assert (first["status"], first["body"]["title"]) == (200, "Dune")
+        assert second["status"] == 503
+        assert lambda_stub.calls == 0
+
+    def test_closes_after_a_successful_trial(
+        self, authenticated_client, lambda_stub, breaker, now
+    ):
+        self.open_breaker(breaker)
+        assert self.get_book_info(authenticated_client).status_code == 503
+
+        now[0] = 30
+        response = self.get_book_info(authenticated_client)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert breaker.state == "closed"
+        assert lambda_stub.calls == 1
+
+    def test_prefetches_skip_while_open(self, lambda_stub, breaker, caplog):
+        self.open_breaker(breaker)
+
+        with caplog.at_level("WARNING", logger="reviews.prefetch"):
+            prefetch.prefetch("9780441172719")
+
+        assert lambda_stub.calls == 0
+        assert "Didn't prefetch book info for ISBN 9780441172719" in caplog.text
+
+    def test_deadline(self, authenticated_client, lambda_stub, settings):
+        settings.BOOK_INFO_DEADLINE = 0.05
+        lambda_stub.latency = 0.3
+
+        response = self.get_book_info(authenticated_client)
+
+        assert response.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+        # The lookup carried on, and the next request is served what it fetched.
+        assert Book.objects.get(isbn="9780441172719").title == "Dune"
+        assert self.get_book_info(authenticated_client).status_code == 200
+        assert lambda_stub.calls == 1
+
+    def test_metrics(
+        self, authenticated_client, api_client, lambda_stub, breaker, settings
+    ):
+        settings.METRICS_PUBLIC = True
+        self.open_breaker(breaker)
+        self.get_book_info(authenticated_client)
+
+        body = api_client.get(reverse("metrics")).content.decode()
+
+        assert 'lambda_calls_total{outcome="rejected"}' in body
+        assert "lambda_circuit_state 2.0" in body
+
+
+class FunctionLambdaClient:
+    """
+    Stands in for the Lambda client, running ``function`` the way Lambda does,
+    with events and results going through JSON.
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def invoke(self, FunctionName, Payload, LogType):
+        return lambda_response(self.function.handler(json.loads(Payload), None))
+
+
+class TestBookInfoBackends:
+    @pytest.fixture
+    def open_library(self, monkeypatch, settings):
+        monkeypatch.syspath_prepend(settings.BOOK_INFO_FUNCTION_DIR)
+        openlibrary_stub = import_module("openlibrary_stub")
+        catalogue = openlibrary_stub.make_catalogue(
+            5, authors=2, works=3, isbn=lambda i: to_isbn_13(f"{i:09d}")
+        )
+        with openlibrary_stub.OpenLibraryStub(catalogue) as stub:
+            # Read by the functions when they're loaded.
+            monkeypatch.setenv("OPEN_LIBRARY_URL", stub.url)
+            yield stub
+
+    @pytest.fixture
+    def lambda_backend(self, open_library, monkeypatch, settings):
+        function = services.load_function(settings.BOOK_INFO_FUNCTION_DIR)
+        wrapper = services.LambdaWrapper(FunctionLambdaClient(function))
+        monkeypatch.setattr(services.LambdaWrapper, "_instance", wrapper)
+        yield services.LambdaBackend()
+        function.get_loop().run_until_complete(function.reset_session())
+        function.get_loop().close()
+
+    @pytest.fixture
+    def local_backend(self, open_library, settings):
+        backend = services.LocalBackend(settings.BOOK_INFO_FUNCTION_DIR)
+        yield backend
+        backend.close()
+
+    @pytest.mark.parametrize(
+        "event",
+        [
+            {"isbn": "9780000000019"},
+            {"isbn": "9780000000996"},
+            {"isbns": ["9780000000019", "9780000000040", "9780000000996"]},
+            {"isbns": ["9780000000026", "9780000000996"], "strategy": "bibkeys"},
+            {"isbns": "9780000000019"},
+        ],
+    )
+    def test_backends_return_identical_payloads(
+        self, lambda_backend, local_backend, event
+    ):
+        assert local_backend.invoke(event) == lambda_backend.invoke(event)
+
+    def test_local_backend_keeps_its_session(self, local_backend):
+        local_backend.invoke({"isbn": "9780000000019"})
+        session = local_backend.function._session
+        local_backend.invoke({"isbn": "9780000000026"})
+
+        assert local_backend.function._session is session
+        assert not session.closed
+
+    @pytest.mark.django_db
+    @pytest.mark.usefixtures("run_blocking_inline")
+    def test_book_info_from_local_backend(
+        self, authenticated_client, local_backend, monkeypatch
+    ):
+        monkeypatch.setattr(services, "_backend", local_backend)
+
+        response = authenticated_client.get(
+            reverse("get_book_info"), {"isbn": "9780000000019"}
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            "title": "Book 1",
+            "author": "Author 1",
+            "publish_date": "1901",
+            "description": "Description of work 1",
+        }
+        assert "lambda" in server_timing(response)
+
+    def test_backend_from_settings(self, monkeypatch, settings):
+        monkeypatch.setattr(services, "_backend", None)
+        settings.BOOK_INFO_BACKEND = "lambda"
+
+        assert isinstance(services.get_book_info_backend(), services.LambdaBackend)
+
+    def test_missing_function(self, tmp_path):
+        with pytest.raises(ImproperlyConfigured):
+            services.load_function(tmp_path)
+
+
+def server_timing(response):
+    """Parses the Server-Timing header into {name: {param: value}}."""
+    timings = {}
+    for metric in response["Server-Timing"].split(", "):
+        name, *params = metric.split(";")
+        timings[name] = dict(param.split("=", 1) for param in params)
+    return timings
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("run_blocking_inline")
+class TestBookInfoThrottling:
+    @pytest.fixture(autouse=True)
+    def budgets(self, settings):
+        # Buckets that don't refill during a test, unless it says otherwise.
+        for scope in ("USER", "IP", "UPSTREAM"):
+            setattr(settings, f"BOOK_INFO_{scope}_RATE", 0.01)
+            setattr(settings, f"BOOK_INFO_{scope}_BURST", 100)
+        return settings
+
+    @pytest.fixture(autouse=True)
+    def function(self, monkeypatch):
+        def handler(event, context):
+            function.events.append(event)
+            if "isbns" in event:
+                body = {isbn: self.book_payload(isbn) for isbn in event["isbns"]}
+                return {"statusCode": 200, "body": body}
+            return self.book_payload(event["isbn"])
+
+        function = Mock(handler=handler, events=[])
+        wrapper = services.LambdaWrapper(FunctionLambdaClient(function))
+        monkeypatch.setattr(services.LambdaWrapper, "_instance", wrapper)
+        return function
+
+    def book_payload(self, isbn):
+        return {"statusCode": 200, "body": {"title": f"Book {isbn}"}}
+
+    def isbn(self, i):
+        return to_isbn_13(f"{i:09d}")
+
+    def client(self, username, ip="10.0.0.1"):
+        user = User.objects.get_or_create(username=username)[0]
+        client = APIClient(REMOTE_ADDR=ip)
+        client.force_authenticate(user=user)
+        return client
+
+    def get_book_info(self, client, i):
+        return client.get(reverse("get_book_info"), {"isbn": self.isbn(i)})
+
+    def get_books_info(self, client, *indexes):
+        isbns = [self.isbn(i) for i in indexes]
+        return client.post(reverse("get_books_info"), {"isbns": isbns}, format="json")
+
+    def test_anonymous_lookups_take_from_the_ip_budget(self, budgets, function):
+        budgets.BOOK_INFO_IP_BURST = 2
+        anonymous = APIClient(REMOTE_ADDR="10.0.0.1")
+
+        assert self.get_book_info(anonymous, 1).status_code == 200
+        assert self.get_books_info(anonymous, 2).status_code == 200
+        response = self.get_book_info(anonymous, 3)
+
+        assert response.status_code == 429
+        assert "(ip)" in response.data["error"]
+        assert len(function.events) == 2
+
+    def test_user_budget(self, budgets, function):
+        budgets.BOOK_INFO_USER_BURST = 2
+        alice = self.client("alice")
+
+        assert self.get_book_info(alice, 1).status_code == 200
+        assert self.get_book_info(alice, 2).status_code == 200
+        response = self.get_book_info(alice, 3)
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        # A token comes back every 100 seconds.
+        assert response["Retry-After"] == "100"
+        assert "(user)" in response.data["error"]
+        assert len(function.events) == 2
+        assert self.get_book_info(self.client("bob"), 3).status_code == 200
+
+    def test_cache_hits_are_free(self, budgets, function):
+        budgets.BOOK_INFO_USER_BURST = 1
+        alice = self.client("alice")
+
+        statuses = [self.get_book_info(alice, 1).status_code for _ in range(5)]
+        services.book_info_cache.clear()
+        cache.delete(services._book_info_cache_key(self.isbn(1)))
+        # Served from the database now.
+        statuses.append(self.get_book_info(alice, 1).status_code)
+        statuses.append(self.get_books_info(alice, 1).status_code)
+
+        assert statuses == [200] * 7
+        assert len(function.events) == 1
+        assert self.get_book_info(alice, 2).status_code == 429
+
+    def test_ip_budget(self, budgets):
+        budgets.BOOK_INFO_IP_BURST = 2
+
+        assert self.get_book_info(self.client("alice"), 1).status_code == 200
+        assert self.get_book_info(self.client("bob"), 2).status_code == 200
+        response = self.get_book_info(self.client("carol"), 3)
+
+        assert response.status_code == 429
+        assert "(ip)" in response.data["error"]
+        assert self.get_book_info(self.client("carol", "10.0.0.2"), 3).status_code == (
+            200
+        )
+
+    def test_upstream_budget(self, budgets, function, caplog):
+        budgets.BOOK_INFO_UPSTREAM_BURST = 2
+        prefetch.prefetch(self.isbn(1))
+
+        assert self.get_book_info(self.client("alice"), 2).status_code == 200
+        response = self.get_book_info(self.client("bob", "10.0.0.2"), 3)
+        prefetch.prefetch(self.isbn(4))
+
+        assert response.status_code == 429
+        assert "(upstream)" in response.data["error"]
+        assert [event["isbn"] for event in function.events] == [
+            self.isbn(1),
+            self.isbn(2),
+        ]
+        assert "Didn't prefetch book info for ISBN" in caplog.text
+
+    def test_batches_take_a_token_per_isbn(self, budgets, function):
+        budgets.BOOK_INFO_USER_BURST = 3
+        alice = self.client("alice")
+
+        assert self.get_books_info(alice, 1, 2).status_code == 200
+        # Only the third book goes upstream.
+        assert self.get_books_info(alice, 1, 2, 3).status_code == 200
+        response = self.get_books_info(alice, 4, 5)
+
+        assert response.status_code == 429
+        # Until two tokens came back.
+        assert response["Retry-After"] == "200"
+        assert function.events == [
+            {"isbns": [self.isbn(1), self.isbn(2)]},
+            {"isbns": [self.isbn(3)]},
+        ]
+
+    def test_batches_are_fetched_as_far_as_the_budgets_go(self, budgets, function):
+        budgets.BOOK_INFO_USER_BURST = 2
+        alice = self.client("alice")
+
+        response = self.get_books_info(alice, 1, 2, 3)
+
+        assert response.status_code == 200
+        assert [result["status"] for result in response.data["results"]] == [
+            200,
+            200,
+            429,
+        ]
+        assert "(user)" in response.data["results"][2]["body"]["error"]
+        assert function.events == [{"isbns": [self.isbn(1), self.isbn(2)]}]
+        assert self.get_book_info(alice, 4).status_code == 429
+
+    @pytest.mark.django_db(transaction=True)
+    def test_coalesced_lookups_are_charged_to_each_request(self, budgets, function, rf):
+        budgets.BOOK_INFO_USER_BURST = 1
+        users = {
+            name: User.objects.create_user(username=name)
+            for name in ("alice", "bob", "carol")
+        }
+        cache.set(f"book-info-budget:user:{users['alice'].pk}", (0, time.time()))
+        started, release = threading.Event(), threading.Event()
+        handler = function.handler
+
+        def slow_handler(event, context):
+            started.set()
+            release.wait(5)
+            return handler(event, context)
+
+        function.handler = slow_handler
+
+        def lookup(name):
+            request = rf.get("/", REMOTE_ADDR="10.0.0.1")
+            request.user = users[name]
+            try:
+                with throttling.charged_to(request):
+                    return services.get_book_info(self.isbn(1))
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(2) as executor:
+            bob = executor.submit(lookup, "bob")
+            assert started.wait(5)
+            carol = executor.submit(lookup, "carol")
+            # Over budget, alice is throttled without waiting on bob's lookup,
+            # or failing it for the others.
+            with pytest.raises(throttling.ThrottledError):
+                lookup("alice")
+            time.sleep(0.1)
+            release.set()
+
+            assert bob.result()["statusCode"] == 200
+            assert carol.result()["statusCode"] == 200
+        assert len(function.events) == 1
+        # Carol paid for the book too.
+        assert cache.get(f"book-info-budget:user:{users['carol'].pk}")[0] < 1
+
+    def test_lookups_rejected_by_the_breaker_take_nothing(self, budgets, function):
+        budgets.BOOK_INFO_USER_BURST = 1
+        alice = self.client("alice")
+        for _ in range(budgets.LAMBDA_BREAKER_FAILURES):
+            services.lambda_breaker.allow()
+            services.lambda_breaker.record(False, 0)
+
+        assert self.get_book_info(alice, 1).status_code == 503
+        assert self.get_books_info(alice, 2).data["results"][0]["status"] == 503
+        services.lambda_breaker.reset()
+
+        assert self.get_book_info(alice, 1).status_code == 200
+        assert len(function.events) == 1
+
+    def test_refused_lookups_take_nothing(self, budgets):
+        budgets.BOOK_INFO_USER_BURST = 5
+        budgets.BOOK_INFO_UPSTREAM_BURST = 1
+        alice = self.client("alice")
+
+        assert self.get_book_info(alice, 1).status_code == 200
+        assert self.get_book_info(alice, 2).status_code == 429
+        budgets.BOOK_INFO_UPSTREAM_BURST = 100
+        cache.delete("book-info-budget:upstream")
+
+        statuses = [self.get_book_info(alice, i).status_code for i in range(2, 7)]
+        assert statuses == [200, 200, 200, 200, 429]
+
+    def test_buckets_refill(self, budgets):
+        budgets.BOOK_INFO_USER_RATE = 50
+        budgets.BOOK_INFO_USER_BURST = 1
+        alice = self.client("alice")
+
+        assert self.get_book_info(alice, 1).status_code == 200
+        response = self.get_book_info(alice, 2)
+        assert response.status_code == 429
+        assert response["Retry-After"] == "1"
+        time.sleep(0.05)
+        assert self.get_book_info(alice, 2).status_code == 200
+
+    def test_metrics(self, budgets):
+        budgets.BOOK_INFO_IP_BURST = 1
+        alice = self.client("alice")
+        throttled = metrics.BOOK_INFO_THROTTLED.labels("ip")
+        before = throttled._value.get()
+
+        self.get_book_info(alice, 1)
+        self.get_book_info(alice, 2)
+
+        assert throttled._value.get() == before + 1
+
+    def test_budgets_are_shared_through_the_cache(self, budgets, rf):
+        budgets.BOOK_INFO_USER_BURST = 3
+        request = rf.get("/", REMOTE_ADDR="10.0.0.1")
+        request.user = User.objects.create_user(username="alice")
+
+        with throttling.charged_to(request):
+            throttling.take(2)
+
+        level, _ = cache.get(f"book-info-budget:user:{request.user.pk}")
+        assert level == pytest.approx(1, abs=0.01)
+        assert cache.get("book-info-budget:ip:10.0.0.1")[0] == pytest.approx(
+            98, abs=0.01
+        )
+        assert cache.get("book-info-budget:upstream")[0] == pytest.approx(98, abs=0.01)
+
+
+@pytest.mark.django_db
+class TestRequestMetrics:
+    def test_database_queries(self, authenticated_client, create_book):
+        book = create_book()
+        url = reverse("get_book_reviews", kwargs={"isbn": book.isbn})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.get(url)
+
+        timings = server_timing(response)
+        assert timings["db"]["desc"] == f'"{len(queries)} queries"'
+        assert float(timings["db"]["dur"]) > 0
+        assert "render" in timings
+        assert float(timings["total"]["dur"]) >= float(timings["db"]["dur"])
+
+    def test_review_page_cache(self, authenticated_client, create_book):
+        book = create_book()
+        url = reverse("get_book_reviews", kwargs={"isbn": book.isbn})
+
+        first = server_timing(authenticated_client.get(url))
+        second = server_timing(authenticated_client.get(url))
+
+        assert first["cache-reviews_page-misses"] == {"desc": '"1"'}
+        assert second["cache-reviews_page-hits"] == {"desc": '"1"'}
+
+    @pytest.mark.usefixtures("run_blocking_inline")
+    def test_lambda_invocations(self, authenticated_client, mock_lambda_client):
+        mock_lambda_client.return_value.invoke.return_value = lambda_response(
+            {"statusCode": 200, "body": {"title": "Test Book"}}
+        )
+        url = reverse("get_book_info")
+
+        miss = server_timing(authenticated_client.get(url, {"isbn": "9780441172719"}))
+        hit = server_timing(authenticated_client.get(url, {"isbn": "9780441172719"}))
+
+        assert miss["lambda"]["desc"] == '"1 invocations"'
+        assert miss["cache-book_info-misses"] == {"desc": '"1"'}
+        assert "lambda" not in hit
+        assert hit["cache-book_info-hits"] == {"desc": '"1"'}
+
+    def test_book_info_threads_report_to_the_request(self):
+        timings, token = metrics.start_request()
+        try:
+            assert asyncio.run(services.run_blocking(metrics.current_timings)) is (
+                timings
+            )
+        finally:
+            metrics.end_request(token)
+
+    def test_log_fields(self, authenticated_client, create_book, caplog):
+        book = create_book()
+        url = reverse("get_book_reviews", kwargs={"isbn": book.isbn})
+
+        with caplog.at_level("INFO", logger="reviews.requests"):
+            authenticated_client.get(url)
+
+        (record,) = caplog.records
+        assert record.route == "get_book_reviews"
+        assert record.status == 200
+        assert record.db_queries > 0
+        assert record.cache == {"reviews_page_misses": 1}
+        message = dict(pair.split("=") for pair in record.getMessage().split())
+        assert message["route"] == "get_book_reviews"
+        assert message["status"] == "200"
+        assert float(message["render_ms"]) >= 0
+        assert message["cache_reviews_page_misses"] == "1"
+
+    def test_render_covers_serialization(
+        self, authenticated_client, create_book, test_user, monkeypatch
+    ):
+        book = create_book()
+        Review.objects.create(book=book, user=test_user, title="Review", comment="")
+        represent = ReviewListSerializer.to_representation
+
+        def slow_representation(self, row):
+            time.sleep(0.05)
+            return represent(self, row)
+
+        monkeypatch.setattr(
+            ReviewListSerializer, "to_representation", slow_representation
+        )
+
+        response = authenticated_client.get(
+            reverse("get_book_reviews", kwargs={"isbn": book.isbn})
+        )
+
+        assert float(server_timing(response)["render"]["dur"]) >= 50
+
+    def test_metrics_endpoint(
+        self, authenticated_client, api_client, create_book, settings
+    ):
+        settings.METRICS_PUBLIC = True
+        book = create_book()
+        authenticated_client.get(
+            reverse("get_book_reviews", kwargs={"isbn": book.isbn})
+        )
+
+        response = api_client.get(reverse("metrics"))
+
+        assert response.status_code == status.HTTP_200_OK
+        body = response.content.decode()
+        assert (
+            'http_request_duration_seconds_count{method="GET",'
+            'route="get_book_reviews",status="200"}'
+        ) in body
+        assert 'http_request_db_queries_bucket{le="+Inf",route="get_book_reviews"}' in (
+            body
+        )
+        assert 'cache_lookups_total{cache="reviews_page",result="misses"}' in body
+
+    def test_metrics_token(self, api_client, settings):
+        settings.METRICS_TOKEN = "scrape-me"
+        settings.METRICS_PUBLIC = True
+        url = reverse("metrics")
+
+        assert api_client.get(url).status_code == status.HTTP_403_FORBIDDEN
+        response = api_client.get(url, headers={"Authorization": "Bearer scrape-me"})
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_metrics_forbidden_by_default(self, authenticated_client):
+        response = authenticated_client.get(reverse("metrics"))
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+class TestStartup:
+    def test_urls_dont_import_boto3(self):
+        # Checked in a fresh interpreter, as the tests import boto3 themselves.
+        code = (
+            "import sys, django; django.setup(); import core.urls; "
+            "print(sorted(m for m in sys.modules if m.startswith(('boto', 'aiohttp'))))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "core.settings"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        assert result.stdout.strip() == "[]"
+
+    def test_schema_from_file(self, api_client, settings, tmp_path):
+        generated = api_client.get(reverse("schema"), {"format": "json"})
+        schema_file = tmp_path / "schema.json"
+        call_command("spectacular", format="openapi-json", file=str(schema_file))
+        settings.API_SCHEMA_FILE = str(schema_file)
+
+        with patch("drf_spectacular.generators.SchemaGenerator.get_schema") as generate:
+            served = api_client.get(reverse("schema"), {"format": "json"})
+            yaml = api_client.get(reverse("schema"))
+
+        generate.assert_not_called()
+        assert served.status_code == status.HTTP_200_OK
+        assert served.json() == generated.json()
+        assert served["Content-Disposition"] == generated["Content-Disposition"]
+        assert "/api/reviews/search/" in yaml.content.decode()
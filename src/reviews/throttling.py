@@ -0,0 +1,199 @@
+"""
+Budgets of book info lookups that go upstream, to the Lambda and Open Library.
+
+Lookups served from the caches or the database are free. The ones that invoke
+the Lambda take tokens from token buckets: one per user and one per IP of the
+request they're charged to, and one shared by every lookup, prefetches
+included. Buckets are kept in the Django cache, so workers draw from the same
+ones when it's shared.
+
+Requests are charged to their own budgets before they wait on a lookup of the
+same book made for another request, so each pays for the book, and none is
+throttled for being coalesced with a client over its budget. Lookups the
+circuit breaker rejects take nothing. A lookup of several books takes a token
+per book, and when the budgets are short of that, only the books they have
+tokens for are looked up, and the others are answered 429.
+
+Budgets are set per scope by BOOK_INFO_<SCOPE>_RATE, the tokens a bucket gets
+back per second, and BOOK_INFO_<SCOPE>_BURST, the most it holds.
+"""
+
+import contextlib
+import contextvars
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+from .breaker import CircuitOpenError
+
+# Scopes and idents of the client upstream lookups are charged to, set for the
+# requests being served, and carried over to the book info threads.
+_client = contextvars.ContextVar("book_info_client", default=())
+
+
+class ThrottledError(Exception):
+    """Raised instead of a lookup that is over one of its budgets."""
+
+    def __init__(self, scope, retry_after):
+        super().__init__(
+            f"Too many book info lookups ({scope}), retry in {retry_after}s."
+        )
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+@contextlib.contextmanager
+def charged_to(request):
+    """Charges the upstream lookups made in the block to ``request``'s client."""
+    client = [("ip", BaseThrottle().get_ident(request))]
+    if request.user and request.user.is_authenticated:
+        client.insert(0, ("user", request.user.pk))
+    token = _client.set(tuple(client))
+    try:
+        yield
+    finally:
+        _client.reset(token)
+
+
+def take(tokens=1, client=True, upstream=True):
+    """
+    Takes ``tokens`` from the budgets of the client the lookup is charged to,
+    if any, and from the upstream budget, or only from either of them.
+
+    Raises ThrottledError, taking nothing, if any of them is short.
+    """
+    _take(_buckets(client, upstream), tokens, tokens)
+
+
+def take_some(tokens, client=True, upstream=True):
+    """
+    Like take, for lookups of several books that can be made in part, taking as
+    many of ``tokens`` as every budget has.
+
+    Returns the number of tokens taken, and the ThrottledError a lookup of the
+    other books would raise, or None. Raises it, taking nothing, if any of the
+    budgets is out of tokens.
+    """
+    return _take(_buckets(client, upstream), tokens, 1)
+
+
+def give_back(tokens=1, client=True, upstream=True):
+    """Gives back ``tokens`` taken for a lookup that wasn't made after all."""
+    buckets = _buckets(client, upstream)
+    if not buckets:
+        return
+    keys = [key for _, key in buckets]
+    with _locked(keys):
+        now = time.time()
+        states = cache.get_many(keys)
+        levels = {}
+        for scope, key in buckets:
+            rate, burst = _budget(scope)
+            level = _level(states.get(key), rate, burst, now)
+            levels[key] = (min(burst, level + tokens), now)
+        _store(levels, buckets)
+
+
+@contextlib.contextmanager
+def charge(tokens=1, client=True, upstream=True):
+    """
+    Takes ``tokens`` for the lookup made in the block, like take, and gives them
+    back if the block raises ThrottledError or CircuitOpenError, rejected by
+    another budget or by the breaker.
+    """
+    take(tokens, client, upstream)
+    try:
+        yield
+    except (ThrottledError, CircuitOpenError):
+        give_back(tokens, client, upstream)
+        raise
+
+
+def _buckets(client, upstream):
+    buckets = []
+    if client:
+        buckets += [
+            (scope, f"book-info-budget:{scope}:{ident}")
+            for scope, ident in _client.get()
+        ]
+    if upstream:
+        buckets.append(("upstream", "book-info-budget:upstream"))
+    return buckets
+
+
+def _take(buckets, tokens, at_least):
+    if not buckets:
+        return tokens, None
+    keys = [key for _, key in buckets]
+    with _locked(keys):
+        now = time.time()
+        states = cache.get_many(keys)
+        levels = {}
+        taken = tokens
+        short = None
+        for scope, key in buckets:
+            rate, burst = _budget(scope)
+            levels[key] = _level(states.get(key), rate, burst, now)
+            if levels[key] < taken:
+                taken = math.floor(levels[key])
+                short = scope, key
+        error = None
+        if short is not None:
+            scope, key = short
+            rate, burst = _budget(scope)
+            # Until the bucket has the tokens of the books left, or is full.
+            wanted = min(tokens - taken, burst)
+            left = levels[key] - taken
+            error = ThrottledError(scope, max(1, math.ceil((wanted - left) / rate)))
+            metrics.count_throttled(scope)
+        if taken < at_least:
+            raise error
+        _store({key: (level - taken, now) for key, level in levels.items()}, buckets)
+        return taken, error
+
+
+def _level(state, rate, burst, now):
+    # Buckets start full, and refill from their last update.
+    level, updated_at = state or (burst, now)
+    return min(burst, level + (now - updated_at) * rate)
+
+
+def _store(levels, buckets):
+    # Untouched buckets expire once they'd be full again anyway.
+    cache.set_many(levels, max(_refill_time(scope) for scope, _ in buckets) + 1)
+
+
+def _budget(scope):
+    name = scope.upper()
+    return (
+        getattr(settings, f"BOOK_INFO_{name}_RATE"),
+        getattr(settings, f"BOOK_INFO_{name}_BURST"),
+    )
+
+
+def _refill_time(scope):
+    rate, burst = _budget(scope)
+    return math.ceil(burst / rate)
+
+
+@contextlib.contextmanager
+def _locked(keys):
+    """
+    Holds locks on ``keys`` in the Django cache, so concurrent lookups update
+    their buckets in turn. Locks are taken in order, and expire after a second
+    in case their holder died.
+    """
+    locks = [f"{key}:lock" for key in sorted(keys)]
+    held = []
+    try:
+        for lock in locks:
+            while not cache.add(lock, True, 1):
+                time.sleep(0.001)
+            held.append(lock)
+        yield
+    finally:
+        cache.delete_many(held)
@@ -0,0 +1,129 @@
+from collections import Counter
+from datetime import UTC, datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Review, ReviewCount
+
+CACHE_KEY = "trending-books"
+
+
+def bucket_start(moment):
+    """Returns the start of the bucket of TRENDING_BUCKET ``moment`` falls in."""
+    width = settings.TRENDING_BUCKET.total_seconds()
+    start = moment.timestamp() // width * width
+    return datetime.fromtimestamp(start, tz=UTC)
+
+
+def window_start(now=None):
+    """
+    Returns the start of the window of trending books, the oldest bucket of the
+    last TRENDING_WINDOW, the current one included.
+    """
+    buckets = -(-settings.TRENDING_WINDOW // settings.TRENDING_BUCKET)
+    current = bucket_start(now or timezone.now())
+    return current - (buckets - 1) * settings.TRENDING_BUCKET
+
+
+def count_reviews(book, reviews):
+    """
+    Adds newly created ``reviews`` of ``book`` to its buckets, with a single
+    upsert that adds to the counts in place.
+    """
+    since = window_start()
+    added = Counter(
+        bucket
+        for bucket in map(bucket_start, (review.created_at for review in reviews))
+        if bucket >= since
+    )
+    if not added:
+        return
+    table = ReviewCount._meta.db_table
+    rows = ", ".join(["(%s, %s, %s)"] * len(added))
+    params = [
+        value for bucket, count in added.items() for value in (book.pk, bucket, count)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (book_id, bucket, count) VALUES {rows}
+            ON CONFLICT (book_id, bucket)
+            DO UPDATE SET count = {table}.count + EXCLUDED.count
+            """,
+            params,
+        )
+
+
+def recount_reviews(book_ids):
+    """
+    Rebuilds the buckets of the books with ``book_ids`` from their reviews in
+    the window. Called by recompute_book_stats, with the stats of the books
+    locked.
+    """
+    counts = Counter(
+        (book_id, bucket_start(created_at))
+        for book_id, created_at in Review.objects.filter(
+            book_id__in=book_ids, created_at__gte=window_start()
+        )
+        .values_list("book_id", "created_at")
+        .iterator()
+    )
+    ReviewCount.objects.filter(book_id__in=book_ids).delete()
+    ReviewCount.objects.bulk_create(
+        ReviewCount(book_id=book_id, bucket=bucket, count=count)
+        for (book_id, bucket), count in counts.items()
+    )
+
+
+def get_trending_books():
+    """
+    Returns the TRENDING_SIZE books most reviewed in the window, as computed by
+    ``compute_trending_books``, from the cache when it has them.
+    """
+    trending = cache.get(CACHE_KEY)
+    if trending is None:
+        trending = compute_trending_books()
+        cache.set(CACHE_KEY, trending, settings.TRENDING_CACHE_TTL)
+    return trending
+
+
+def compute_trending_books(now=None):
+    """
+    Adds up the buckets in the window, and returns the start of the window and
+    its TRENDING_SIZE most reviewed books, most reviewed first and by ISBN among
+    ties, as {"since": ..., "results": [{"isbn", "title", "review_count"}]}.
+    """
+    since = window_start(now)
+    results = (
+        ReviewCount.objects.filter(bucket__gte=since)
+        .values("book_id")
+        .annotate(review_count=Sum("count"))
+        .values("book__isbn", "book__title", "review_count")
+        .order_by("-review_count", "book__isbn")[: settings.TRENDING_SIZE]
+    )
+    return {
+        "since": since,
+        "results": [
+            {
+                "isbn": row["book__isbn"],
+                "title": row["book__title"],
+                "review_count": row["review_count"],
+            }
+            for row in results
+        ],
+    }
+
+
+def compact_review_counts():
+    """
+    Drops the buckets that left the window, and caches the trending books
+    afresh. Returns the number of buckets dropped.
+    """
+    now = timezone.now()
+    dropped, _ = ReviewCount.objects.filter(bucket__lt=window_start(now)).delete()
+    cache.set(CACHE_KEY, compute_trending_books(now), settings.TRENDING_CACHE_TTL)
+    return dropped
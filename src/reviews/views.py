@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, serializers
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiParameter,
@@ -8,17 +9,72 @@ from drf_spectacular.utils import (
 )
 
 from drf_spectacular.types import OpenApiTypes
-from .models import Review
+from drf_spectacular.views import SpectacularAPIView
+import hashlib
+import json
+import threading
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.shortcuts import get_object_or_404
+from .models import Book, BookStats, Review
 from .serializers import (
+    BookInformationBatchSerializer,
+    BookInformationResultSerializer,
+    BookSerializer,
     BookInformationSerializer,
+    BookStatsBatchSerializer,
+    BookStatsSerializer,
     UserSerializer,
+    ReviewBulkItemSerializer,
+    ReviewExportQuerySerializer,
+    ReviewListSerializer,
+    ReviewSearchQuerySerializer,
+    ReviewSearchResultSerializer,
     ReviewSerializer,
+    TrendingBooksSerializer,
 )
-from .paginators import StandardResultsSetPagination
-from .services import get_book_info
+from .bulk import create_reviews
+from .export import (
+    aiter_blocks,
+    csv_lines,
+    encode,
+    export_queryset,
+    iter_reviews,
+    ndjson_lines,
+)
+from .parsers import NDJSONParser
+from .paginators import (
+    RankCursorPagination,
+    ReviewCursorPagination,
+    StandardResultsSetPagination,
+)
+from . import metrics
+from .async_views import AsyncViewMixin
+from .authentication import ClaimsJWTAuthentication
+from .breaker import CircuitOpenError
+from .isbn import InvalidISBN, normalize_isbn
+from .search import search_reviews
+from .stats import get_book_version
+from .throttling import ThrottledError, charged_to
+from .trending import get_trending_books
+from .services import LambdaError, aget_book_info, aget_books_info
 from rest_framework import status
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from botocore.exceptions import ClientError
+
+
+class ISBNKwargMixin:
+    """Normalizes the ISBN in the URL, and rejects invalid ones with a 400."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        try:
+            self.kwargs["isbn"] = normalize_isbn(self.kwargs["isbn"])
+        except InvalidISBN as e:
+            raise serializers.ValidationError({"isbn": [str(e)]}) from e
 
 
 class RegisterView(generics.CreateAPIView):
@@ -39,15 +95,165 @@ class AddReviewView(generics.CreateAPIView):
         return super().post(request, *args, **kwargs)
 
 
-class GetBookReviewsView(generics.ListAPIView):
-    serializer_class = ReviewSerializer
+class AddReviewsBulkView(generics.GenericAPIView):
+    serializer_class = ReviewBulkItemSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    parser_classes = [JSONParser, NDJSONParser]
+
+    @extend_schema(
+        description=(
+            "Adds several reviews at once. The body is a JSON array of reviews, or"
+            " an application/x-ndjson stream with a review per line. Valid reviews"
+            " are created even when others fail, and the failures are reported by"
+            " their position in the body."
+        ),
+        request=ReviewBulkItemSerializer(many=True),
+        responses={
+            201: inline_serializer(
+                name="ReviewBulkResponse",
+                fields={
+                    "created": serializers.IntegerField(),
+                    "errors": serializers.ListField(child=serializers.DictField()),
+                },
+            ),
+            200: OpenApiResponse(description="Some of the reviews were created"),
+            400: OpenApiResponse(description="None of the reviews were created"),
+        },
+    )
+    def post(self, request, *args, **kwargs):
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {"error": "Expected a non-empty list of reviews"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(rows) > settings.REVIEW_BULK_MAX_SIZE:
+            return Response(
+                {
+                    "error": f"Ensure this list has no more than "
+                    f"{settings.REVIEW_BULK_MAX_SIZE} reviews"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        created, errors = create_reviews(request.user, rows)
+        if not errors:
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_200_OK
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({"created": created, "errors": errors}, status=response_status)
+
+
+class ExportReviewsView(generics.GenericAPIView):
+    serializer_class = ReviewExportQuerySerializer
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    content_types = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+    @extend_schema(
+        description=(
+            "Streams reviews of a book, of a user, or created since a time, oldest"
+            " first, as NDJSON or CSV. The response is gzipped when the client"
+            " accepts it. An interrupted export is resumed by passing the"
+            " created_at and id of the last review received as `after`."
+        ),
+        parameters=[ReviewExportQuerySerializer],
+        responses={
+            (200, "application/x-ndjson"): OpenApiTypes.STR,
+            (200, "text/csv"): OpenApiTypes.STR,
+            400: OpenApiResponse(description="Invalid export parameters"),
+        },
+    )
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        rows = export_queryset(
+            isbn=params.get("isbn"),
+            username=params.get("user"),
+            since=params.get("since"),
+            after=params.get("after"),
+        )
+        output = params["output"]
+        lines = (csv_lines if output == "csv" else ndjson_lines)(iter_reviews(rows))
+        compress = "gzip" in request.headers.get("Accept-Encoding", "")
+
+        blocks = encode(lines, compress=compress)
+        if isinstance(request._request, ASGIRequest):
+            # Django would otherwise read the whole export before sending it.
+            blocks = aiter_blocks(blocks)
+
+        response = StreamingHttpResponse(
+            blocks, content_type=self.content_types[output]
+        )
+        response["Content-Disposition"] = f'attachment; filename="reviews.{output}"'
+        response["Vary"] = "Accept-Encoding"
+        if compress:
+            response["Content-Encoding"] = "gzip"
+        return response
+
+
+class SearchReviewsView(generics.ListAPIView):
+    serializer_class = ReviewSearchResultSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = RankCursorPagination
+
+    @extend_schema(
+        description="Searches review titles and comments, best matches first.",
+        parameters=[ReviewSearchQuerySerializer],
+        responses=inline_serializer(
+            name="ReviewSearchResult",
+            fields={
+                "id": serializers.IntegerField(),
+                "user": serializers.CharField(),
+                "book": BookSerializer(),
+                "title": serializers.CharField(),
+                "comment": serializers.CharField(),
+                "created_at": serializers.DateTimeField(),
+                "rank": serializers.FloatField(
+                    help_text="How well the review matches, higher is better"
+                ),
+            },
+            many=True,
+        ),
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        params = ReviewSearchQuerySerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+
+        reviews = search_reviews(
+            params.validated_data["q"], isbn=params.validated_data.get("isbn")
+        )
+        return reviews.values(*ReviewSearchResultSerializer.values_fields)
+
+
+class GetBookReviewsView(ISBNKwargMixin, generics.ListAPIView):
+    serializer_class = ReviewListSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ReviewCursorPagination
 
     @extend_schema(
         parameters=[
             OpenApiParameter(
-                name="page", description="Page number", required=False, type=int
+                name="cursor",
+                description="Cursor of the page, from the next or previous links",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="page",
+                description="Page number, to paginate by page instead of by cursor",
+                required=False,
+                type=int,
             ),
             OpenApiParameter(
                 name="page_size",
@@ -60,54 +266,184 @@ class GetBookReviewsView(generics.ListAPIView):
             200: inline_serializer(
                 name="PaginatedReviewResponse",
                 fields={
-                    "count": OpenApiTypes.INT,
+                    "count": serializers.IntegerField(
+                        required=False, help_text="Only when paginating by page"
+                    ),
                     "next": OpenApiTypes.URI,
                     "previous": OpenApiTypes.URI,
                     "results": ReviewSerializer(many=True),
                 },
-            )
+            ),
+            304: OpenApiResponse(
+                description="The reviews didn't change since the ETag or"
+                " Last-Modified of the client's copy"
+            ),
+            400: OpenApiResponse(description="Invalid ISBN"),
         },
     )
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        # Responses are versioned by the reviews of the book, so polling clients
+        # revalidating with If-None-Match get a 304 without the reviews being
+        # queried, and rendered pages are cached until a review changes.
+        version, changed_at = get_book_version(self.kwargs["isbn"])
+        variant = hashlib.md5(
+            f"{request.get_host()}{request.get_full_path()}".encode(),
+            usedforsecurity=False,
+        ).hexdigest()
+        etag = f'"{version}-{variant}"'
+        # HTTP dates have a resolution of seconds.
+        last_modified = int(changed_at.timestamp()) if changed_at else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            key = f"reviews-page:{self.kwargs['isbn']}:{version}:{variant}"
+            data = cache.get(key)
+            metrics.count_cache("reviews_page", "misses" if data is None else "hits")
+            if data is None:
+                response = super().get(request, *args, **kwargs)
+                cache.set(key, response.data, settings.REVIEW_PAGE_CACHE_TTL)
+            else:
+                response = Response(data)
+
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        # Clients may keep the response, but must revalidate it before reuse.
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    @property
+    def paginator(self):
+        # Clients that still ask for a page number get page number pagination.
+        if not hasattr(self, "_paginator"):
+            if "page" in self.request.query_params:
+                self._paginator = StandardResultsSetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
+        # One joined query fetching only the rendered columns.
         isbn = self.kwargs["isbn"]
-        return Review.objects.filter(book__isbn=isbn)
+        return (
+            Review.objects.filter(book__isbn=isbn)
+            .order_by("created_at", "id")
+            .values(*ReviewListSerializer.values_fields)
+        )
 
 
-class GetBookInformationView(generics.RetrieveAPIView):
+class GetBookInformationView(AsyncViewMixin, generics.GenericAPIView):
     serializer_class = BookInformationSerializer
 
     @extend_schema(
         parameters=[
             OpenApiParameter(
-                name="isbn", description="ISBN of the book", required=True, type=str
+                name="isbn",
+                description="ISBN-10 or ISBN-13 of the book",
+                required=True,
+                type=str,
             ),
         ],
         responses={
             200: BookInformationSerializer,
-            400: OpenApiResponse(description="ISBN is required"),
+            400: OpenApiResponse(description="ISBN is missing or invalid"),
             404: OpenApiResponse(description="Book not found"),
+            429: OpenApiResponse(description="Too many lookups sent to Open Library"),
             500: OpenApiResponse(description="Internal server error"),
+            503: OpenApiResponse(description="Open Library is unavailable"),
+            504: OpenApiResponse(description="Open Library took too long"),
         },
     )
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
         isbn = request.query_params.get("isbn")
         if not isbn:
             return Response(
                 {"error": "ISBN is required"}, status=status.HTTP_400_BAD_REQUEST
             )
+        try:
+            isbn = normalize_isbn(isbn)
+        except InvalidISBN as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            payload = get_book_info(isbn)
+            with charged_to(request):
+                payload = await aget_book_info(isbn)
 
             if "statusCode" in payload and payload["statusCode"] != 200:
                 return Response(payload["body"], status=payload["statusCode"])
 
             return Response(payload["body"], status=status.HTTP_200_OK)
 
-        except ClientError as e:
+        except CircuitOpenError as e:
+            return _unavailable(e)
+        except ThrottledError as e:
+            return _throttled(e)
+        except TimeoutError:
+            return _timed_out()
+        except LambdaError as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        except Exception:
+            return Response(
+                {"error": "Internal Server Error"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+def _unavailable(error):
+    return Response(
+        {"error": str(error)},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+def _throttled(error):
+    return Response(
+        {"error": str(error)},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+def _timed_out():
+    return Response(
+        {"error": "Timed out waiting for Open Library"},
+        status=status.HTTP_504_GATEWAY_TIMEOUT,
+    )
+
+
+class GetBooksInformationView(AsyncViewMixin, generics.GenericAPIView):
+    serializer_class = BookInformationBatchSerializer
+
+    @extend_schema(
+        request=BookInformationBatchSerializer,
+        responses={
+            200: inline_serializer(
+                name="BookInformationBatchResponse",
+                fields={"results": BookInformationResultSerializer(many=True)},
+            ),
+            400: OpenApiResponse(description="Invalid list of ISBNs"),
+            429: OpenApiResponse(description="Too many lookups sent to Open Library"),
+            500: OpenApiResponse(description="Internal server error"),
+            504: OpenApiResponse(description="Open Library took too long"),
+        },
+    )
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            with charged_to(request):
+                payloads = await aget_books_info(serializer.validated_data["isbns"])
+        except ThrottledError as e:
+            return _throttled(e)
+        except TimeoutError:
+            return _timed_out()
+        except LambdaError as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
@@ -116,3 +452,111 @@ class GetBookInformationView(generics.RetrieveAPIView):
                 {"error": "Internal Server Error"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+
+        results = [
+            {"isbn": isbn, "status": payload["statusCode"], "body": payload["body"]}
+            for isbn, payload in payloads.items()
+        ]
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+def _book_stats(book):
+    # Books that were never reviewed have no stats row yet.
+    try:
+        return book.stats
+    except BookStats.DoesNotExist:
+        return BookStats(book=book)
+
+
+class GetBookStatsView(ISBNKwargMixin, generics.RetrieveAPIView):
+    serializer_class = BookStatsSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(
+        responses={
+            200: BookStatsSerializer,
+            400: OpenApiResponse(description="Invalid ISBN"),
+            404: OpenApiResponse(description="Book not found"),
+        },
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_object(self):
+        book = get_object_or_404(
+            Book.objects.select_related("stats"), isbn=self.kwargs["isbn"]
+        )
+        return _book_stats(book)
+
+
+class GetBooksStatsView(generics.GenericAPIView):
+    serializer_class = BookStatsBatchSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(
+        request=BookStatsBatchSerializer,
+        responses={
+            200: inline_serializer(
+                name="BookStatsBatchResponse",
+                fields={"results": BookStatsSerializer(many=True)},
+            ),
+            400: OpenApiResponse(description="Invalid list of ISBNs"),
+        },
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # ISBNs of books that aren't in the database are left out.
+        isbns = serializer.validated_data["isbns"]
+        books = Book.objects.filter(isbn__in=isbns).select_related("stats")
+        books = {book.isbn: book for book in books}
+        stats = [
+            _book_stats(books[isbn]) for isbn in dict.fromkeys(isbns) if isbn in books
+        ]
+        return Response(
+            {"results": BookStatsSerializer(stats, many=True).data},
+            status=status.HTTP_200_OK,
+        )
+
+
+class GetTrendingBooksView(generics.GenericAPIView):
+    serializer_class = TrendingBooksSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(responses={200: TrendingBooksSerializer})
+    def get(self, request, *args, **kwargs):
+        # The books most reviewed since the start of the window, TRENDING_WINDOW
+        # ago give or take a bucket.
+        serializer = self.get_serializer(get_trending_books())
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class SchemaView(SpectacularAPIView):
+    # drf-spectacular loads its extensions on first use, in a way that isn't
+    # thread-safe. Under ASGI, requests run in threads of their own, so
+    # concurrent first schema requests of a worker failed. One at a time, they
+    # don't.
+    _lock = threading.Lock()
+    # The schema in API_SCHEMA_FILE, loaded on first use.
+    _precomputed = None
+
+    def _get_schema_response(self, request):
+        if settings.API_SCHEMA_FILE:
+            filename = self._get_filename(request, version=None)
+            return Response(
+                data=self._load_precomputed(settings.API_SCHEMA_FILE),
+                headers={"Content-Disposition": f'inline; filename="{filename}"'},
+            )
+        with self._lock:
+            return super()._get_schema_response(request)
+
+    @classmethod
+    def _load_precomputed(cls, path):
+        if cls._precomputed is None or cls._precomputed[0] != path:
+            with open(path, "rb") as f:
+                cls._precomputed = (path, json.load(f))
+        return cls._precomputed[1]